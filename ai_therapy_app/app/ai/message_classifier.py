@@ -0,0 +1,134 @@
+"""
+Local message classifier
+Predicts emotion and intent of user messages and the technique of AI messages with scikit-learn
+"""
+
+import csv
+import importlib.util
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# scikit-learn is imported when a model is trained or loaded; only check that it is installed here
+SKLEARN_AVAILABLE = importlib.util.find_spec("sklearn") is not None
+if not SKLEARN_AVAILABLE:
+    logger.error("scikit-learn is not installed. Messages will not be classified.")
+
+MESSAGE_CLASSIFIER_PATH = os.getenv("MESSAGE_CLASSIFIER_PATH", "models/message_classifier.joblib")
+# Predictions less likely than this leave the column empty
+CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("CLASSIFIER_MIN_CONFIDENCE", 0.5))
+CLASSIFIER_FEATURES = 2 ** 18
+
+# Columns predicted for each side of the conversation
+USER_LABELS = ("emotion", "intent")
+AI_LABELS = ("therapy_technique",)
+
+
+def _vectorizer(n_features: int):
+    from sklearn.feature_extraction.text import HashingVectorizer
+    # Hashed features need no fitted vocabulary, so memory stays fixed however much text is seen
+    return HashingVectorizer(n_features=n_features, ngram_range=(1, 2), alternate_sign=False, norm="l2")
+
+
+class MessageClassifier:
+    """
+    One linear model per column, over hashed word and bigram features.
+
+    A batch of messages is vectorized once into a sparse matrix, and each model
+    predicts for all of its rows in a single call.
+    """
+
+    def __init__(self, heads: Dict[str, Any], n_features: int = CLASSIFIER_FEATURES,
+                 min_confidence: float = CLASSIFIER_MIN_CONFIDENCE):
+        self.heads = heads
+        self.n_features = n_features
+        self.min_confidence = min_confidence
+        self.vectorizer = _vectorizer(n_features)
+
+    def predict(self, texts: Sequence[str], is_from_ai: Sequence[bool]) -> List[Dict[str, Optional[str]]]:
+        """Predict the columns of each message; unsure predictions are None"""
+        features = self.vectorizer.transform(texts)
+        labels: List[Dict[str, Optional[str]]] = [{} for _ in texts]
+        for label, head in self.heads.items():
+            rows = [i for i, from_ai in enumerate(is_from_ai) if (label in AI_LABELS) == bool(from_ai)]
+            if not rows:
+                continue
+            probabilities = head.predict_proba(features[rows])
+            for row, scores in zip(rows, probabilities):
+                best = scores.argmax()
+                labels[row][label] = str(head.classes_[best]) if scores[best] >= self.min_confidence else None
+        return labels
+
+    @classmethod
+    def train(cls, examples: Iterable[Dict[str, Any]], n_features: int = CLASSIFIER_FEATURES) -> "MessageClassifier":
+        """
+        Train from dicts with "text", "is_from_ai" and any labelled columns.
+        A column is trained on the examples from its side of the conversation that have it.
+        """
+        from sklearn.linear_model import SGDClassifier
+
+        examples = list(examples)
+        vectorizer = _vectorizer(n_features)
+        heads = {}
+        for label in USER_LABELS + AI_LABELS:
+            labelled = [e for e in examples if e.get(label) and (label in AI_LABELS) == bool(e.get("is_from_ai"))]
+            if len({e[label] for e in labelled}) < 2:
+                logger.warning(f"Not enough labelled examples to train '{label}'")
+                continue
+            head = SGDClassifier(loss="log_loss", class_weight="balanced", random_state=0)
+            head.fit(vectorizer.transform([e["text"] for e in labelled]), [e[label] for e in labelled])
+            heads[label] = head
+            logger.info(f"Trained '{label}' on {len(labelled)} messages")
+        return cls(heads, n_features)
+
+    def save(self, path: str = MESSAGE_CLASSIFIER_PATH) -> None:
+        """Write the trained models"""
+        import joblib
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        joblib.dump({"heads": self.heads, "n_features": self.n_features}, path)
+
+    @classmethod
+    def load(cls, path: str = MESSAGE_CLASSIFIER_PATH) -> Optional["MessageClassifier"]:
+        """Load trained models, or None if there are none or scikit-learn is missing"""
+        if not SKLEARN_AVAILABLE or not os.path.exists(path):
+            return None
+        import joblib
+        data = joblib.load(path)
+        logger.info(f"Loaded message classifier from {path} with columns {sorted(data['heads'])}")
+        return cls(data["heads"], data["n_features"])
+
+
+def read_examples(path: str) -> List[Dict[str, Any]]:
+    """Read labelled messages from a CSV with text, is_from_ai and label columns"""
+    with open(path, newline="", encoding="utf-8") as f:
+        return [
+            {**row, "is_from_ai": row.get("is_from_ai", "").strip().lower() in ("1", "true", "yes")}
+            for row in csv.DictReader(f)
+        ]
+
+
+def benchmark(
+    predict: Callable[[Sequence[str], Sequence[bool]], Any],
+    texts: Sequence[str],
+    is_from_ai: Sequence[bool],
+    batch_sizes: Iterable[int] = (1, 8, 32, 128)
+) -> List[Dict[str, float]]:
+    """Measure messages per second and time per batch at each batch size"""
+    results = []
+    for batch_size in batch_sizes:
+        started = time.perf_counter()
+        batches = 0
+        for offset in range(0, len(texts), batch_size):
+            predict(texts[offset:offset + batch_size], is_from_ai[offset:offset + batch_size])
+            batches += 1
+        elapsed = time.perf_counter() - started
+        results.append({
+            "batch_size": batch_size,
+            "messages_per_second": len(texts) / elapsed if elapsed else float("inf"),
+            "ms_per_batch": elapsed * 1000 / batches if batches else 0.0
+        })
+    return results
@@ -0,0 +1,135 @@
+"""
+Incremental mood statistics
+Keeps mood trend, stability and average over the most recent scores up to date in constant time per score
+"""
+
+import os
+from typing import Any, Dict, List, Tuple
+
+# Window sizes, in mood entries, tracked for every profile
+MOOD_TREND_WINDOWS = tuple(int(size) for size in os.getenv("MOOD_TREND_WINDOWS", "7,30,90").split(","))
+# Window used for the personalization context
+MOOD_TREND_WINDOW = int(os.getenv("MOOD_TREND_WINDOW", 7))
+
+
+class MoodWindow:
+    """
+    Running statistics over the last `size` scores.
+
+    Scores live in a ring buffer. The variance is kept with Welford's method, extended
+    to remove the score that slides out of the window. Sums of the whole window and of
+    its older half are kept too, so the trend compares half averages without
+    rescanning the scores.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._scores = [0.0] * size
+        self._start = 0
+        self._count = 0
+        self._sum = 0.0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._first_count = 0
+        self._first_sum = 0.0
+
+    def _at(self, index: int) -> float:
+        return self._scores[(self._start + index) % self.size]
+
+    def _rebalance(self) -> None:
+        """Move scores across the half boundary after the window changed size"""
+        target = self._count // 2
+        while self._first_count < target:
+            self._first_sum += self._at(self._first_count)
+            self._first_count += 1
+        while self._first_count > target:
+            self._first_count -= 1
+            self._first_sum -= self._at(self._first_count)
+
+    def add(self, score: float) -> None:
+        """Add the newest score, dropping the oldest if the window is full"""
+        if self._count == self.size:
+            oldest = self._scores[self._start]
+            self._start = (self._start + 1) % self.size
+            self._count -= 1
+            self._sum -= oldest
+            if self._first_count:
+                self._first_count -= 1
+                self._first_sum -= oldest
+            if self._count:
+                delta = oldest - self._mean
+                self._mean -= delta / self._count
+                self._m2 -= delta * (oldest - self._mean)
+            else:
+                self._mean = self._m2 = 0.0
+
+        self._scores[(self._start + self._count) % self.size] = score
+        self._count += 1
+        self._sum += score
+        delta = score - self._mean
+        self._mean += delta / self._count
+        self._m2 += delta * (score - self._mean)
+        self._rebalance()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def scores(self) -> List[float]:
+        """Scores in the window, oldest first"""
+        return [self._at(index) for index in range(self._count)]
+
+    def summary(self) -> Dict[str, Any]:
+        """Trend, stability and average of the scores in the window"""
+        if self._count < 2:
+            return {"trend": "unknown", "stability": "unknown"}
+
+        first_avg = self._first_sum / self._first_count
+        second_avg = (self._sum - self._first_sum) / (self._count - self._first_count)
+        if second_avg > first_avg + 1:
+            trend = "improving"
+        elif second_avg < first_avg - 1:
+            trend = "declining"
+        else:
+            trend = "stable"
+
+        # Population standard deviation; rounding can leave m2 just below zero
+        std_dev = (max(self._m2, 0.0) / self._count) ** 0.5
+        if std_dev < 1:
+            stability = "very stable"
+        elif std_dev < 2:
+            stability = "stable"
+        elif std_dev < 3:
+            stability = "somewhat unstable"
+        else:
+            stability = "unstable"
+
+        return {
+            "trend": trend,
+            "stability": stability,
+            "average_score": round(self._sum / self._count, 1),
+            "recent_scores": self.scores()
+        }
+
+
+class MoodStats:
+    """Mood statistics over several window sizes"""
+
+    def __init__(self, windows: Tuple[int, ...] = MOOD_TREND_WINDOWS):
+        self.windows = {size: MoodWindow(size) for size in windows}
+
+    @classmethod
+    def from_series(cls, series: Any, windows: Tuple[int, ...] = MOOD_TREND_WINDOWS) -> "MoodStats":
+        """Build statistics from a MoodSeries, whose scores are kept in time order"""
+        stats = cls(windows)
+        for score in series.scores[-max(windows):]:
+            stats.add(score)
+        return stats
+
+    def add(self, score: float) -> None:
+        """Add the newest mood score"""
+        for window in self.windows.values():
+            window.add(score)
+
+    def summary(self, window: int = MOOD_TREND_WINDOW) -> Dict[str, Any]:
+        """Trend, stability and average over one of the tracked windows"""
+        return self.windows[window].summary()
@@ -3,17 +3,77 @@ AI Personalization Module for Mental Health AI Therapy
 Handles personalization of AI responses based on user data and session history
 """
 
-import json
 import logging
 import os
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 import hashlib
+import threading
+from itertools import count
+
+from app.ai.profile_codec import dump_section, is_current_record, load_section
+from app.ai.profile_store import LEGACY_PROFILE_DIR, META_FIELDS, PROFILE_SECTIONS, ProfileConflict, ProfileStore, profile_store
+from app.ai.profile_writer import profile_writer
+from app.ai.profile_events import profile_events
+from app.ai.profile_cache import ProfileCache
+from app.ai.mood_stats import MoodStats
+from app.ai.timeseries import MoodSeries, SessionHistoryIndex
+from app.ai.topic_extraction import topic_extractor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Context versions are unique across profile objects in this process, so a reloaded
+# profile never matches context cached for an earlier copy
+_profile_versions = count(1)
+
+# Attempts at a permissions change before giving up on concurrent writers
+PERMISSION_UPDATE_ATTEMPTS = 3
+
+# Sections held as compact series and stored in their binary form
+SERIES_SECTIONS = {"mood_patterns": MoodSeries, "session_history": SessionHistoryIndex}
+
+
+def _section_object(section: str, value: Any) -> Any:
+    """Turn a decoded section into the value the profile holds"""
+    if section in SERIES_SECTIONS:
+        series = SERIES_SECTIONS[section]
+        # Profiles migrated from JSON files hold lists of entries
+        return series.from_bytes(value) if isinstance(value, bytes) else series.from_entries(value)
+    return value
+
+
+def _merge_section(section: str, base: Any, ours: Any, theirs: Any) -> Any:
+    """
+    Three-way merge of one section: the stored value `theirs` plus the changes this
+    copy made from `base` to `ours`. Dict keys and list items are merged one by one,
+    series entries are combined in time order, and anything else is replaced.
+    """
+    if section in SERIES_SECTIONS:
+        base_entries = list(base) if base is not None else []
+        theirs_entries = list(theirs)
+        added = [e for e in ours if e not in base_entries and e not in theirs_entries]
+        merged = SERIES_SECTIONS[section]()
+        for entry in sorted(theirs_entries + added, key=lambda e: e["timestamp"]):
+            merged.append(**entry)
+        return merged
+    if isinstance(ours, dict) and isinstance(theirs, dict):
+        base = base if isinstance(base, dict) else {}
+        merged = dict(theirs)
+        for key, value in ours.items():
+            if key not in base or base[key] != value:
+                merged[key] = value
+        for key in base:
+            if key not in ours:
+                merged.pop(key, None)
+        return merged
+    if isinstance(ours, list) and isinstance(theirs, list):
+        base = base if isinstance(base, list) else []
+        merged = [item for item in theirs if item in ours or item not in base]
+        return merged + [item for item in ours if item not in base and item not in merged]
+    return ours
+
 class UserProfile:
     """User profile for AI personalization"""
     
@@ -30,7 +90,7 @@ class UserProfile:
         self.communication_style = {}
         
         # Learned patterns
-        self.mood_patterns = []
+        self.mood_patterns = MoodSeries()
         self.topic_interests = {}
         self.trigger_topics = []
         self.language_patterns = {}
@@ -43,7 +103,7 @@ class UserProfile:
         self.medication_info = {}
         
         # Session data
-        self.session_history = []
+        self.session_history = SessionHistoryIndex()
         self.daily_check_ins = []
         
         # Permissions
@@ -54,95 +114,151 @@ class UserProfile:
             "therapist_oversight": False
         }
         
+        # Bumped by every change that affects the personalization context
+        self.version = next(_profile_versions)
+        # Version of the stored profile this copy reflects, shared by all workers
+        self.store_version = 0
+        self._stale = False
+        self._cached_context = None
+        self._mood_stats = None
+        
+        # Sections this object holds, and their encoded form as last stored
+        self._loaded_sections = set(PROFILE_SECTIONS) | {"meta"}
+        self._snapshot = {}
+        self._in_store = False
+        # Stored sections not decoded yet, see __getattr__
+        self._raw = {}
+        self._raw_lock = threading.Lock()
+        # Held by mutators and by save(), so a section is never encoded while it changes
+        # and two saves of this copy never race on the same store version
+        self._lock = threading.RLock()
+        
         logger.info(f"User profile initialized for ID: {self.secure_id}")
     
+    def _touch(self) -> None:
+        """Record a change to the profile"""
+        self.updated_at = datetime.now()
+        self.version = next(_profile_versions)
+    
     def update_demographic_data(self, data: Dict[str, Any]) -> None:
         """Update demographic information"""
-        self.demographic_data.update(data)
-        self.updated_at = datetime.now()
+        with self._lock:
+            self.demographic_data.update(data)
+            self._touch()
         logger.info(f"Demographic data updated for user: {self.secure_id}")
     
     def update_preferences(self, preferences: Dict[str, Any]) -> None:
         """Update user preferences"""
-        self.preferences.update(preferences)
-        self.updated_at = datetime.now()
+        with self._lock:
+            self.preferences.update(preferences)
+            self._touch()
         logger.info(f"Preferences updated for user: {self.secure_id}")
     
     def add_therapy_goal(self, goal: str, priority: int = 1) -> None:
         """Add a therapy goal"""
-        self.therapy_goals.append({
-            "goal": goal,
-            "priority": priority,
-            "created_at": datetime.now(),
-            "status": "active"
-        })
-        self.updated_at = datetime.now()
+        with self._lock:
+            self.therapy_goals.append({
+                "goal": goal,
+                "priority": priority,
+                "created_at": datetime.now(),
+                "status": "active"
+            })
+            self._touch()
         logger.info(f"Therapy goal added for user: {self.secure_id}")
     
     def update_communication_style(self, style_data: Dict[str, Any]) -> None:
         """Update communication style preferences"""
-        self.communication_style.update(style_data)
-        self.updated_at = datetime.now()
+        with self._lock:
+            self.communication_style.update(style_data)
+            self._touch()
         logger.info(f"Communication style updated for user: {self.secure_id}")
     
     def add_mood_data(self, mood_score: int, notes: Optional[str] = None) -> None:
         """Add mood tracking data"""
-        self.mood_patterns.append({
-            "timestamp": datetime.now(),
-            "score": mood_score,
-            "notes": notes
-        })
-        self.updated_at = datetime.now()
+        with self._lock:
+            self.mood_patterns.append(datetime.now(), mood_score, notes)
+            if self._mood_stats is not None:
+                self._mood_stats.add(mood_score)
+            self._touch()
         logger.info(f"Mood data added for user: {self.secure_id}")
     
     def update_topic_interest(self, topic: str, interest_level: float) -> None:
         """Update interest level for a topic"""
-        self.topic_interests[topic] = interest_level
-        self.updated_at = datetime.now()
+        with self._lock:
+            self.topic_interests[topic] = interest_level
+            self._touch()
         logger.info(f"Topic interest updated for user: {self.secure_id}")
     
+    def update_topic_interests(self, interests: Dict[str, float]) -> None:
+        """Update several topics at once, replacing the dict so readers never see it change"""
+        with self._lock:
+            self.topic_interests = {**self.topic_interests, **interests}
+            self._touch()
+        logger.info(f"Topic interests updated for user: {self.secure_id}")
+    
+    def clear_topic_interests(self) -> None:
+        """Forget all topic interests"""
+        with self._lock:
+            self.topic_interests = {}
+            self._touch()
+    
     def add_trigger_topic(self, topic: str, severity: int = 5) -> None:
         """Add a topic that triggers negative emotions"""
-        self.trigger_topics.append({
-            "topic": topic,
-            "severity": severity,
-            "added_at": datetime.now()
-        })
-        self.updated_at = datetime.now()
+        with self._lock:
+            self.trigger_topics.append({
+                "topic": topic,
+                "severity": severity,
+                "added_at": datetime.now()
+            })
+            self._touch()
         logger.info(f"Trigger topic added for user: {self.secure_id}")
     
+    def clear_trigger_topics(self) -> None:
+        """Forget all trigger topics"""
+        with self._lock:
+            self.trigger_topics = []
+            self._touch()
+    
+    def update_therapy_approaches(self, approaches: Dict[str, int]) -> None:
+        """Replace the user's therapy approach ratings"""
+        with self._lock:
+            self.therapy_approaches = dict(approaches)
+            self._touch()
+        logger.info(f"Therapy approaches updated for user: {self.secure_id}")
+    
     def add_coping_strategy(self, strategy: str, effectiveness: int = 5) -> None:
         """Add a coping strategy"""
-        self.coping_strategies.append({
-            "strategy": strategy,
-            "effectiveness": effectiveness,
-            "added_at": datetime.now()
-        })
-        self.updated_at = datetime.now()
+        with self._lock:
+            self.coping_strategies.append({
+                "strategy": strategy,
+                "effectiveness": effectiveness,
+                "added_at": datetime.now()
+            })
+            self._touch()
         logger.info(f"Coping strategy added for user: {self.secure_id}")
     
     def record_session_interaction(self, session_id: str, interaction_data: Dict[str, Any]) -> None:
-        """Record interaction from therapy session"""
-        self.session_history.append({
-            "session_id": session_id,
-            "timestamp": datetime.now(),
-            "data": interaction_data
-        })
-        self.updated_at = datetime.now()
+        """Record interaction from therapy session, referencing its messages by id"""
+        with self._lock:
+            message_ids = interaction_data.get("message_ids") or {}
+            self.session_history.append(datetime.now(), session_id, message_ids.get("user"), message_ids.get("ai"))
+            # Only the length of the session history reaches the context, so no new version
+            self.updated_at = datetime.now()
         logger.info(f"Session interaction recorded for user: {self.secure_id}")
     
     def update_data_permissions(self, permission_updates: Dict[str, Any]) -> None:
         """Update data collection and sharing permissions"""
-        if "data_collection_consent" in permission_updates:
-            self.data_collection_consent = permission_updates["data_collection_consent"]
+        with self._lock:
+            if "data_collection_consent" in permission_updates:
+                self.data_collection_consent = permission_updates["data_collection_consent"]
             
-        if "data_retention_preference" in permission_updates:
-            self.data_retention_preference = permission_updates["data_retention_preference"]
+            if "data_retention_preference" in permission_updates:
+                self.data_retention_preference = permission_updates["data_retention_preference"]
             
-        if "data_sharing_permissions" in permission_updates:
-            self.data_sharing_permissions.update(permission_updates["data_sharing_permissions"])
+            if "data_sharing_permissions" in permission_updates:
+                self.data_sharing_permissions.update(permission_updates["data_sharing_permissions"])
             
-        self.updated_at = datetime.now()
+            self._touch()
         logger.info(f"Data permissions updated for user: {self.secure_id}")
     
     def to_dict(self) -> Dict[str, Any]:
@@ -155,7 +271,7 @@ class UserProfile:
             "preferences": self.preferences,
             "therapy_goals": self.therapy_goals,
             "communication_style": self.communication_style,
-            "mood_patterns": self.mood_patterns,
+            "mood_patterns": self.mood_patterns.to_list(),
             "topic_interests": self.topic_interests,
             "trigger_topics": self.trigger_topics,
             "language_patterns": self.language_patterns,
@@ -169,63 +285,210 @@ class UserProfile:
             "data_sharing_permissions": self.data_sharing_permissions
         }
     
-    def save(self, file_path: Optional[str] = None) -> None:
-        """Save profile to file (for development purposes)"""
-        if not self.data_collection_consent:
-            logger.warning(f"Cannot save profile for user {self.secure_id}: no consent given")
-            return
+    @property
+    def mood_stats(self) -> MoodStats:
+        """Running mood statistics, built from mood_patterns on first use"""
+        if self._mood_stats is None:
+            self._mood_stats = MoodStats.from_series(self.mood_patterns)
+        return self._mood_stats
+    
+    @property
+    def stored(self) -> bool:
+        """Whether this profile has been loaded from or saved to the store"""
+        return self._in_store
+    
+    @property
+    def stale(self) -> bool:
+        """Whether another worker changed the stored profile after this copy was loaded"""
+        return self._stale
+    
+    @property
+    def stored_bytes(self) -> int:
+        """Encoded size of the profile as last loaded or saved"""
+        return sum(len(data) for data in self._snapshot.values())
+    
+    def __getattr__(self, name: str) -> Any:
+        # Only reached for attributes not set on the instance, such as sections not decoded yet
+        raw = self.__dict__.get("_raw")
+        if not raw or name not in raw:
+            raise AttributeError(name)
+        with self._raw_lock:
+            if name not in self.__dict__:
+                self._apply_section(name, load_section(raw[name]))
+                del raw[name]
+        return self.__dict__[name]
+    
+    def _section_value(self, section: str) -> Any:
+        """Get the current value of a stored section"""
+        if section == "meta":
+            return {name: getattr(self, name) for name in META_FIELDS}
+        return getattr(self, section)
+    
+    def _serialize(self, section: str) -> bytes:
+        """Encode a section the way it is stored"""
+        value = self._section_value(section)
+        return dump_section(value.to_bytes() if section in SERIES_SECTIONS else value)
+    
+    def _apply_section(self, section: str, value: Any) -> None:
+        """Set attributes from a decoded section"""
+        if section == "meta":
+            for name, field_value in value.items():
+                if name in META_FIELDS:
+                    setattr(self, name, field_value)
+        else:
+            setattr(self, section, _section_object(section, value))
+            if section == "mood_patterns":
+                self._mood_stats = None
+    
+    def _attach_sections(self, raw: Dict[str, Any]) -> None:
+        """Take stored sections; meta is decoded now and the others on first access"""
+        for section, data in raw.items():
+            if section != "meta" and section not in PROFILE_SECTIONS:
+                continue
+            if not is_current_record(data):
+                # Older formats are decoded now and left out of the snapshot,
+                # so the next save rewrites them as versioned records
+                self._apply_section(section, load_section(data))
+                continue
+            self._snapshot[section] = data
+            if section == "meta":
+                self._apply_section(section, load_section(data))
+            else:
+                # Drop the default so attribute access reaches __getattr__
+                del self.__dict__[section]
+                self._raw[section] = data
+        self._in_store = True
+    
+    def _changed_sections(self, sections) -> Dict[str, bytes]:
+        """Encode the given sections that differ from the stored snapshot"""
+        # Comparing encoded sections also catches attributes assigned directly;
+        # sections never decoded or assigned cannot have changed
+        changed = {}
+        for section in sections:
+            if section in self._raw and section not in self.__dict__:
+                continue
+            data = self._serialize(section)
+            if self._snapshot.get(section) != data:
+                changed[section] = data
+        return changed
+    
+    def save(self, store: Optional[ProfileStore] = None, permissions: bool = False) -> None:
+        """
+        Save the sections that changed since the profile was loaded or last saved.
+        
+        Consent and retention settings live in "meta", which is only written when the
+        profile is first stored or with `permissions=True`, so routine saves can never
+        undo a consent change. The write fails with ProfileConflict, and the copy is
+        marked stale, if another worker saved the profile since this copy was loaded;
+        rebase() then carries this copy's changes over to the stored profile.
+        """
+        with self._lock:
+            if not self.data_collection_consent and not (permissions and self._in_store):
+                if not self._in_store:
+                    logger.warning(f"Cannot save profile for user {self.secure_id}: no consent given")
+                return
+            if not self.data_collection_consent:
+                # No personal data is saved without consent, only the revocation itself
+                sections = self._loaded_sections & {"meta"}
+            elif permissions or not self._in_store:
+                sections = self._loaded_sections
+            else:
+                sections = self._loaded_sections - {"meta"}
             
-        if file_path is None:
-            file_path = f"user_profiles/{self.secure_id}.json"
+            changed = self._changed_sections(sections)
+            try:
+                self.store_version = (store or profile_store).write(
+                    self.secure_id, changed, expected_version=self.store_version
+                )
+            except ProfileConflict:
+                self._stale = True
+                raise
+            self._snapshot.update(changed)
+            self._in_store = True
+            version = self.store_version
+        
+        if changed:
+            # Other workers drop their cached copy and reload this one
+            profile_events.publish(self.user_id, version)
+        logger.info(f"Profile saved for user: {self.secure_id} ({len(changed)} sections changed)")
+    
+    def rebase(self, store: Optional[ProfileStore] = None) -> bool:
+        """
+        Carry this copy's unsaved changes over to the current stored profile.
+        
+        After a ProfileConflict the copy takes on the stored sections and version, with
+        its own changes merged section by section, so the next save() succeeds. Meta is
+        always taken from the store. Returns False, and changes nothing, if the stored
+        profile was deleted or consent was withdrawn, since the changes may not be kept.
+        """
+        with self._lock:
+            current = UserProfile.load(self.user_id, store=store)
+            if not current.stored or not current.data_collection_consent:
+                return False
             
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        
-        with open(file_path, 'w') as f:
-            json.dump(self.to_dict(), f, indent=2)
+            merged = {}
+            for section in self._changed_sections(self._loaded_sections - {"meta"}):
+                base_data = self._snapshot.get(section)
+                base = _section_object(section, load_section(base_data)) if base_data is not None else None
+                merged[section] = _merge_section(section, base, getattr(self, section), getattr(current, section))
+            
+            for section in PROFILE_SECTIONS:
+                if section in current._raw:
+                    self.__dict__.pop(section, None)
+                    self._raw[section] = current._raw[section]
+                else:
+                    self._raw.pop(section, None)
+                    setattr(self, section, getattr(current, section))
+            for name in META_FIELDS:
+                setattr(self, name, getattr(current, name))
+            for section, value in merged.items():
+                self._raw.pop(section, None)
+                setattr(self, section, value)
             
-        logger.info(f"Profile saved for user: {self.secure_id}")
+            self._snapshot = dict(current._snapshot)
+            self._loaded_sections = set(PROFILE_SECTIONS) | {"meta"}
+            self._in_store = True
+            self.store_version = current.store_version
+            self._mood_stats = None
+            self._stale = False
+            self._touch()
+        logger.info(f"Rebased profile for user: {self.secure_id} ({len(merged)} sections merged)")
+        return True
     
     @classmethod
-    def load(cls, user_id: str, file_path: Optional[str] = None) -> 'UserProfile':
-        """Load profile from file (for development purposes)"""
+    def load(
+        cls,
+        user_id: str,
+        sections: Optional[List[str]] = None,
+        store: Optional[ProfileStore] = None
+    ) -> 'UserProfile':
+        """
+        Load a profile from the profile store.
+        
+        Args:
+            user_id: The user's id
+            sections: Sections to load, or None for all; "meta" holds consent and timestamps
+            store: Store to read from, defaults to the shared profile store
+        
+        Sections other than "meta" are decoded when they are first used.
+        """
         secure_id = hashlib.sha256(str(user_id).encode()).hexdigest()[:16]
+        store = store or profile_store
+        
+        version, data = store.read_versioned(secure_id, sections)
+        if not data and not store.exists(secure_id) and store.import_legacy_file(secure_id):
+            version, data = store.read_versioned(secure_id, sections)
         
-        if file_path is None:
-            file_path = f"user_profiles/{secure_id}.json"
-            
-        if not os.path.exists(file_path):
-            logger.warning(f"No profile found for user {secure_id}")
-            return cls(user_id)
-            
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-            
         profile = cls(user_id)
+        profile.store_version = version
+        if not data:
+            logger.warning(f"No profile found for user {secure_id}")
+            return profile
         
-        # Load data into profile
-        profile.demographic_data = data.get("demographic_data", {})
-        profile.preferences = data.get("preferences", {})
-        profile.therapy_goals = data.get("therapy_goals", [])
-        profile.communication_style = data.get("communication_style", {})
-        profile.mood_patterns = data.get("mood_patterns", [])
-        profile.topic_interests = data.get("topic_interests", {})
-        profile.trigger_topics = data.get("trigger_topics", [])
-        profile.language_patterns = data.get("language_patterns", {})
-        profile.response_preferences = data.get("response_preferences", {})
-        profile.therapy_approaches = data.get("therapy_approaches", {})
-        profile.coping_strategies = data.get("coping_strategies", [])
-        
-        # Handle timestamps
-        profile.created_at = datetime.fromisoformat(data.get("created_at"))
-        profile.updated_at = datetime.fromisoformat(data.get("updated_at"))
-        
-        # Handle permissions
-        profile.data_collection_consent = data.get("data_collection_consent", False)
-        profile.data_retention_preference = data.get("data_retention_preference", "session")
-        profile.data_sharing_permissions = data.get("data_sharing_permissions", {
-            "anonymized_research": False,
-            "therapist_oversight": False
-        })
+        profile._attach_sections(data)
+        if sections is not None:
+            # Sections left out keep their defaults and must not overwrite stored data
+            profile._loaded_sections = set(sections)
         
         logger.info(f"Profile loaded for user: {secure_id}")
         return profile
@@ -235,14 +498,64 @@ class PersonalizationEngine:
     """Engine to personalize AI responses based on user profile"""
     
     def __init__(self):
-        self.profiles = {}  # In-memory store of active profiles
+        # Active profiles; evicted ones are saved first if they have pending updates
+        self.profiles = ProfileCache(on_evict=self._profile_evicted)
         logger.info("Personalization engine initialized")
     
+    def _profile_evicted(self, user_id: str, profile: UserProfile) -> None:
+        profile_writer.flush(profile.secure_id)
+        if not profile.stored:
+            self.profiles.mark_missing(user_id)
+    
+    def invalidate(self, user_id: str, version: Optional[int] = None) -> None:
+        """
+        Drop a cached profile that another worker saved as `version`, or deleted.
+        
+        The stale copy's pending updates are saved now, rebased onto the newer stored
+        profile; those of a deleted profile are thrown away.
+        """
+        profile = self.profiles.pop(user_id)
+        if profile is None:
+            return
+        if version is not None and profile.store_version >= version:
+            # This copy already includes that change
+            self.profiles.put(user_id, profile)
+            return
+        self._retire(profile, deleted=version is None)
+    
+    def invalidate_all(self) -> None:
+        """Drop every cached profile whose stored version moved on, e.g. after missed invalidations"""
+        for user_id, profile in self.profiles.clear():
+            if profile_store.version(profile.secure_id) == profile.store_version:
+                self.profiles.put(user_id, profile)
+            else:
+                self._retire(profile)
+    
+    def _retire(self, profile: UserProfile, deleted: bool = False) -> None:
+        profile._stale = True
+        if deleted:
+            profile_writer.discard(profile.secure_id)
+        else:
+            profile_writer.flush(profile.secure_id)
+        logger.info(f"Dropped stale profile for user: {profile.secure_id}")
+    
     def get_user_profile(self, user_id: str) -> UserProfile:
-        """Get user profile, loading from file if needed"""
-        if user_id not in self.profiles:
-            self.profiles[user_id] = UserProfile.load(user_id)
-        return self.profiles[user_id]
+        """Get user profile, loading it from the profile store if needed"""
+        profile = self.profiles.get(user_id)
+        if profile is not None and profile.stale:
+            self.profiles.pop(user_id)
+            profile = None
+        if profile is None:
+            # Hear about other workers' changes before caching a copy
+            profile_events.start()
+            if self.profiles.is_missing(user_id):
+                profile = UserProfile(user_id)
+            else:
+                profile = UserProfile.load(user_id)
+                if not profile.stored:
+                    self.profiles.mark_missing(user_id)
+            self.profiles.put(user_id, profile)
+        return profile
     
     def update_profile_from_session(self, user_id: str, session_data: Dict[str, Any]) -> None:
         """Update user profile based on session data"""
@@ -265,33 +578,66 @@ class PersonalizationEngine:
                 session_data.get("mood_notes")
             )
         
-        # Learn about topics of interest
+        # Learn about topics of interest, extracting them in the background if not given
         if "topics_discussed" in session_data:
-            for topic, data in session_data["topics_discussed"].items():
-                interest_level = data.get("interest_level", 0.5)
-                profile.update_topic_interest(topic, interest_level)
-                
-                # Identify potential triggers
-                if data.get("negative_response", False) and data.get("emotional_intensity", 0) > 7:
-                    profile.add_trigger_topic(topic, data.get("emotional_intensity", 5))
+            self._learn_topics(profile, session_data["topics_discussed"])
+        elif "message_pair" in session_data:
+            topic_extractor.submit(user_id, session_data["message_pair"].get("user", ""))
         
         # Learn about communication preferences
         if "communication_feedback" in session_data:
             profile.update_communication_style(session_data["communication_feedback"])
         
-        # Save the updated profile
-        profile.save()
+        # Save the updated profile in the background, together with later updates
+        profile_writer.mark_dirty(profile)
         logger.info(f"Profile updated from session for user: {profile.secure_id}")
     
+    def learn_topics(self, user_id: str, topics_discussed: Dict[str, Dict[str, Any]]) -> None:
+        """Apply topics extracted from a user's messages"""
+        profile = self.get_user_profile(user_id)
+        if not profile.data_collection_consent:
+            return
+        self._learn_topics(profile, topics_discussed)
+        profile_writer.mark_dirty(profile)
+    
+    def _learn_topics(self, profile: UserProfile, topics_discussed: Dict[str, Dict[str, Any]]) -> None:
+        """Record interest in each topic and add new potential triggers"""
+        profile.update_topic_interests({
+            topic: data.get("interest_level", 0.5) for topic, data in topics_discussed.items()
+        })
+        
+        # Identify potential triggers
+        known_triggers = {t["topic"] for t in profile.trigger_topics}
+        for topic, data in topics_discussed.items():
+            if topic in known_triggers:
+                continue
+            if data.get("negative_response", False) and data.get("emotional_intensity", 0) > 7:
+                profile.add_trigger_topic(topic, data.get("emotional_intensity", 5))
+    
     def generate_personalization_context(self, user_id: str) -> Dict[str, Any]:
-        """Generate personalization context for AI response generation"""
+        """
+        Generate personalization context for AI response generation.
+        
+        The context is rebuilt only when the profile version changes; callers must
+        treat the nested values as read-only.
+        """
         profile = self.get_user_profile(user_id)
         
+        cached = profile._cached_context
+        if cached is None or cached[0] != profile.version:
+            cached = (profile.version, self._build_personalization_context(profile))
+            profile._cached_context = cached
+        
+        # Session history grows every turn without a new version, so its length is read live
+        return {**cached[1], "session_count": len(profile.session_history)}
+    
+    def _build_personalization_context(self, profile: UserProfile) -> Dict[str, Any]:
+        """Build the personalization context for one profile version"""
         # Get basic personalization data even without consent
         basic_context = {
             "user_id": profile.secure_id,
-            "communication_style": profile.communication_style,
-            "session_count": len(profile.session_history)
+            "profile_version": profile.version,
+            "communication_style": profile.communication_style
         }
         
         # If no consent, return only basic information
@@ -311,66 +657,39 @@ class PersonalizationEngine:
             "triggers_to_avoid": [t["topic"] for t in profile.trigger_topics if t["severity"] > 6],
             "preferred_therapy_approaches": profile.therapy_approaches,
             "effective_coping_strategies": [s for s in profile.coping_strategies if s["effectiveness"] > 7],
-            "mood_trend": self._calculate_mood_trend(profile.mood_patterns)
+            "mood_trend": profile.mood_stats.summary()
         }
         
         logger.info(f"Generated personalization context for user: {profile.secure_id}")
         return context
     
-    def _calculate_mood_trend(self, mood_patterns: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Calculate mood trend from mood data"""
-        if not mood_patterns or len(mood_patterns) < 2:
-            return {"trend": "unknown", "stability": "unknown"}
-        
-        # Sort by timestamp
-        sorted_moods = sorted(mood_patterns, key=lambda x: x["timestamp"])
-        
-        # Get recent moods (last 7 entries)
-        recent_moods = sorted_moods[-7:]
-        
-        # Calculate average and trend
-        scores = [m["score"] for m in recent_moods]
-        avg_score = sum(scores) / len(scores)
-        
-        # Simple trend calculation
-        first_half = scores[:len(scores)//2]
-        second_half = scores[len(scores)//2:]
-        
-        first_avg = sum(first_half) / len(first_half)
-        second_avg = sum(second_half) / len(second_half)
-        
-        if second_avg > first_avg + 1:
-            trend = "improving"
-        elif second_avg < first_avg - 1:
-            trend = "declining"
-        else:
-            trend = "stable"
-        
-        # Calculate stability (standard deviation)
-        variance = sum((x - avg_score) ** 2 for x in scores) / len(scores)
-        std_dev = variance ** 0.5
-        
-        if std_dev < 1:
-            stability = "very stable"
-        elif std_dev < 2:
-            stability = "stable"
-        elif std_dev < 3:
-            stability = "somewhat unstable"
-        else:
-            stability = "unstable"
-        
-        return {
-            "trend": trend,
-            "stability": stability,
-            "average_score": round(avg_score, 1),
-            "recent_scores": scores
-        }
+    def update_data_permissions(self, user_id: str, permission_updates: Dict[str, Any]) -> UserProfile:
+        """
+        Change a user's consent or sharing settings and save them now.
+        
+        If another worker saves in between, the copy is rebased onto the stored profile
+        and the change applied again; if the stored profile was deleted or consent
+        withdrawn meanwhile, the change is applied to a fresh copy instead.
+        """
+        profile = self.get_user_profile(user_id)
+        for attempt in range(PERMISSION_UPDATE_ATTEMPTS):
+            profile.update_data_permissions(permission_updates)
+            # Save now, including any updates still waiting in the write-behind queue
+            profile_writer.discard(profile.secure_id)
+            try:
+                profile.save(permissions=True)
+                self.profiles.put(user_id, profile)
+                return profile
+            except ProfileConflict:
+                logger.info(f"Profile for user {profile.secure_id} changed concurrently, retrying")
+                if not profile.rebase():
+                    self.profiles.pop(user_id)
+                    profile = self.get_user_profile(user_id)
+        raise ProfileConflict(f"Could not update permissions for user {profile.secure_id}")
     
     def handle_consent_update(self, user_id: str, consent_given: bool) -> None:
         """Handle user consent update"""
-        profile = self.get_user_profile(user_id)
-        
-        profile.update_data_permissions({
+        profile = self.update_data_permissions(user_id, {
             "data_collection_consent": consent_given
         })
         
@@ -379,30 +698,36 @@ class PersonalizationEngine:
             # we should delete the profile after session ends
             logger.info(f"Profile for user {profile.secure_id} will be deleted at end of session")
         
-        profile.save()
         logger.info(f"Consent updated for user: {profile.secure_id} to {consent_given}")
     
     def handle_session_end(self, user_id: str) -> None:
         """Handle end of session, potentially cleaning up data"""
-        profile = self.get_user_profile(user_id)
+        # Only consent and retention settings are needed to decide
+        profile = self.profiles.get(user_id) or UserProfile.load(user_id, sections=["meta"])
         
         # If user has not given consent or prefers session-only retention,
         # delete their profile data
         if not profile.data_collection_consent or profile.data_retention_preference == "session":
-            secure_id = profile.secure_id
-            
-            # Remove from memory
-            if user_id in self.profiles:
-                del self.profiles[user_id]
-            
-            # Delete file if it exists
-            file_path = f"user_profiles/{secure_id}.json"
+            self.delete_profile(user_id)
+        else:
+            profile_writer.flush(profile.secure_id)
+        
+        logger.info(f"Session ended for user: {profile.secure_id}")
+    
+    def delete_profile(self, user_id: str) -> None:
+        """Delete a user's profile from memory, the profile store and any legacy file"""
+        secure_id = hashlib.sha256(str(user_id).encode()).hexdigest()[:16]
+        self.profiles.pop(user_id, None)
+        profile_writer.discard(secure_id)
+        profile_store.delete(secure_id)
+        profile_events.publish(user_id, None)
+        
+        for suffix in (".json", ".json.migrated"):
+            file_path = os.path.join(LEGACY_PROFILE_DIR, f"{secure_id}{suffix}")
             if os.path.exists(file_path):
                 os.remove(file_path)
-                
-            logger.info(f"Profile deleted for user: {secure_id}")
         
-        logger.info(f"Session ended for user: {profile.secure_id}")
+        logger.info(f"Profile deleted for user: {secure_id}")
 
 
 # Create global instance
@@ -0,0 +1,173 @@
+"""
+In-memory cache of active user profiles
+LRU bounded by entry count and estimated bytes, with a TTL and negative caching of users without a profile
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Cache limits
+PROFILE_CACHE_MAX_ENTRIES = int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", 1000))
+PROFILE_CACHE_MAX_BYTES = int(os.getenv("PROFILE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", 60 * 60))
+# Charged for every profile, about what an empty UserProfile takes in memory, so
+# profiles that were never saved (every user without consent) still count
+PROFILE_CACHE_MIN_ENTRY_BYTES = int(os.getenv("PROFILE_CACHE_MIN_ENTRY_BYTES", 8 * 1024))
+
+
+def profile_size(profile: Any) -> int:
+    """Estimate a profile's memory from the size of its stored sections, never below the minimum"""
+    return max(getattr(profile, "stored_bytes", 0), PROFILE_CACHE_MIN_ENTRY_BYTES)
+
+
+class ProfileCache:
+    """
+    LRU cache of profiles keyed by user id.
+
+    Entries expire `ttl` seconds after they were loaded. Sizes are re-measured on every
+    hit, since profiles grow as they are used. Evicted and expired profiles are handed to
+    `on_evict`, which should save anything not yet persisted. Users known to have no
+    stored profile are remembered for the same TTL, so they are not looked up again.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = PROFILE_CACHE_MAX_ENTRIES,
+        max_bytes: int = PROFILE_CACHE_MAX_BYTES,
+        ttl: float = PROFILE_CACHE_TTL,
+        on_evict: Optional[Callable[[str, Any], None]] = None,
+        sizeof: Callable[[Any], int] = profile_size
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.sizeof = sizeof
+        self._entries: "OrderedDict[str, List[Any]]" = OrderedDict()  # key -> [value, size, expires]
+        self._missing: "OrderedDict[str, float]" = OrderedDict()  # key -> expires
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "negative_hits": 0, "evictions": 0, "expirations": 0}
+
+    def _remove(self, key: str) -> Any:
+        value, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        return value
+
+    def _enforce_bounds(self, keep: Optional[str] = None) -> List[Tuple[str, Any]]:
+        """Remove least recently used entries until within bounds, never the one being used"""
+        evicted = []
+        while len(self._entries) > self.max_entries or (self._bytes > self.max_bytes and len(self._entries) > 1):
+            key = next(iter(self._entries))
+            if key == keep:
+                self._entries.move_to_end(key)
+                key = next(iter(self._entries))
+            evicted.append((key, self._remove(key)))
+            self._stats["evictions"] += 1
+        return evicted
+
+    def _notify(self, evicted: List[Tuple[str, Any]]) -> None:
+        """Pass evicted profiles to on_evict, outside the lock since it may write to disk"""
+        for key, value in evicted:
+            if self.on_evict is None:
+                continue
+            try:
+                self.on_evict(key, value)
+            except Exception as e:
+                logger.error(f"Error handling evicted profile {key}: {e}")
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get a cached profile, or None if it is not cached or has expired"""
+        evicted = []
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] <= time.monotonic():
+                evicted.append((key, self._remove(key)))
+                self._stats["expirations"] += 1
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                value = None
+            else:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                value = entry[0]
+                size = self.sizeof(value)
+                self._bytes += size - entry[1]
+                entry[1] = size
+                evicted.extend(self._enforce_bounds(keep=key))
+        self._notify(evicted)
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        """Cache a profile, evicting least recently used ones if over a bound"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._missing.pop(key, None)
+            size = self.sizeof(value)
+            self._entries[key] = [value, size, time.monotonic() + self.ttl]
+            self._bytes += size
+            evicted = self._enforce_bounds(keep=key)
+        self._notify(evicted)
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        """Remove a profile without calling on_evict, e.g. because it is being deleted"""
+        with self._lock:
+            self._missing.pop(key, None)
+            return self._remove(key) if key in self._entries else default
+
+    def clear(self) -> List[Tuple[str, Any]]:
+        """Remove every entry, including negative ones, and return the removed profiles"""
+        with self._lock:
+            removed = [(key, entry[0]) for key, entry in self._entries.items()]
+            self._entries.clear()
+            self._missing.clear()
+            self._bytes = 0
+        return removed
+
+    def mark_missing(self, key: str) -> None:
+        """Remember that a user has no stored profile"""
+        with self._lock:
+            self._missing.pop(key, None)
+            self._missing[key] = time.monotonic() + self.ttl
+            while len(self._missing) > self.max_entries:
+                self._missing.popitem(last=False)
+
+    def is_missing(self, key: str) -> bool:
+        """Whether a user is known to have no stored profile"""
+        with self._lock:
+            expires = self._missing.get(key)
+            if expires is None:
+                return False
+            if expires <= time.monotonic():
+                del self._missing[key]
+                return False
+            self._stats["negative_hits"] += 1
+            return True
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get hit, miss and eviction counters and the resident size"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["missing_entries"] = len(self._missing)
+            stats["resident_bytes"] = self._bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,98 @@
+"""
+Profile section encoding
+Versioned binary records for profile sections, using msgpack when it is installed
+"""
+
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Union
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+    logger.warning("msgpack is not installed. Profile sections will be encoded as JSON.")
+
+# Record layout: magic, schema version, payload codec, payload
+SECTION_MAGIC = b"PS"
+SECTION_SCHEMA_VERSION = 1
+CODEC_MSGPACK = b"m"
+CODEC_JSON = b"j"
+CODEC_BINARY = b"b"  # Bytes encoded by the section's owner, such as the compact series
+_HEADER_SIZE = len(SECTION_MAGIC) + 2
+
+# msgpack extension type for datetimes
+_DATETIME_EXT = 1
+
+
+def _json_default(value: Any) -> Any:
+    """JSON fallback that keeps datetimes distinguishable from strings"""
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _json_object_hook(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1 and "$datetime" in obj:
+        return datetime.fromisoformat(obj["$datetime"])
+    return obj
+
+
+def _msgpack_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return msgpack.ExtType(_DATETIME_EXT, value.isoformat().encode("ascii"))
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _msgpack_ext_hook(code: int, data: bytes) -> Any:
+    if code == _DATETIME_EXT:
+        return datetime.fromisoformat(data.decode("ascii"))
+    return msgpack.ExtType(code, data)
+
+
+def dump_section(value: Any) -> bytes:
+    """Encode one profile section as a versioned record"""
+    if isinstance(value, (bytes, bytearray)):
+        codec, payload = CODEC_BINARY, bytes(value)
+    elif MSGPACK_AVAILABLE:
+        codec, payload = CODEC_MSGPACK, msgpack.packb(value, default=_msgpack_default, use_bin_type=True)
+    else:
+        codec = CODEC_JSON
+        payload = json.dumps(value, default=_json_default, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    return SECTION_MAGIC + bytes([SECTION_SCHEMA_VERSION]) + codec + payload
+
+
+def is_current_record(data: Union[str, bytes]) -> bool:
+    """Whether stored data is a versioned record, rather than an older format"""
+    return isinstance(data, bytes) and data.startswith(SECTION_MAGIC)
+
+
+def load_section(data: Union[str, bytes]) -> Any:
+    """
+    Decode one profile section.
+
+    Also reads the formats written before versioned records: JSON text, and bare
+    binary series, which are returned as bytes for their owner to decode.
+    """
+    if isinstance(data, str):
+        return json.loads(data, object_hook=_json_object_hook)
+    if not is_current_record(data):
+        return bytes(data)
+
+    version, codec, payload = data[2], data[3:4], data[_HEADER_SIZE:]
+    if version > SECTION_SCHEMA_VERSION:
+        raise ValueError(f"Profile section has schema version {version}, newer than {SECTION_SCHEMA_VERSION}")
+    if codec == CODEC_BINARY:
+        return bytes(payload)
+    if codec == CODEC_JSON:
+        return json.loads(payload, object_hook=_json_object_hook)
+    if codec == CODEC_MSGPACK:
+        if not MSGPACK_AVAILABLE:
+            raise RuntimeError("Profile section was encoded with msgpack, which is not installed")
+        return msgpack.unpackb(payload, ext_hook=_msgpack_ext_hook, raw=False, strict_map_key=False)
+    raise ValueError(f"Unknown profile section codec {codec!r}")
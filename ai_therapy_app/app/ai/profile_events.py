@@ -0,0 +1,148 @@
+"""
+Profile invalidation bus
+Tells every worker, over Redis pub/sub, when a profile was changed so cached copies can be dropped
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import uuid
+from typing import Any, Callable, Optional
+
+from app.core.lazy import LazyResource
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+PROFILE_INVALIDATION_CHANNEL = os.getenv("PROFILE_INVALIDATION_CHANNEL", "profile-invalidation")
+# Longest wait between reconnection attempts after the subscription drops
+PROFILE_INVALIDATION_MAX_BACKOFF = float(os.getenv("PROFILE_INVALIDATION_MAX_BACKOFF", 30))
+
+
+class ProfileInvalidationBus:
+    """
+    Broadcasts (user, version) whenever a profile is persisted or deleted.
+
+    Each worker publishes its own changes and listens for everyone else's on a
+    background thread, calling `on_invalidate(user_id, version)` for each. Messages
+    sent while a worker was disconnected are lost, so `on_resubscribe` is called after
+    every reconnect to drop anything that may have gone stale. Without Redis the bus
+    does nothing, which is correct for a single worker.
+
+    The listener starts on first use (a publish, or the engine loading a profile), so
+    workers forked by a WSGI server listen without a post-fork hook.
+    """
+
+    def __init__(self, channel: str = PROFILE_INVALIDATION_CHANNEL):
+        self.channel = channel
+        # Identifies this process, so it can ignore its own messages
+        self.origin = uuid.uuid4().hex
+        self.on_invalidate: Optional[Callable[[Any, int], None]] = None
+        self.on_resubscribe: Optional[Callable[[], None]] = None
+        self._redis = None
+        self._thread = None
+        # Set without Redis, or once closed, so start() stops trying
+        self._local_only = False
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def configure(
+        self,
+        redis_client=None,
+        on_invalidate: Optional[Callable[[Any, int], None]] = None,
+        on_resubscribe: Optional[Callable[[], None]] = None
+    ) -> None:
+        """
+        Attach the shared Redis client and the cache callbacks.
+        The client may be a LazyResource that resolves to a client, or to None when Redis is unreachable.
+        """
+        self._redis = redis_client
+        self.on_invalidate = on_invalidate
+        self.on_resubscribe = on_resubscribe
+
+    @property
+    def redis(self):
+        """The Redis client, connecting on first use, or None to stay local"""
+        if isinstance(self._redis, LazyResource):
+            return self._redis.get()
+        return self._redis
+
+    def publish(self, user_id: Any, version: int) -> None:
+        """Announce that a user's profile changed; never raises"""
+        self.start()
+        client = self.redis
+        if client is None:
+            return
+        message = json.dumps({"user_id": user_id, "version": version, "origin": self.origin})
+        try:
+            client.publish(self.channel, message)
+        except Exception as e:
+            logger.error(f"Error publishing profile invalidation: {e}")
+
+    def handle(self, data: Any) -> None:
+        """Apply one message from the channel"""
+        try:
+            message = json.loads(data)
+        except (TypeError, ValueError):
+            logger.warning(f"Ignoring malformed profile invalidation: {data!r}")
+            return
+        if message.get("origin") == self.origin or self.on_invalidate is None:
+            return
+        self.on_invalidate(message.get("user_id"), message.get("version"))
+
+    def start(self) -> None:
+        """Start listening on a background thread, if Redis is available; cheap once started"""
+        if self._thread is not None or self._local_only:
+            return
+        with self._lock:
+            if self._thread is not None or self._local_only:
+                return
+            if self.redis is None:
+                logger.info("Redis unavailable; profile invalidations stay local to this worker")
+                self._local_only = True
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._listen, name="profile-invalidation", daemon=True)
+            self._thread.start()
+
+    def _listen(self) -> None:
+        backoff = 1.0
+        while not self._stopped.is_set():
+            pubsub = None
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Changes published while we were not subscribed were missed
+                if self.on_resubscribe is not None:
+                    self.on_resubscribe()
+                backoff = 1.0
+                while not self._stopped.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get("type") == "message":
+                        self.handle(message["data"])
+            except Exception as e:
+                logger.error(f"Profile invalidation subscription failed, retrying in {backoff:.0f}s: {e}")
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, PROFILE_INVALIDATION_MAX_BACKOFF)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def close(self) -> None:
+        """Stop listening; later publishes do not start the listener again"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._local_only = True
+        self._stopped.set()
+        if thread is not None:
+            thread.join(timeout=5)
+
+
+# Create global instance
+profile_events = ProfileInvalidationBus()
+atexit.register(profile_events.close)
@@ -0,0 +1,239 @@
+"""
+Profile storage engine for AI personalization
+Stores each user profile as per-section records in SQLite, replacing one JSON file per user
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+
+from app.ai.profile_codec import dump_section, load_section
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+PROFILE_DB_PATH = os.getenv("PROFILE_DB_PATH", "user_profiles/profiles.sqlite3")
+LEGACY_PROFILE_DIR = "user_profiles"
+
+# UserProfile attributes stored as their own section records
+PROFILE_SECTIONS = [
+    "demographic_data", "preferences", "therapy_goals", "communication_style",
+    "mood_patterns", "topic_interests", "trigger_topics", "language_patterns",
+    "response_preferences", "therapy_approaches", "coping_strategies",
+    "session_history", "daily_check_ins"
+]
+# Small scalar attributes stored together in the "meta" section; it holds the
+# user's consent, so it is only written by UserProfile.save(permissions=True)
+META_FIELDS = [
+    "created_at", "updated_at", "data_collection_consent",
+    "data_retention_preference", "data_sharing_permissions"
+]
+
+
+class ProfileConflict(Exception):
+    """The stored profile changed since the copy being written was loaded"""
+
+
+class ProfileStore:
+    """
+    SQLite-backed profile store with one row per (profile, section).
+
+    Writes of several sections happen in one transaction, so a profile is never left
+    half-written, and only the sections passed in are rewritten. Reads can ask for a
+    subset of sections. WAL mode lets readers continue while a write is in progress.
+
+    Every write and delete bumps the profile's version, which is shared by all workers.
+    A write given the version its data was based on fails with ProfileConflict if
+    another worker wrote in the meantime.
+    """
+
+    def __init__(self, path: str = PROFILE_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get this thread's connection, creating the schema on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._schema_ready:
+            with self._schema_lock:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS profile_sections ("
+                    " secure_id TEXT NOT NULL,"
+                    " section TEXT NOT NULL,"
+                    " data BLOB NOT NULL,"
+                    " updated_at TEXT NOT NULL,"
+                    " PRIMARY KEY (secure_id, section)"
+                    ") WITHOUT ROWID"
+                )
+                # Kept when a profile is deleted, so versions never repeat
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS profile_versions ("
+                    " secure_id TEXT PRIMARY KEY,"
+                    " version INTEGER NOT NULL"
+                    ") WITHOUT ROWID"
+                )
+                self._schema_ready = True
+        return conn
+
+    def read_raw(self, secure_id: str, sections: Optional[Iterable[str]] = None) -> Dict[str, Union[str, bytes]]:
+        """Read a profile's sections, or only the ones named, without decoding them"""
+        conn = self._connect()
+        if sections is None:
+            rows = conn.execute(
+                "SELECT section, data FROM profile_sections WHERE secure_id = ?", (secure_id,)
+            ).fetchall()
+        else:
+            sections = list(sections)
+            placeholders = ",".join("?" * len(sections))
+            rows = conn.execute(
+                f"SELECT section, data FROM profile_sections WHERE secure_id = ? AND section IN ({placeholders})",
+                (secure_id, *sections)
+            ).fetchall()
+        return dict(rows)
+
+    def read_versioned(
+        self,
+        secure_id: str,
+        sections: Optional[Iterable[str]] = None
+    ) -> Tuple[int, Dict[str, Union[str, bytes]]]:
+        """Read a profile's version and raw sections from the same snapshot"""
+        conn = self._connect()
+        conn.execute("BEGIN")
+        try:
+            return self._version(conn, secure_id), self.read_raw(secure_id, sections)
+        finally:
+            conn.execute("COMMIT")
+
+    def version(self, secure_id: str) -> int:
+        """The profile's current version; 0 if it was never written"""
+        return self._version(self._connect(), secure_id)
+
+    @staticmethod
+    def _version(conn: sqlite3.Connection, secure_id: str) -> int:
+        row = conn.execute("SELECT version FROM profile_versions WHERE secure_id = ?", (secure_id,)).fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _bump_version(conn: sqlite3.Connection, secure_id: str, current: int) -> int:
+        conn.execute(
+            "INSERT INTO profile_versions (secure_id, version) VALUES (?, ?) "
+            "ON CONFLICT (secure_id) DO UPDATE SET version = excluded.version",
+            (secure_id, current + 1)
+        )
+        return current + 1
+
+    def read(self, secure_id: str, sections: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Read and decode a profile's sections, or only the ones named"""
+        return {section: load_section(data) for section, data in self.read_raw(secure_id, sections).items()}
+
+    def write(self, secure_id: str, sections: Dict[str, bytes], expected_version: Optional[int] = None) -> int:
+        """
+        Atomically write encoded sections, leaving the others untouched.
+
+        With `expected_version`, the write only happens if the profile is still at that
+        version, and raises ProfileConflict otherwise. Returns the new version.
+        """
+        now = datetime.now().isoformat()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            current = self._version(conn, secure_id)
+            if expected_version is not None and current != expected_version:
+                raise ProfileConflict(f"Profile {secure_id} is at version {current}, not {expected_version}")
+            if not sections:
+                conn.execute("COMMIT")
+                return current
+            conn.executemany(
+                "INSERT INTO profile_sections (secure_id, section, data, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (secure_id, section) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                [(secure_id, section, sqlite3.Binary(data), now) for section, data in sections.items()]
+            )
+            version = self._bump_version(conn, secure_id, current)
+            conn.execute("COMMIT")
+            return version
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def exists(self, secure_id: str) -> bool:
+        """Whether any section is stored for a profile"""
+        row = self._connect().execute(
+            "SELECT 1 FROM profile_sections WHERE secure_id = ? LIMIT 1", (secure_id,)
+        ).fetchone()
+        return row is not None
+
+    def delete(self, secure_id: str) -> bool:
+        """Delete every section of a profile; returns True if anything was stored"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.execute("DELETE FROM profile_sections WHERE secure_id = ?", (secure_id,))
+            # Stale copies elsewhere must not be able to write the profile back
+            self._bump_version(conn, secure_id, self._version(conn, secure_id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount > 0
+
+    def import_legacy_file(self, secure_id: str, directory: str = LEGACY_PROFILE_DIR) -> bool:
+        """Move a legacy JSON profile into the store, keeping the file as *.migrated"""
+        file_path = os.path.join(directory, f"{secure_id}.json")
+        if not os.path.exists(file_path):
+            return False
+        try:
+            with open(file_path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read legacy profile {file_path}: {e}")
+            return False
+
+        self.write(secure_id, {section: dump_section(value) for section, value in legacy_sections(data).items()})
+        os.replace(file_path, f"{file_path}.migrated")
+        logger.info(f"Migrated legacy profile file for user: {secure_id}")
+        return True
+
+    def migrate_directory(self, directory: str = LEGACY_PROFILE_DIR) -> int:
+        """Import every legacy JSON profile in a directory; returns the number migrated"""
+        if not os.path.isdir(directory):
+            return 0
+        migrated = 0
+        for name in os.listdir(directory):
+            if name.endswith(".json") and self.import_legacy_file(name[:-len(".json")], directory):
+                migrated += 1
+        return migrated
+
+    def close(self) -> None:
+        """Close this thread's connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def legacy_sections(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Split a legacy whole-profile JSON document into store sections"""
+    sections = {name: data[name] for name in PROFILE_SECTIONS if name in data}
+    meta = {name: data[name] for name in META_FIELDS if name in data}
+    for name in ("created_at", "updated_at"):
+        if isinstance(meta.get(name), str):
+            meta[name] = datetime.fromisoformat(meta[name])
+    sections["meta"] = meta
+    return sections
+
+
+# Create global instance
+profile_store = ProfileStore()
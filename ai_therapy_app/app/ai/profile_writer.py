@@ -0,0 +1,121 @@
+"""
+Write-behind persistence for user profiles
+Coalesces per-message profile updates and saves them from a background thread
+"""
+
+import atexit
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from app.ai.profile_store import ProfileConflict
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Longest time an update may wait before it is saved
+PROFILE_FLUSH_INTERVAL = float(os.getenv("PROFILE_FLUSH_INTERVAL", 5))
+# Number of dirty profiles that triggers an early flush
+PROFILE_FLUSH_MAX_DIRTY = int(os.getenv("PROFILE_FLUSH_MAX_DIRTY", 100))
+# Saves of one profile per flush before it is left for the next one
+PROFILE_SAVE_ATTEMPTS = int(os.getenv("PROFILE_SAVE_ATTEMPTS", 3))
+
+
+class ProfileWriter:
+    """
+    Write-behind queue of profiles waiting to be saved.
+
+    Marking a profile dirty is cheap; repeated updates to the same profile are saved
+    once. A background thread flushes every `interval` seconds, or sooner when
+    `max_dirty` profiles are waiting, so at most one interval of updates is at risk.
+    Anything still pending is flushed when the process exits. Updates made to a copy
+    that another worker has since saved are merged into the newer stored profile and
+    saved again; they are only dropped if the profile was deleted or consent withdrawn.
+    """
+
+    def __init__(self, interval: float = PROFILE_FLUSH_INTERVAL, max_dirty: int = PROFILE_FLUSH_MAX_DIRTY):
+        self.interval = interval
+        self.max_dirty = max_dirty
+        self._dirty: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopped = False
+
+    def mark_dirty(self, profile: Any) -> None:
+        """Queue a profile to be saved by the next flush"""
+        with self._lock:
+            self._dirty[profile.secure_id] = profile
+            if self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target=self._run, name="profile-writer", daemon=True)
+                self._thread.start()
+            pending = len(self._dirty)
+        if pending >= self.max_dirty:
+            self._wake.set()
+
+    def pending(self) -> int:
+        """Number of profiles waiting to be saved"""
+        with self._lock:
+            return len(self._dirty)
+
+    def discard(self, secure_id: str) -> None:
+        """Drop a pending save, e.g. because the profile is being deleted"""
+        with self._lock:
+            self._dirty.pop(secure_id, None)
+
+    def flush(self, secure_id: Optional[str] = None) -> int:
+        """Save pending profiles now, or only the given one; returns the number saved"""
+        with self._lock:
+            if secure_id is None:
+                batch, self._dirty = self._dirty, {}
+            else:
+                profile = self._dirty.pop(secure_id, None)
+                batch = {secure_id: profile} if profile is not None else {}
+
+        saved = 0
+        for key, profile in batch.items():
+            try:
+                if self._save(profile):
+                    saved += 1
+                else:
+                    logger.info(f"Dropped updates to profile {key}: it was deleted or consent was withdrawn")
+            except Exception as e:
+                logger.error(f"Error saving profile {key}, will retry: {e}")
+                with self._lock:
+                    # A newer update may have queued it again meanwhile
+                    self._dirty.setdefault(key, profile)
+        return saved
+
+    @staticmethod
+    def _save(profile: Any) -> bool:
+        """Save a profile, rebasing it onto newer stored versions; False if its updates may not be kept"""
+        for _ in range(PROFILE_SAVE_ATTEMPTS):
+            try:
+                profile.save()
+                return True
+            except ProfileConflict:
+                if not profile.rebase():
+                    return False
+        raise ProfileConflict(f"Profile {profile.secure_id} kept changing while being saved")
+
+    def _run(self) -> None:
+        while not self._stopped:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self) -> None:
+        """Stop the background thread and save everything still pending"""
+        with self._lock:
+            self._stopped = True
+            thread, self._thread = self._thread, None
+        self._wake.set()
+        if thread is not None:
+            thread.join(timeout=self.interval + 5)
+        self.flush()
+
+
+# Create global instance
+profile_writer = ProfileWriter()
+atexit.register(profile_writer.close)
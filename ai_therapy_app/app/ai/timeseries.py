@@ -0,0 +1,210 @@
+"""
+Compact time series for user profiles
+Array-backed mood scores and session history with a small binary encoding
+"""
+
+import json
+import os
+import struct
+import sys
+from array import array
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Session interactions kept per profile; older ones are dropped first
+SESSION_HISTORY_MAX = int(os.getenv("SESSION_HISTORY_MAX", 1000))
+
+# Binary layout: format version and entry count, then each column as little-endian values
+SERIES_FORMAT_VERSION = 1
+_HEADER = struct.Struct("<BI")
+# Stands in for an id that is missing or not numeric
+NO_ID = -1
+
+
+def to_epoch(timestamp: Any) -> int:
+    """Convert a datetime, ISO string or number to epoch seconds"""
+    if isinstance(timestamp, datetime):
+        return int(timestamp.timestamp())
+    if isinstance(timestamp, str):
+        return int(datetime.fromisoformat(timestamp).timestamp())
+    return int(timestamp)
+
+
+def to_id(value: Any) -> int:
+    """Convert a database id to an int, or NO_ID if there is none"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return NO_ID
+
+
+def _pack_columns(columns: Iterable[array]) -> bytes:
+    parts = []
+    for column in columns:
+        if sys.byteorder == "big":
+            column = array(column.typecode, column)
+            column.byteswap()
+        parts.append(column.tobytes())
+    return b"".join(parts)
+
+
+def _unpack_columns(data: bytes, offset: int, count: int, typecodes: str) -> Tuple[List[array], int]:
+    columns = []
+    for typecode in typecodes:
+        column = array(typecode)
+        size = column.itemsize * count
+        column.frombytes(data[offset:offset + size])
+        if sys.byteorder == "big":
+            column.byteswap()
+        columns.append(column)
+        offset += size
+    return columns, offset
+
+
+def _read_header(data: bytes) -> int:
+    version, count = _HEADER.unpack_from(data)
+    if version != SERIES_FORMAT_VERSION:
+        raise ValueError(f"Unsupported series format version {version}")
+    return count
+
+
+class MoodSeries:
+    """
+    Mood scores over time, stored as parallel arrays.
+
+    Timestamps are epoch seconds and scores are floats; the rare notes are kept in a
+    dict by position. Iterating yields the same dicts as the old list of entries.
+    """
+
+    __slots__ = ("timestamps", "scores", "notes")
+
+    def __init__(self):
+        self.timestamps = array("q")
+        self.scores = array("d")
+        self.notes: Dict[int, str] = {}
+
+    def append(self, timestamp: Any, score: float, notes: Optional[str] = None) -> None:
+        """Add a mood score; entries are expected in time order"""
+        if notes:
+            self.notes[len(self.scores)] = notes
+        self.timestamps.append(to_epoch(timestamp))
+        self.scores.append(score)
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for index in range(len(self.scores)):
+            yield self._entry(index)
+
+    def _entry(self, index: int) -> Dict[str, Any]:
+        return {
+            "timestamp": datetime.fromtimestamp(self.timestamps[index]),
+            "score": self.scores[index],
+            "notes": self.notes.get(index)
+        }
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """Entries as a list of dicts"""
+        return list(self)
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Dict[str, Any]]) -> "MoodSeries":
+        """Build a series from the old list-of-dicts form"""
+        series = cls()
+        for entry in sorted(entries, key=lambda entry: to_epoch(entry["timestamp"])):
+            series.append(entry["timestamp"], entry["score"], entry.get("notes"))
+        return series
+
+    def to_bytes(self) -> bytes:
+        """Encode the series; notes follow the arrays as JSON"""
+        notes = json.dumps({str(index): note for index, note in self.notes.items()}).encode("utf-8") if self.notes else b""
+        return _HEADER.pack(SERIES_FORMAT_VERSION, len(self.scores)) + _pack_columns((self.timestamps, self.scores)) + notes
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "MoodSeries":
+        """Decode a series written by to_bytes()"""
+        count = _read_header(data)
+        series = cls()
+        (series.timestamps, series.scores), offset = _unpack_columns(data, _HEADER.size, count, "qd")
+        if offset < len(data):
+            series.notes = {int(index): note for index, note in json.loads(data[offset:]).items()}
+        return series
+
+
+class SessionHistoryIndex:
+    """
+    Capped index of session interactions.
+
+    Each interaction is stored as its time, session id and the ids of the user and AI
+    messages in therapy_messages, rather than a copy of the message text. Only the
+    most recent `max_entries` interactions are kept.
+    """
+
+    __slots__ = ("timestamps", "session_ids", "user_message_ids", "ai_message_ids", "max_entries")
+
+    def __init__(self, max_entries: int = SESSION_HISTORY_MAX):
+        self.timestamps = array("q")
+        self.session_ids = array("q")
+        self.user_message_ids = array("q")
+        self.ai_message_ids = array("q")
+        self.max_entries = max_entries
+
+    def _columns(self) -> Tuple[array, array, array, array]:
+        return self.timestamps, self.session_ids, self.user_message_ids, self.ai_message_ids
+
+    def append(self, timestamp: Any, session_id: Any, user_message_id: Any = None, ai_message_id: Any = None) -> None:
+        """Record an interaction, dropping the oldest if over the cap"""
+        values = (to_epoch(timestamp), to_id(session_id), to_id(user_message_id), to_id(ai_message_id))
+        for column, value in zip(self._columns(), values):
+            column.append(value)
+        excess = len(self.timestamps) - self.max_entries
+        if excess > 0:
+            for column in self._columns():
+                del column[:excess]
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for index in range(len(self.timestamps)):
+            yield {
+                "timestamp": datetime.fromtimestamp(self.timestamps[index]),
+                "session_id": self._optional(self.session_ids[index]),
+                "user_message_id": self._optional(self.user_message_ids[index]),
+                "ai_message_id": self._optional(self.ai_message_ids[index])
+            }
+
+    @staticmethod
+    def _optional(value: int) -> Optional[int]:
+        return None if value == NO_ID else value
+
+    def message_ids(self, session_id: Optional[int] = None) -> List[int]:
+        """Ids of the recorded messages, optionally for one session, oldest first"""
+        ids = []
+        for index in range(len(self.timestamps)):
+            if session_id is None or self.session_ids[index] == session_id:
+                ids.extend(i for i in (self.user_message_ids[index], self.ai_message_ids[index]) if i != NO_ID)
+        return ids
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Dict[str, Any]], max_entries: int = SESSION_HISTORY_MAX) -> "SessionHistoryIndex":
+        """Build an index from the old list-of-dicts form, keeping only ids"""
+        index = cls(max_entries)
+        for entry in entries:
+            message_ids = (entry.get("data") or {}).get("message_ids") or {}
+            index.append(entry["timestamp"], entry.get("session_id"), message_ids.get("user"), message_ids.get("ai"))
+        return index
+
+    def to_bytes(self) -> bytes:
+        """Encode the index"""
+        return _HEADER.pack(SERIES_FORMAT_VERSION, len(self.timestamps)) + _pack_columns(self._columns())
+
+    @classmethod
+    def from_bytes(cls, data: bytes, max_entries: int = SESSION_HISTORY_MAX) -> "SessionHistoryIndex":
+        """Decode an index written by to_bytes()"""
+        count = _read_header(data)
+        index = cls(max_entries)
+        columns, _ = _unpack_columns(data, _HEADER.size, count, "qqqq")
+        index.timestamps, index.session_ids, index.user_message_ids, index.ai_message_ids = columns
+        return index
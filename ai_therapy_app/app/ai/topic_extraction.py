@@ -0,0 +1,279 @@
+"""
+Topic and trigger extraction
+Finds the topics of user messages with spaCy in micro-batches on a pool of worker processes
+"""
+
+import atexit
+import importlib.util
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# spaCy and NLTK are imported by the workers; only check that they are installed here
+SPACY_AVAILABLE = importlib.util.find_spec("spacy") is not None
+NLTK_AVAILABLE = importlib.util.find_spec("nltk") is not None
+if not SPACY_AVAILABLE:
+    logger.error("spaCy is not installed. Topics will not be learned from conversations.")
+elif not NLTK_AVAILABLE:
+    logger.warning("NLTK is not installed. Topics will be learned without detecting triggers.")
+
+# Pool settings; by default half the cores, leaving the rest to the web and TTS workers
+TOPIC_WORKERS = int(os.getenv("TOPIC_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+TOPIC_BATCH_SIZE = int(os.getenv("TOPIC_BATCH_SIZE", 32))
+TOPIC_BATCH_WAIT = float(os.getenv("TOPIC_BATCH_WAIT", 2))
+TOPIC_MAX_QUEUE = int(os.getenv("TOPIC_MAX_QUEUE", 1000))
+TOPIC_SPACY_MODEL = os.getenv("TOPIC_SPACY_MODEL", "en_core_web_sm")
+
+# Scoring: a topic mentioned once gets the base interest, each further mention adds to it
+TOPIC_BASE_INTEREST = 0.5
+TOPIC_MENTION_INTEREST = 0.1
+TOPIC_MAX_PER_MESSAGE = 5
+# VADER compound score at or below which a sentence counts as a negative response
+NEGATIVE_SENTIMENT = -0.5
+
+# Per-process NLP state, set up by _init_worker
+_nlp = None
+_sentiment = None
+
+
+class ExtractionUnavailable(RuntimeError):
+    """Raised by a worker that could not load its spaCy model"""
+
+
+def _init_worker(model: str) -> None:
+    """Load this worker's spaCy pipeline and sentiment analyzer"""
+    global _nlp, _sentiment
+    try:
+        import spacy
+        # Noun chunks only need the tagger, parser and lemmatizer
+        _nlp = spacy.load(model, disable=["ner"])
+    except Exception as e:
+        # Raising here would make the pool fail every job without saying why
+        logger.error(f"Failed to load spaCy model {model} in topic worker {os.getpid()}: {e}")
+    try:
+        from nltk.sentiment.vader import SentimentIntensityAnalyzer
+        _sentiment = SentimentIntensityAnalyzer()
+    except Exception as e:
+        logger.warning(f"VADER sentiment is not available in topic worker {os.getpid()}: {e}")
+
+
+def _is_topic(token: Any) -> bool:
+    return token.is_alpha and not token.is_stop and token.pos_ in ("NOUN", "PROPN") and len(token.text) > 2
+
+
+def _extract_batch(texts: List[str]) -> List[Dict[str, Dict[str, Any]]]:
+    """Extract the topics of each message with this worker's pipeline"""
+    if _nlp is None:
+        raise ExtractionUnavailable(f"spaCy model {TOPIC_SPACY_MODEL} is not available")
+
+    results = []
+    for doc in _nlp.pipe(texts, batch_size=len(texts)):
+        sentences = []
+        for sentence in doc.sents:
+            topics = [chunk.root.lemma_.lower() for chunk in sentence.noun_chunks if _is_topic(chunk.root)]
+            if topics:
+                score = _sentiment.polarity_scores(sentence.text)["compound"] if _sentiment is not None else 0.0
+                sentences.append((topics, score))
+        results.append(score_topics(sentences))
+    return results
+
+
+def score_topics(sentences: Iterable[Tuple[List[str], float]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Turn (topics, sentiment) for each sentence of a message into `topics_discussed`.
+
+    Interest grows with the number of mentions. A topic's emotional intensity comes
+    from the most negative sentence it appeared in, on the 0-10 scale used for triggers.
+    """
+    mentions: Dict[str, int] = {}
+    lowest: Dict[str, float] = {}
+    for topics, sentiment in sentences:
+        for topic in topics:
+            mentions[topic] = mentions.get(topic, 0) + 1
+            lowest[topic] = min(lowest.get(topic, 0.0), sentiment)
+
+    top = sorted(mentions, key=lambda topic: (-mentions[topic], lowest[topic]))[:TOPIC_MAX_PER_MESSAGE]
+    return {
+        topic: {
+            "interest_level": min(1.0, TOPIC_BASE_INTEREST + TOPIC_MENTION_INTEREST * (mentions[topic] - 1)),
+            "negative_response": lowest[topic] <= NEGATIVE_SENTIMENT,
+            "emotional_intensity": round(-lowest[topic] * 10)
+        }
+        for topic in top
+    }
+
+
+class TopicExtractor:
+    """
+    Background extraction of topics from user messages.
+
+    `submit` only queues the message, so requests never wait on NLP. A dispatcher
+    thread groups queued messages into batches of up to `batch_size`, waiting at most
+    `batch_wait` seconds to fill one, and runs each batch through `nlp.pipe` on a
+    worker process. Up to two batches per worker are in flight at once; beyond that
+    the queue fills and new messages are dropped. Results are passed to
+    `on_result(user_id, topics_discussed)` on a separate thread.
+    """
+
+    def __init__(
+        self,
+        workers: int = TOPIC_WORKERS,
+        batch_size: int = TOPIC_BATCH_SIZE,
+        batch_wait: float = TOPIC_BATCH_WAIT,
+        max_queue: int = TOPIC_MAX_QUEUE,
+        executor=None,
+        extract: Callable[[List[str]], List[Dict[str, Dict[str, Any]]]] = _extract_batch
+    ):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.extract = extract
+        self.on_result: Optional[Callable[[Any, Dict[str, Dict[str, Any]]], None]] = None
+        self.available = executor is not None or SPACY_AVAILABLE
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._queue: "queue.Queue[Tuple[Any, str]]" = queue.Queue(maxsize=max_queue)
+        self._in_flight = threading.BoundedSemaphore(workers * 2)
+        # Profiles are updated off the pool's own callback thread, which only collects results
+        self._results = ThreadPoolExecutor(max_workers=1, thread_name_prefix="topic-results")
+        self._thread = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def configure(self, on_result: Optional[Callable[[Any, Dict[str, Dict[str, Any]]], None]] = None) -> None:
+        """Attach the callback that learns extracted topics"""
+        self.on_result = on_result
+
+    def start(self) -> None:
+        """Start the dispatcher thread and the worker pool, if spaCy is available"""
+        with self._lock:
+            if self._thread is not None or not self.available:
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="topic-extraction", daemon=True)
+            self._thread.start()
+        self._get_executor()
+
+    def submit(self, user_id: Any, text: str) -> bool:
+        """Queue a user message for extraction; returns False if it was not queued"""
+        if not self.available or not text or not text.strip():
+            return False
+        self.start()
+        try:
+            self._queue.put_nowait((user_id, text))
+        except queue.Full:
+            logger.warning("Topic extraction queue is full; dropping message")
+            return False
+        return True
+
+    def _get_executor(self):
+        """Start the worker pool on first use"""
+        with self._lock:
+            if self._executor is None:
+                # Spawned workers load their own model instead of inheriting the web process
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(TOPIC_SPACY_MODEL,)
+                )
+                logger.info(f"Topic extraction pool started with {self.workers} workers")
+            return self._executor
+
+    def _restart(self) -> None:
+        """Drop a broken pool so the next batch starts fresh workers"""
+        with self._lock:
+            if not self._owns_executor:
+                return
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _next_batch(self) -> List[Tuple[Any, str]]:
+        """Wait for a message, then collect more until the batch is full or batch_wait passes"""
+        try:
+            batch = [self._queue.get(timeout=1.0)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            batch = self._next_batch()
+            if batch:
+                self._dispatch(batch)
+
+    def _dispatch(self, batch: List[Tuple[Any, str]]) -> None:
+        # Wait while every worker already has batches queued
+        self._in_flight.acquire()
+        try:
+            future = self._get_executor().submit(self.extract, [text for _, text in batch])
+        except Exception as e:
+            self._in_flight.release()
+            logger.error(f"Error submitting topic extraction batch: {e}")
+            self._restart()
+            return
+        future.add_done_callback(lambda done: self._collect(batch, done))
+
+    def _collect(self, batch: List[Tuple[Any, str]], future) -> None:
+        self._in_flight.release()
+        try:
+            results = future.result()
+        except ExtractionUnavailable as e:
+            logger.error(f"Disabling topic extraction: {e}")
+            self.available = False
+            return
+        except BrokenProcessPool as e:
+            logger.error(f"Topic extraction pool failed, restarting: {e}")
+            self._restart()
+            return
+        except Exception as e:
+            logger.error(f"Error extracting topics from {len(batch)} messages: {e}")
+            return
+        try:
+            self._results.submit(self._apply, batch, results)
+        except RuntimeError:
+            # Shutting down
+            pass
+
+    def _apply(self, batch: List[Tuple[Any, str]], results: List[Dict[str, Dict[str, Any]]]) -> None:
+        for (user_id, _), topics in zip(batch, results):
+            if not topics or self.on_result is None:
+                continue
+            try:
+                self.on_result(user_id, topics)
+            except Exception as e:
+                logger.error(f"Error learning extracted topics: {e}")
+
+    def close(self) -> None:
+        """Stop the dispatcher and the worker pool; queued messages are dropped"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        self._stopped.set()
+        if thread is not None:
+            thread.join(timeout=5)
+        self._restart()
+        self._results.shutdown(wait=False)
+
+
+# Create global instance
+topic_extractor = TopicExtractor()
+atexit.register(topic_extractor.close)
@@ -1,13 +1,15 @@
 from typing import Any, List, Optional
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session
 
 from app.api.deps import get_current_user
-from app.db.session import get_db
+from app.db.session import SessionLocal, get_db
 from app.models.user import User
 from app.models.therapy import TherapySession, TherapyMessage, SessionStatus
+from app.services.message_classification import message_classification
+from app.utils.pagination import keyset_page
 from app.schemas.therapy import (
     TherapySession as TherapySessionSchema,
     TherapySessionCreate,
@@ -18,6 +20,27 @@ from app.schemas.therapy import (
 
 router = APIRouter()
 
+# Label messages saved through the API with their emotion, intent and technique in the background
+message_classification.watch(SessionLocal, TherapyMessage)
+
+# Response header carrying the cursor of the next page, absent on the last page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def paginate(response: Response, query, columns, cursor: Optional[str], limit: int, descending: bool = False,
+             skip: int = 0) -> list:
+    """Keyset-paginate a query and put the next page's cursor in the response headers; `skip` only applies without a cursor"""
+    try:
+        items, next_cursor = keyset_page(query, columns, cursor, limit, descending, offset=0 if cursor else skip)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return items
+
 
 @router.post("", response_model=TherapySessionSchema)
 def create_therapy_session(
@@ -45,8 +68,10 @@ def create_therapy_session(
 
 @router.get("", response_model=List[TherapySessionSchema])
 def read_sessions(
+    response: Response,
     db: Session = Depends(get_db),
-    skip: int = 0,
+    cursor: Optional[str] = None,
+    skip: int = Query(0, deprecated=True),
     limit: int = 100,
     status: Optional[SessionStatus] = None,
     start_date: Optional[datetime] = None,
@@ -54,7 +79,8 @@ def read_sessions(
     current_user: User = Depends(get_current_user),
 ) -> Any:
     """
-    Retrieve therapy sessions
+    Retrieve therapy sessions, newest first.
+    Pass the X-Next-Cursor header of a response as `cursor` to get the next page.
     """
     query = db.query(TherapySession).filter(TherapySession.user_id == current_user.id)
     
@@ -67,10 +93,7 @@ def read_sessions(
     if end_date:
         query = query.filter(TherapySession.scheduled_start <= end_date)
     
-    query = query.order_by(TherapySession.scheduled_start.desc())
-    sessions = query.offset(skip).limit(limit).all()
-    
-    return sessions
+    return paginate(response, query, (TherapySession.scheduled_start, TherapySession.id), cursor, limit, descending=True, skip=skip)
 
 
 @router.get("/{session_id}", response_model=TherapySessionSchema)
@@ -191,13 +214,16 @@ def create_therapy_message(
 def read_session_messages(
     *,
     db: Session = Depends(get_db),
+    response: Response,
     session_id: int,
-    skip: int = 0,
+    cursor: Optional[str] = None,
+    skip: int = Query(0, deprecated=True),
     limit: int = 100,
     current_user: User = Depends(get_current_user),
 ) -> Any:
     """
-    Get all messages from a therapy session
+    Get messages from a therapy session, oldest first.
+    Pass the X-Next-Cursor header of a response as `cursor` to get the next page.
     """
     session = db.query(TherapySession).filter(TherapySession.id == session_id).first()
     if not session:
@@ -211,13 +237,5 @@ def read_session_messages(
             detail="Not enough permissions"
         )
     
-    messages = (
-        db.query(TherapyMessage)
-        .filter(TherapyMessage.session_id == session_id)
-        .order_by(TherapyMessage.timestamp)
-        .offset(skip)
-        .limit(limit)
-        .all()
-    )
-    
-    return messages 
\ No newline at end of file
+    query = db.query(TherapyMessage).filter(TherapyMessage.session_id == session_id)
+    return paginate(response, query, (TherapyMessage.timestamp, TherapyMessage.id), cursor, limit, skip=skip) 
\ No newline at end of file
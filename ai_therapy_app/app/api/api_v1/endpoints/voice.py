@@ -4,22 +4,26 @@ import tempfile
 import os
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Body
+from fastapi import APIRouter, Depends, HTTPException, Request, status, UploadFile, File, Body
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 import speech_recognition as sr
-import pyttsx3
 import io
-from openai import OpenAI
 
 from app.api.deps import get_current_user
 from app.db.session import get_db, get_redis
 from app.core.config import settings
 from app.models.user import User
 from app.models.therapy import TherapySession, TherapyMessage, SessionType, SessionStatus
+from app.services.llm_client import llm_client
+from app.services.tts import tts_service
+from app.services.audio_codec import AUDIO_CODECS, negotiate_codec
 
 router = APIRouter()
 
+# pydantic reads the key from .env, which os.getenv alone would miss
+llm_client.configure(api_key=settings.LLM_API_KEY)
+
 
 @router.post("/transcribe", response_model=Dict[str, str])
 async def transcribe_audio(
@@ -65,6 +69,7 @@ async def transcribe_audio(
 @router.post("/synthesize", response_class=StreamingResponse)
 async def synthesize_speech(
     *,
+    request: Request,
     db: Session = Depends(get_db),
     text: str = Body(..., embed=True),
     voice_id: str = Body("default", embed=True),
@@ -73,55 +78,22 @@ async def synthesize_speech(
     """
     Convert text to speech and return audio stream
     """
-    try:
-        # Initialize text-to-speech engine
-        engine = pyttsx3.init()
-        
-        # Set voice if available
-        voices = engine.getProperty('voices')
-        for voice in voices:
-            if voice_id in voice.id:
-                engine.setProperty('voice', voice.id)
-                break
-        
-        # Set default properties
-        engine.setProperty('rate', 150)  # Speed of speech
-        engine.setProperty('volume', 1.0)  # Volume (0.0 to 1.0)
-        
-        # Create a bytes buffer for the audio
-        with io.BytesIO() as buffer:
-            # Save speech to buffer
-            engine.save_to_file(text, 'temp.wav')
-            engine.runAndWait()
-            
-            # Read the generated audio file
-            with open('temp.wav', 'rb') as audio_file:
-                buffer.write(audio_file.read())
-            
-            # Clean up
-            os.remove('temp.wav')
-            
-            # Return the audio as streaming response
-            buffer.seek(0)
-            return StreamingResponse(
-                buffer, 
-                media_type="audio/wav",
-                headers={"Content-Disposition": "attachment; filename=speech.wav"}
-            )
-    
-    except Exception as e:
-        # Clean up temp file if it exists
-        if os.path.exists('temp.wav'):
-            try:
-                os.remove('temp.wav')
-            except:
-                pass
-        
+    # Synthesis runs on the shared TTS worker pool, in the codec the client accepts
+    codec = negotiate_codec(request.headers.get("accept"))
+    audio = await tts_service.synthesize_async(text, None if voice_id == "default" else voice_id, codec)
+    if audio is None:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error synthesizing speech: {str(e)}"
+            detail="Error synthesizing speech"
         )
 
+    extension = AUDIO_CODECS[codec].get("container", "wav")
+    return StreamingResponse(
+        io.BytesIO(audio),
+        media_type=AUDIO_CODECS[codec]["mime"],
+        headers={"Content-Disposition": f"attachment; filename=speech.{extension}"}
+    )
+
 
 @router.post("/chat", response_model=Dict[str, Any])
 async def voice_chat(
@@ -180,9 +152,6 @@ async def voice_chat(
     db.commit()
     
     try:
-        # Initialize OpenAI client
-        client = OpenAI(api_key=settings.LLM_API_KEY)
-        
         # Get conversation history from Redis
         conversation_key = f"conversation:{current_user.id}:{session.id}"
         conversation_history = redis.lrange(conversation_key, 0, -1)
@@ -213,15 +182,14 @@ async def voice_chat(
             elif msg.startswith("assistant: "):
                 messages.append({"role": "assistant", "content": msg.replace("assistant: ", "")})
         
-        response = client.chat.completions.create(
+        # Awaiting the shared client keeps the event loop free during the call
+        ai_response = await llm_client.chat(
+            messages,
             model=settings.LLM_MODEL_NAME,
-            messages=messages,
             temperature=0.7,
             max_tokens=300,
         )
         
-        ai_response = response.choices[0].message.content
-        
         # Store AI message
         ai_message_obj = TherapyMessage(
             session_id=session.id,
@@ -0,0 +1,78 @@
+"""
+Identity cache
+Briefly remembers which user a session cookie belongs to, so id-only routes skip the users table
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from typing import Any, Optional
+
+IDENTITY_CACHE_TTL = float(os.getenv("IDENTITY_CACHE_TTL", 30))
+IDENTITY_CACHE_MAX_ENTRIES = int(os.getenv("IDENTITY_CACHE_MAX_ENTRIES", 10000))
+
+# Fields that never change after registration
+UserIdentity = namedtuple("UserIdentity", ["id", "email"])
+
+
+def cookie_key(cookie: Optional[str]) -> Optional[str]:
+    """Cache key for a session cookie; the cookie itself is never kept"""
+    if not cookie:
+        return None
+    return hashlib.sha256(cookie.encode("utf-8")).hexdigest()
+
+
+class IdentityCache:
+    """
+    LRU of session cookie -> UserIdentity, with a short TTL.
+
+    Only fields that cannot change are cached, so the TTL only bounds how long a
+    deleted account stays recognised.
+    """
+
+    def __init__(self, ttl: float = IDENTITY_CACHE_TTL, max_entries: int = IDENTITY_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()  # key -> (identity, expires)
+        self._lock = threading.Lock()
+
+    def get(self, key: Optional[str]) -> Optional[UserIdentity]:
+        """The identity cached for a cookie key, if it has not expired"""
+        if key is None or self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Optional[str], identity: UserIdentity) -> None:
+        """Remember the identity behind a cookie key"""
+        if key is None or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (identity, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Optional[str]) -> None:
+        """Forget one session, e.g. on logout"""
+        if key is None:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+# Create global instance
+identity_cache = IdentityCache()
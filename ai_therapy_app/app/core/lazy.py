@@ -0,0 +1,128 @@
+"""
+Lazy initialization helpers
+Defers expensive setup to first use or a background warm-up, and reports where import time goes
+"""
+
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Import time a worker may spend before serving, checked by the report below
+IMPORT_TIME_BUDGET_MS = int(os.getenv("IMPORT_TIME_BUDGET_MS", 1000))
+
+
+class LazyResource:
+    """
+    A value built on first use.
+
+    The factory runs at most once, even when several threads ask at the same time.
+    Attribute access is forwarded to the value, so a lazy client can stand in for
+    the client itself.
+    """
+
+    def __init__(self, factory: Callable[[], Any], name: Optional[str] = None):
+        self._factory = factory
+        self._name = name or getattr(factory, "__name__", "resource")
+        self._value = None
+        self._ready = False
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        """Whether the value has been built"""
+        return self._ready
+
+    def get(self) -> Any:
+        """Build the value if needed and return it"""
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    started = time.perf_counter()
+                    self._value = self._factory()
+                    self._ready = True
+                    logger.info(f"Initialized {self._name} in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return self._value
+
+    def reset(self) -> None:
+        """Forget the value so the next use builds it again"""
+        with self._lock:
+            self._value = None
+            self._ready = False
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+
+def warm_up(*steps: Callable[[], Any]) -> threading.Thread:
+    """Run initialization steps in a background thread, so the first request does not pay for them"""
+    def run():
+        started = time.perf_counter()
+        for step in steps:
+            try:
+                step()
+            except Exception as e:
+                logger.error(f"Warm-up step {getattr(step, '__name__', step)} failed: {e}")
+        logger.info(f"Warm-up finished in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def import_time_report(module: str, cwd: Optional[str] = None) -> Tuple[int, List[Tuple[str, int, int]]]:
+    """
+    Measure what importing a module costs, using the interpreter's -X importtime output.
+
+    Returns:
+        The total import time in microseconds, and (package, self_us, module_count)
+        per top-level package, most expensive first.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    packages: Dict[str, List[int]] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        # Self times add up without double counting nested imports
+        entry = packages.setdefault(name.strip().split(".")[0], [0, 0])
+        entry[0] += int(self_us)
+        entry[1] += 1
+
+    rows = sorted(((name, us, count) for name, (us, count) in packages.items()), key=lambda row: row[1], reverse=True)
+    return sum(row[1] for row in rows), rows
+
+
+def main() -> int:
+    """Print an import-time report for a module and check it against the budget"""
+    parser = argparse.ArgumentParser(description="Report per-package import time for a module")
+    parser.add_argument("module", help="Module to import, e.g. web_app")
+    parser.add_argument("--budget-ms", type=int, default=IMPORT_TIME_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=20, help="Number of packages to list")
+    args = parser.parse_args()
+
+    total, rows = import_time_report(args.module, cwd=os.getcwd())
+    print(f"{'package':<32}{'ms':>10}{'modules':>10}")
+    for name, self_us, count in rows[:args.top]:
+        print(f"{name:<32}{self_us / 1000:>10.1f}{count:>10}")
+    print(f"\nImporting {args.module} took {total / 1000:.0f} ms (budget {args.budget_ms} ms)")
+    return 0 if total / 1000 <= args.budget_ms else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""
+Fingerprinted static assets
+Builds content-hashed names and gzip/brotli copies of static files, and serves them with immutable caching
+"""
+
+import gzip
+import hashlib
+import importlib.util
+import json
+import logging
+import mimetypes
+import os
+from typing import Dict, List, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+BROTLI_AVAILABLE = importlib.util.find_spec("brotli") is not None
+if not BROTLI_AVAILABLE:
+    logger.warning("brotli is not installed. Static assets will only be precompressed with gzip.")
+
+# Build output, inside the static folder
+ASSET_BUILD_DIR = "build"
+ASSET_MANIFEST = "manifest.json"
+# Hashed names never change content, so browsers may keep them for a year without revalidating
+ASSET_MAX_AGE = int(os.getenv("ASSET_MAX_AGE", 60 * 60 * 24 * 365))
+ASSET_HASH_LENGTH = 12
+
+# Text types worth compressing; images are already compressed
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".mjs", ".map", ".json", ".svg", ".txt", ".html", ".xml"}
+# Content-Encoding and file suffix, in server preference order
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def fingerprint(filename: str, digest: str) -> str:
+    """Insert a content hash before the extension: css/style.css -> css/style.<digest>.css"""
+    stem, extension = os.path.splitext(filename)
+    return f"{stem}.{digest}{extension}"
+
+
+def _digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()[:ASSET_HASH_LENGTH]
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        import brotli
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def build_assets(static_dir: str) -> Dict[str, str]:
+    """
+    Fingerprint every file under static_dir and precompress the text ones.
+
+    Writes the {original: hashed} manifest and the .br/.gz copies to static_dir/build,
+    removing copies of files that changed since the last build. Compressed copies are
+    only kept when they are smaller.
+    """
+    build_dir = os.path.join(static_dir, ASSET_BUILD_DIR)
+    encodings = [e for e in ENCODINGS if e[0] != "br" or BROTLI_AVAILABLE]
+    assets = {}
+    outputs = {os.path.join(build_dir, ASSET_MANIFEST)}
+    for folder, directories, files in os.walk(static_dir):
+        if os.path.abspath(folder) == os.path.abspath(static_dir) and ASSET_BUILD_DIR in directories:
+            directories.remove(ASSET_BUILD_DIR)
+        for name in files:
+            path = os.path.join(folder, name)
+            filename = os.path.relpath(path, static_dir).replace(os.sep, "/")
+            hashed = fingerprint(filename, _digest(path))
+            assets[filename] = hashed
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+                continue
+
+            data = None
+            for encoding, suffix in encodings:
+                target = os.path.join(build_dir, hashed + suffix)
+                outputs.add(target)
+                if os.path.exists(target):
+                    continue  # Same hash, same content
+                if data is None:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                compressed = _compress(data, encoding)
+                if len(compressed) < len(data):
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with open(target, "wb") as f:
+                        f.write(compressed)
+
+    # Drop copies of files that have since changed or been removed
+    for folder, _, files in os.walk(build_dir):
+        for name in files:
+            path = os.path.join(folder, name)
+            if path not in outputs:
+                os.remove(path)
+
+    os.makedirs(build_dir, exist_ok=True)
+    with open(os.path.join(build_dir, ASSET_MANIFEST), "w") as f:
+        json.dump({"assets": assets}, f, indent=2, sort_keys=True)
+        f.write("\n")
+    logger.info(f"Fingerprinted {len(assets)} static files")
+    return assets
+
+
+class StaticAssets:
+    """
+    Serves the output of build_assets from a Flask app.
+
+    url_for('static', filename=...) is rewritten to the hashed name. Requests for hashed
+    names get the original file, or its brotli/gzip copy when the client accepts it,
+    with `Cache-Control: immutable`, so repeat page loads make no static requests at
+    all. Files missing from the manifest are served by Flask's usual static handler,
+    and so are originals edited since the last build, whose hash no longer matches;
+    their URLs keep the plain name until the next build.
+    """
+
+    def __init__(self, app=None):
+        self.static_dir: Optional[str] = None
+        self.assets: Dict[str, str] = {}
+        self.originals: Dict[str, str] = {}
+        # Hashed name -> precompressed copies that exist, in preference order
+        self.encodings: Dict[str, List[Tuple[str, str]]] = {}
+        # Hashed name -> (mtime_ns, size) of the original when last checked, and whether its digest matched
+        self.verified: Dict[str, Tuple[Tuple[int, int], bool]] = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        """Load the manifest and take over the app's static endpoint"""
+        self.load(app.static_folder)
+        self._send_static_file = app.send_static_file
+        app.url_defaults(self._hash_url)
+        app.view_functions["static"] = self.serve
+        app.extensions["static_assets"] = self
+
+    def load(self, static_dir: str) -> None:
+        """Read the manifest written by build_assets, if there is one"""
+        self.static_dir = static_dir
+        build_dir = os.path.join(static_dir, ASSET_BUILD_DIR)
+        try:
+            with open(os.path.join(build_dir, ASSET_MANIFEST)) as f:
+                self.assets = json.load(f)["assets"]
+        except FileNotFoundError:
+            logger.info("No static asset manifest; run `python -m app.core.static_assets` to fingerprint static files")
+            self.assets = {}
+        self.originals = {hashed: filename for filename, hashed in self.assets.items()}
+        self.encodings = {}
+        self.verified = {}
+        for hashed in self.originals:
+            available = [
+                (encoding, os.path.join(build_dir, hashed + suffix))
+                for encoding, suffix in ENCODINGS
+                if os.path.exists(os.path.join(build_dir, hashed + suffix))
+            ]
+            if available:
+                self.encodings[hashed] = available
+
+    def _hash_url(self, endpoint: str, values: dict) -> None:
+        if endpoint == "static":
+            filename = values.get("filename")
+            hashed = self.assets.get(filename)
+            if hashed is not None and self._is_current(hashed, os.path.join(self.static_dir, filename)):
+                values["filename"] = hashed
+
+    def _is_current(self, filename: str, path: str) -> bool:
+        """Check that an original still has the content its hashed name promises, rehashing only after it changes"""
+        try:
+            info = os.stat(path)
+        except FileNotFoundError:
+            return False
+        signature = (info.st_mtime_ns, info.st_size)
+        checked = self.verified.get(filename)
+        if checked is not None and checked[0] == signature:
+            return checked[1]
+        current = fingerprint(self.originals[filename], _digest(path)) == filename
+        if not current:
+            logger.warning(f"{self.originals[filename]} changed since the last asset build; serving it uncached")
+        self.verified[filename] = (signature, current)
+        return current
+
+    def serve(self, filename: str):
+        """View for /static/<filename>"""
+        from flask import request, send_file
+
+        original = self.originals.get(filename)
+        if original is None:
+            return self._send_static_file(filename)
+
+        path, content_encoding = os.path.join(self.static_dir, original), None
+        if not self._is_current(filename, path):
+            return self._send_static_file(original)
+        variants = self.encodings.get(filename, [])
+        for encoding, variant_path in variants:
+            if request.accept_encodings[encoding]:
+                path, content_encoding = variant_path, encoding
+                break
+
+        mimetype = mimetypes.guess_type(original)[0] or "application/octet-stream"
+        response = send_file(path, mimetype=mimetype, max_age=ASSET_MAX_AGE, conditional=True)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        if content_encoding is not None:
+            response.headers["Content-Encoding"] = content_encoding
+        if variants:
+            response.vary.add("Accept-Encoding")
+        return response
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    build_assets(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "static"))
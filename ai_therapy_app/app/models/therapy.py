@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, String, Text, JSON, Integer, ForeignKey, Enum, DateTime
+from sqlalchemy import Boolean, Column, String, Text, JSON, Integer, ForeignKey, Enum, DateTime, Index
 from sqlalchemy.orm import relationship
 import enum
 from datetime import datetime
@@ -31,6 +31,7 @@ class SessionStatus(enum.Enum):
 
 class TherapySession(BaseModel):
     """Model for therapy sessions between user and AI"""
+    __table_args__ = (Index("ix_therapysession_user_start", "user_id", "scheduled_start", "id"),)
     
     user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
     session_type = Column(Enum(SessionType), nullable=False)
@@ -65,6 +66,7 @@ class TherapySession(BaseModel):
 
 class TherapyMessage(BaseModel):
     """Model for messages exchanged during therapy sessions"""
+    __table_args__ = (Index("ix_therapymessage_session_time", "session_id", "timestamp", "id"),)
     
     session_id = Column(Integer, ForeignKey("therapysession.id"), nullable=False)
     is_from_ai = Column(Boolean, default=False)
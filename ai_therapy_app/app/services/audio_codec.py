@@ -0,0 +1,134 @@
+"""
+Audio codecs for speech responses
+Encodes synthesized WAV audio to Opus/OGG or MP3 with PyAV and picks a codec from the client's Accept header
+"""
+
+import importlib.util
+import io
+import logging
+import os
+from base64 import b64encode
+from typing import Any, Dict, List, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# PyAV is imported on first encode; only check that it is installed here
+AV_AVAILABLE = importlib.util.find_spec("av") is not None
+if not AV_AVAILABLE:
+    logger.error("PyAV is not installed. Speech will only be sent as WAV.")
+
+# Codec used when the client does not ask for a specific audio type
+DEFAULT_AUDIO_CODEC = os.getenv("AUDIO_DEFAULT_CODEC", "mp3")
+
+# Speech-tuned encoder settings, in server preference order
+AUDIO_CODECS = {
+    "opus": {"mime": "audio/ogg", "container": "ogg", "encoder": "libopus", "rate": 48000, "bit_rate": 24000},
+    "mp3": {"mime": "audio/mpeg", "container": "mp3", "encoder": "libmp3lame", "rate": 22050, "bit_rate": 48000},
+    "wav": {"mime": "audio/wav"}
+}
+
+# Media types clients may list in Accept, mapped to codecs
+MIME_CODECS = {
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/wav": "wav",
+    "audio/wave": "wav",
+    "audio/x-wav": "wav"
+}
+
+
+def available_codecs() -> List[str]:
+    """Codecs this server can produce"""
+    return list(AUDIO_CODECS) if AV_AVAILABLE else ["wav"]
+
+
+def negotiate_codec(accept: Optional[str]) -> str:
+    """
+    Pick the audio codec for a response from an HTTP Accept header.
+
+    Audio media types are ranked by their q-value, then by server preference.
+    Headers that name no audio type, such as "application/json", get the default codec.
+    """
+    codecs = available_codecs()
+    default = DEFAULT_AUDIO_CODEC if DEFAULT_AUDIO_CODEC in codecs else "wav"
+
+    ranked = []
+    for part in (accept or "").split(","):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        media_type = media_type.lower()
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality <= 0:
+            continue
+        codec = default if media_type == "audio/*" else MIME_CODECS.get(media_type)
+        if codec in codecs:
+            ranked.append((-quality, codecs.index(codec), codec))
+
+    return min(ranked)[2] if ranked else default
+
+
+def encode_audio(wav: bytes, codec: str) -> bytes:
+    """Encode WAV audio with the given codec, as mono at a speech-friendly bit rate"""
+    if codec == "wav":
+        return wav
+    if not AV_AVAILABLE:
+        raise RuntimeError("PyAV is not installed")
+    import av
+
+    spec = AUDIO_CODECS[codec]
+    output_buffer = io.BytesIO()
+    with av.open(io.BytesIO(wav), format="wav") as source, \
+            av.open(output_buffer, mode="w", format=spec["container"]) as output:
+        stream = output.add_stream(spec["encoder"], rate=spec["rate"])
+        stream.codec_context.layout = "mono"
+        stream.codec_context.bit_rate = spec["bit_rate"]
+        # Open now so the encoder's frame size is known
+        stream.codec_context.open()
+
+        resampler = av.AudioResampler(format=stream.codec_context.format.name, layout="mono", rate=spec["rate"])
+        # Encoders such as Opus only take frames of a fixed size
+        fifo = av.AudioFifo()
+        frame_size = stream.codec_context.frame_size or 1024
+
+        def encode(frames):
+            for frame in frames:
+                frame.pts = None
+                fifo.write(frame)
+            while fifo.samples >= frame_size:
+                output.mux(stream.encode(fifo.read(frame_size)))
+
+        for frame in source.decode(audio=0):
+            encode(resampler.resample(frame))
+        encode(resampler.resample(None))
+        if fifo.samples:
+            output.mux(stream.encode(fifo.read()))
+        output.mux(stream.encode(None))
+
+    return output_buffer.getvalue()
+
+
+def audio_payload(audio: Optional[bytes], codec: str) -> Dict[str, Any]:
+    """Build the JSON fields that carry encoded audio; the one place audio is base64-encoded"""
+    return {
+        "audio": b64encode(audio).decode("utf-8") if audio else None,
+        "audio_format": codec,
+        "audio_mime": AUDIO_CODECS[codec]["mime"]
+    }
+
+
+def audio_reference(audio_id: Optional[str], codec: str, audio_url: Optional[str]) -> Dict[str, Any]:
+    """Build the JSON fields that point clients at audio rendered in the background"""
+    return {
+        "audio_id": audio_id,
+        "audio_url": audio_url,
+        "audio_format": codec,
+        "audio_mime": AUDIO_CODECS[codec]["mime"]
+    }
@@ -0,0 +1,202 @@
+"""
+Therapist avatar registry
+Loads the avatar manifest once and indexes it by id and by gender and ethnicity
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "static")
+AVATAR_MANIFEST_PATH = os.getenv("AVATAR_MANIFEST_PATH", os.path.join(STATIC_DIR, "images", "avatars", "manifest.json"))
+# Directories under static/ scanned for avatars; earlier ones win when both have the same picture
+AVATAR_DIRECTORIES = ("images/avatars", "images/therapist_avatars")
+DEFAULT_AVATAR_ID = "13"
+
+# Resized WebP/AVIF copies made by create_avatars.py, and their manifest
+DERIVATIVES_DIR = "images/avatar_derivatives"
+DERIVATIVES_MANIFEST_PATH = os.getenv(
+    "AVATAR_DERIVATIVES_MANIFEST_PATH", os.path.join(STATIC_DIR, DERIVATIVES_DIR, "manifest.json")
+)
+AVATAR_WIDTHS = tuple(int(w) for w in os.getenv("AVATAR_WIDTHS", "160,320,640").split(","))
+
+GENDERS = ("male", "female")
+# Display order of ethnicity groups; others found on disk are listed after these
+ETHNICITIES = ("caucasian", "african_american", "asian", "hispanic", "middle_eastern", "south_asian")
+# Older file names that mean the same group
+ETHNICITY_ALIASES = {"african": "african_american"}
+
+_AVATAR_FILE = re.compile(r"^(?P<gender>male|female)_(?P<ethnicity>[a-z_]+)_(?P<number>\d+)\.(?:jpe?g|png)$")
+
+
+def scan_avatars(
+    static_dir: str = STATIC_DIR,
+    directories: Iterable[str] = AVATAR_DIRECTORIES,
+    existing: Iterable[Dict[str, Any]] = ()
+) -> List[Dict[str, Any]]:
+    """
+    List avatar pictures named {gender}_{ethnicity}_{n} under the given directories.
+
+    Avatars already in `existing` keep their id and name, so users' saved choices stay
+    valid; new pictures get the next free id.
+    """
+    known = {(a["gender"], a["ethnicity"], a["number"]): a for a in existing}
+    next_id = max((int(a["id"]) for a in existing), default=0) + 1
+    avatars: Dict[Tuple[str, str, int], Dict[str, Any]] = {}
+    for directory in directories:
+        root = os.path.join(static_dir, directory)
+        for folder, _, files in sorted(os.walk(root)):
+            for filename in sorted(files):
+                match = _AVATAR_FILE.match(filename)
+                if not match:
+                    continue
+                ethnicity = ETHNICITY_ALIASES.get(match["ethnicity"], match["ethnicity"])
+                key = (match["gender"], ethnicity, int(match["number"]))
+                if key in avatars:
+                    continue
+                previous = known.get(key)
+                if previous is None:
+                    avatar_id, name = str(next_id), f"Therapist {next_id}"
+                    next_id += 1
+                    logger.info(f"New avatar {filename} added as {name}; set its name in the manifest")
+                else:
+                    avatar_id, name = previous["id"], previous["name"]
+                avatars[key] = {
+                    "id": avatar_id,
+                    "name": name,
+                    "gender": key[0],
+                    "ethnicity": ethnicity,
+                    "number": key[2],
+                    "path": os.path.relpath(os.path.join(folder, filename), static_dir).replace(os.sep, "/")
+                }
+    return sorted(avatars.values(), key=lambda a: int(a["id"]))
+
+
+def write_manifest(path: str = AVATAR_MANIFEST_PATH, static_dir: str = STATIC_DIR) -> List[Dict[str, Any]]:
+    """Rescan the avatar directories and rewrite the manifest, keeping existing ids and names"""
+    existing = []
+    if os.path.exists(path):
+        with open(path) as f:
+            existing = json.load(f)["avatars"]
+    avatars = scan_avatars(static_dir, existing=existing)
+    with open(path, "w") as f:
+        json.dump({"avatars": avatars}, f, indent=2)
+        f.write("\n")
+    return avatars
+
+
+def file_hash(path: str) -> str:
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def derivative_widths(source_width: int, widths: Iterable[int] = AVATAR_WIDTHS) -> List[int]:
+    """Widths to render a picture at: the standard ones below its own width, and never larger than it"""
+    widths = sorted(widths)
+    sizes = [w for w in widths if w < source_width]
+    largest = min(source_width, widths[-1])
+    if largest not in sizes:
+        sizes.append(largest)
+    return sizes
+
+
+def load_derivatives(path: str = DERIVATIVES_MANIFEST_PATH) -> Dict[str, Dict[str, Any]]:
+    """Derivatives by source picture path, or nothing if they have not been generated"""
+    try:
+        with open(path) as f:
+            return json.load(f)["images"]
+    except FileNotFoundError:
+        return {}
+
+
+class AvatarRegistry:
+    """
+    Read-only index of therapist avatars.
+
+    `catalog` is the {gender: {ethnicity: [avatar, ...]}} structure the avatar pickers
+    render, built once and shared by every request; callers must not modify it. Each
+    avatar's `sources` lists its resized copies by type, for <picture> srcsets.
+    """
+
+    def __init__(
+        self,
+        avatars: Iterable[Dict[str, Any]],
+        default_id: str = DEFAULT_AVATAR_ID,
+        derivatives: Optional[Dict[str, Dict[str, Any]]] = None
+    ):
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        self.by_group: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        derivatives = derivatives or {}
+        for avatar in avatars:
+            avatar["sources"] = derivatives.get(avatar["path"], {}).get("sources", [])
+            self.by_id[avatar["id"]] = avatar
+            self.by_group.setdefault((avatar["gender"], avatar["ethnicity"]), []).append(avatar)
+        for group in self.by_group.values():
+            group.sort(key=lambda a: a["number"])
+
+        order = {ethnicity: index for index, ethnicity in enumerate(ETHNICITIES)}
+        self.catalog: Dict[str, Dict[str, List[Dict[str, Any]]]] = {gender: {} for gender in GENDERS}
+        for gender, ethnicity in sorted(self.by_group, key=lambda g: (order.get(g[1], len(order)), g[1])):
+            self.catalog.setdefault(gender, {})[ethnicity] = self.by_group[(gender, ethnicity)]
+
+        self.default = self.by_id.get(default_id) or next(iter(self.by_id.values()), None)
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def get(self, avatar_id: Any) -> Optional[Dict[str, Any]]:
+        """The avatar with this id, if any"""
+        return self.by_id.get(str(avatar_id))
+
+    def select(self, gender: Optional[str], ethnicity: Optional[str], avatar_id: Any = None) -> Optional[Dict[str, Any]]:
+        """The chosen avatar, else the first of the chosen group, else the default"""
+        group = self.by_group.get((gender, ethnicity))
+        if not group:
+            return self.default
+        avatar = self.get(avatar_id)
+        if avatar is not None and avatar["gender"] == gender and avatar["ethnicity"] == ethnicity:
+            return avatar
+        return group[0]
+
+    def default_preferences(self) -> Dict[str, str]:
+        """Therapist preferences for users who have not chosen an avatar"""
+        if self.default is None:
+            return {}
+        return {"gender": self.default["gender"], "ethnicity": self.default["ethnicity"], "avatar_id": self.default["id"]}
+
+    @classmethod
+    def load(
+        cls,
+        path: str = AVATAR_MANIFEST_PATH,
+        static_dir: str = STATIC_DIR,
+        derivatives_path: str = DERIVATIVES_MANIFEST_PATH
+    ) -> "AvatarRegistry":
+        """Load the manifests, or scan the avatar directories if they have not been generated"""
+        try:
+            with open(path) as f:
+                avatars = json.load(f)["avatars"]
+        except FileNotFoundError:
+            logger.warning(f"Avatar manifest {path} not found; scanning {static_dir} instead")
+            avatars = scan_avatars(static_dir)
+        registry = cls(avatars, derivatives=load_derivatives(derivatives_path))
+        logger.info(f"Loaded {len(registry)} therapist avatars")
+        return registry
+
+
+# Create global instance
+avatar_registry = AvatarRegistry.load()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(f"Wrote {len(write_manifest())} avatars to {AVATAR_MANIFEST_PATH}")
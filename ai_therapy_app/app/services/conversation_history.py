@@ -0,0 +1,176 @@
+"""
+Token-budgeted conversation history
+Fits conversation turns into a prompt token budget and folds older turns into a running summary
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Prompt budget settings
+PROMPT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", 3000))
+TOKENIZER_NAME = os.getenv("LLM_TOKENIZER", "gpt2")
+# Optional path to a tokenizer.json, so hosts without network access need no download
+TOKENIZER_FILE = os.getenv("LLM_TOKENIZER_FILE", "")
+
+# Approximate per-message overhead added by the chat format
+MESSAGE_TOKEN_OVERHEAD = 4
+
+
+class TokenCounter:
+    """
+    Counts tokens with a Hugging Face tokenizer, estimating when none is loaded.
+
+    The tokenizer is read from tokenizer_file when there is one, and otherwise may be
+    downloaded, so it is loaded by start() during warm-up. A count before that starts
+    the load in the background and estimates meanwhile instead of waiting on it.
+    """
+
+    def __init__(self, tokenizer_name: str = TOKENIZER_NAME, tokenizer_file: str = TOKENIZER_FILE):
+        self.tokenizer_name = tokenizer_name
+        self.tokenizer_file = tokenizer_file
+        self._tokenizer = None
+        self._loaded = False
+        self._loading = False
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Load the tokenizer ahead of the first request"""
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                from tokenizers import Tokenizer
+                if self.tokenizer_file and os.path.exists(self.tokenizer_file):
+                    self._tokenizer = Tokenizer.from_file(self.tokenizer_file)
+                else:
+                    self._tokenizer = Tokenizer.from_pretrained(self.tokenizer_name)
+                logger.info(f"Loaded tokenizer '{self.tokenizer_file or self.tokenizer_name}' for prompt budgeting")
+            except Exception as e:
+                logger.warning(f"Could not load tokenizer '{self.tokenizer_file or self.tokenizer_name}': {e}. Estimating token counts.")
+            self._loaded = True
+
+    def _start_in_background(self) -> None:
+        """Load the tokenizer off the request path if warm-up did not"""
+        with self._lock:
+            if self._loaded or self._loading:
+                return
+            self._loading = True
+        threading.Thread(target=self.start, name="tokenizer-load", daemon=True).start()
+
+    def count(self, text: str) -> int:
+        """Count the tokens in a piece of text"""
+        if not self._loaded:
+            self._start_in_background()
+        elif self._tokenizer is not None:
+            return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+        # Roughly four characters per token for English text
+        return max(1, len(text) // 4)
+
+    def count_messages(self, messages: List[Dict[str, str]]) -> int:
+        """Count the tokens in a list of chat messages"""
+        return sum(self.count(m["content"]) + MESSAGE_TOKEN_OVERHEAD for m in messages)
+
+
+class ConversationHistory:
+    """
+    Builds the conversation part of a prompt within a token budget.
+
+    Turns that no longer fit are handed to a background summarizer; once the summary
+    is ready it replaces them in the prompt. Until then they are simply left out, so
+    the request path never waits for a summary. Summaries live in the transcript
+    store so every worker shares them.
+    """
+
+    def __init__(
+        self,
+        store,
+        budget: int = PROMPT_TOKEN_BUDGET,
+        counter: Optional[TokenCounter] = None,
+        summarizer: Optional[Callable[[str, List[Dict[str, str]]], str]] = None
+    ):
+        self.store = store
+        self.budget = budget
+        self.counter = counter or TokenCounter()
+        self.summarizer = summarizer
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+
+    def _turn_tokens(self, turn: Dict[str, str]) -> int:
+        """Count a turn's tokens, caching the result on the turn"""
+        if "tokens" not in turn:
+            turn["tokens"] = self.counter.count(turn["content"]) + MESSAGE_TOKEN_OVERHEAD
+        return turn["tokens"]
+
+    def build_window(self, session_id: str, turns: List[Dict[str, str]], reserved_tokens: int = 0) -> List[Dict[str, str]]:
+        """
+        Select the messages to send for a session.
+
+        Args:
+            session_id: Unique identifier for the therapy session
+            turns: The session's transcript turns, oldest first, each with a "seq" number
+            reserved_tokens: Tokens already used by system prompts
+
+        Returns:
+            The summary (if any) followed by the most recent turns that fit the budget.
+        """
+        summary = self.store.get_summary(session_id)
+        candidates = [t for t in turns if t["seq"] > summary["covered"]]
+
+        summary_messages = []
+        if summary["text"]:
+            summary_messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation: {summary['text']}"
+            })
+        available = self.budget - reserved_tokens - self.counter.count_messages(summary_messages)
+
+        # Walk back from the newest turn; the newest turn is always kept
+        start = len(candidates)
+        used = 0
+        while start > 0:
+            cost = self._turn_tokens(candidates[start - 1])
+            if used + cost > available and start < len(candidates):
+                break
+            used += cost
+            start -= 1
+
+        if start > 0:
+            self._schedule_summary(session_id, summary, candidates[:start])
+
+        return summary_messages + [{"role": t["role"], "content": t["content"]} for t in candidates[start:]]
+
+    def _schedule_summary(self, session_id: str, summary: Dict, overflow: List[Dict[str, str]]) -> None:
+        """Fold overflowing turns into the summary off the request path"""
+        if self.summarizer is None:
+            return
+        with self._lock:
+            if session_id in self._pending:
+                # The next request reschedules whatever is still left over
+                return
+            self._pending[session_id] = self._executor.submit(self._summarize, session_id, summary, overflow)
+
+    def _summarize(self, session_id: str, summary: Dict, overflow: List[Dict[str, str]]) -> None:
+        """Run the summarizer and store the summary with the last turn it covers"""
+        try:
+            new_summary = self.summarizer(summary["text"], overflow)
+            if new_summary:
+                self.store.set_summary(session_id, {"text": new_summary, "covered": overflow[-1]["seq"]})
+            logger.info(f"Folded {len(overflow)} turns into the summary for session {session_id}")
+        except Exception as e:
+            logger.error(f"Error summarizing history for session {session_id}: {e}")
+        finally:
+            with self._lock:
+                self._pending.pop(session_id, None)
+
+    def wait_for_summaries(self, timeout: Optional[float] = None) -> None:
+        """Block until in-flight summaries finish"""
+        with self._lock:
+            futures = list(self._pending.values())
+        wait(futures, timeout=timeout)
@@ -0,0 +1,177 @@
+"""
+Shared LLM client for the Flask and FastAPI applications
+Keeps one keep-alive HTTP connection pool to the LLM API and caps concurrent requests
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import queue
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Connection pool and concurrency limits
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 20))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 10))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", 60))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+
+# Marks the end of a streamed completion
+_END_OF_STREAM = object()
+
+
+class LLMClient:
+    """
+    Async chat completion client that owns a dedicated event loop thread.
+
+    All requests run on that loop, so they share a single connection pool no matter
+    which thread or event loop they come from. Async callers await the async methods;
+    synchronous callers such as the Flask routes use the *_sync facade. Each app passes
+    its own API key through configure(); the environment is only a fallback.
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, api_key: Optional[str] = None):
+        self.max_concurrency = max_concurrency
+        self.api_key = api_key
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        """Start the event loop thread and connection pool on first use"""
+        with self._lock:
+            if self._loop is None:
+                # Imported here because the OpenAI SDK is slow to import
+                import httpx
+                from openai import AsyncOpenAI
+
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-client", daemon=True).start()
+
+                http_client = httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=LLM_MAX_CONNECTIONS,
+                        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+                    ),
+                    timeout=LLM_TIMEOUT
+                )
+                self._client = AsyncOpenAI(
+                    api_key=self.api_key or os.getenv("OPENAI_API_KEY") or os.getenv("LLM_API_KEY"),
+                    http_client=http_client
+                )
+                self._semaphore = asyncio.run_coroutine_threadsafe(self._create_semaphore(), loop).result()
+                self._loop = loop
+                logger.info(f"LLM client started (max concurrency {self.max_concurrency})")
+        return self._loop
+
+    def configure(self, api_key: Optional[str] = None) -> None:
+        """Set the API key used once the connection pool starts"""
+        with self._lock:
+            if self._loop is not None:
+                logger.warning("LLM client already started; the new API key applies once it is closed and restarted")
+            self.api_key = api_key or self.api_key
+
+    def start(self) -> None:
+        """Start the event loop and connection pool ahead of the first request"""
+        self._ensure_started()
+
+    async def _create_semaphore(self) -> asyncio.Semaphore:
+        """Create the concurrency semaphore on the client's own loop"""
+        return asyncio.Semaphore(self.max_concurrency)
+
+    async def _complete(self, messages: List[Dict[str, str]], params: Dict[str, Any]) -> str:
+        """Request a full completion and return its text"""
+        async with self._semaphore:
+            response = await self._client.chat.completions.create(messages=messages, **params)
+        return response.choices[0].message.content
+
+    async def _pump_stream(self, messages: List[Dict[str, str]], params: Dict[str, Any], emit) -> None:
+        """Request a streamed completion and pass each text fragment to emit()"""
+        try:
+            async with self._semaphore:
+                stream = await self._client.chat.completions.create(messages=messages, stream=True, **params)
+                async for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        emit(delta)
+        except Exception as e:
+            emit(e)
+        finally:
+            emit(_END_OF_STREAM)
+
+    async def chat(self, messages: List[Dict[str, str]], **params: Any) -> str:
+        """Get a chat completion without blocking the caller's event loop"""
+        future = asyncio.run_coroutine_threadsafe(self._complete(messages, params), self._ensure_started())
+        return await asyncio.wrap_future(future)
+
+    async def stream(self, messages: List[Dict[str, str]], **params: Any) -> AsyncIterator[str]:
+        """Stream a chat completion, yielding text fragments as they arrive"""
+        caller_loop = asyncio.get_running_loop()
+        fragments = asyncio.Queue()
+
+        def emit(item):
+            caller_loop.call_soon_threadsafe(fragments.put_nowait, item)
+
+        future = asyncio.run_coroutine_threadsafe(
+            self._pump_stream(messages, params, emit), self._ensure_started()
+        )
+        try:
+            while True:
+                item = await fragments.get()
+                if item is _END_OF_STREAM:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+    def chat_sync(self, messages: List[Dict[str, str]], timeout: Optional[float] = LLM_TIMEOUT, **params: Any) -> str:
+        """Blocking facade over chat() for synchronous callers"""
+        future = asyncio.run_coroutine_threadsafe(self._complete(messages, params), self._ensure_started())
+        try:
+            return future.result(timeout)
+        finally:
+            future.cancel()
+
+    def stream_sync(self, messages: List[Dict[str, str]], **params: Any) -> Iterator[str]:
+        """Blocking facade over stream() for synchronous callers"""
+        fragments = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(
+            self._pump_stream(messages, params, fragments.put), self._ensure_started()
+        )
+        try:
+            while True:
+                item = fragments.get(timeout=LLM_TIMEOUT)
+                if item is _END_OF_STREAM:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Stops the request if the consumer goes away mid-stream
+            future.cancel()
+
+    def close(self) -> None:
+        """Close the connection pool and stop the event loop thread"""
+        with self._lock:
+            if self._loop is None:
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(self._client.close(), self._loop).result(5)
+            except Exception as e:
+                logger.error(f"Error closing LLM client: {e}")
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+
+
+# Create global instance
+llm_client = LLMClient()
+atexit.register(llm_client.close)
@@ -0,0 +1,202 @@
+"""
+Message classification service
+Labels newly committed therapy messages in micro-batches on a background thread
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.ai.message_classifier import MessageClassifier
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Batching settings; a message waits at most CLASSIFIER_MAX_DELAY seconds for its batch to fill
+CLASSIFIER_BATCH_SIZE = int(os.getenv("CLASSIFIER_BATCH_SIZE", 64))
+CLASSIFIER_MAX_DELAY = float(os.getenv("CLASSIFIER_MAX_DELAY", 1.0))
+CLASSIFIER_MAX_QUEUE = int(os.getenv("CLASSIFIER_MAX_QUEUE", 5000))
+
+# Key in Session.info for messages flushed in the current transaction
+_PENDING_KEY = "messages_to_classify"
+
+
+class MessageClassificationService:
+    """
+    Fills in the emotion, intent and therapy_technique of messages after they are saved.
+
+    `watch` hooks a sessionmaker so every committed message is queued, whichever route
+    created it; rolled back messages are never queued. Several sessionmakers may be
+    watched, and labels are written back through the one that saved the message. A background thread takes
+    batches of up to `batch_size`, closing a batch once its oldest message has waited
+    `max_delay` seconds, classifies them together and writes the labels back with one
+    bulk update. When the queue is full new messages are dropped rather than slowing
+    requests down.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = CLASSIFIER_BATCH_SIZE,
+        max_delay: float = CLASSIFIER_MAX_DELAY,
+        max_queue: int = CLASSIFIER_MAX_QUEUE
+    ):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.classifier: Optional[MessageClassifier] = None
+        # Model -> sessionmaker its labels are written through; submits without a model use self.model
+        self.session_factories: Dict[Any, Any] = {}
+        self.model = None
+        # Cleared when no trained model exists, so later submits do not look for it again
+        self.available = True
+        self._queue: "queue.Queue[Tuple[int, str, bool, float, Any]]" = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {"classified": 0, "batches": 0, "dropped": 0, "failed": 0, "total_latency": 0.0, "max_latency": 0.0}
+
+    def configure(self, session_factory=None, model=None, classifier: Optional[MessageClassifier] = None) -> None:
+        """Set where labels are written by default, and optionally the classifier instead of the saved one"""
+        if model is not None:
+            self.model = model
+            self.session_factories[model] = session_factory
+        if classifier is not None:
+            self.classifier = classifier
+
+    def watch(self, session_factory, model) -> None:
+        """Queue every `model` row committed through sessions from `session_factory`"""
+        from sqlalchemy import event
+
+        self.session_factories[model] = session_factory
+        if self.model is None:
+            self.model = model
+
+        @event.listens_for(session_factory, "after_flush")
+        def collect(session, flush_context):
+            pending = [(obj.id, obj.content, bool(obj.is_from_ai)) for obj in session.new if isinstance(obj, model)]
+            if pending:
+                session.info.setdefault(_PENDING_KEY, []).extend(pending)
+
+        @event.listens_for(session_factory, "after_commit")
+        def enqueue(session):
+            for message_id, content, is_from_ai in session.info.pop(_PENDING_KEY, []):
+                self.submit(message_id, content, is_from_ai, model)
+
+        @event.listens_for(session_factory, "after_rollback")
+        def forget(session):
+            session.info.pop(_PENDING_KEY, None)
+
+    def start(self) -> None:
+        """Load the classifier and start the background thread, if a trained model exists"""
+        with self._lock:
+            if self._thread is not None or not self.available:
+                return
+            if self.classifier is None:
+                self.classifier = MessageClassifier.load()
+                if self.classifier is None:
+                    logger.warning("No trained message classifier found; messages will not be classified")
+                    self.available = False
+                    return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="message-classification", daemon=True)
+            self._thread.start()
+
+    def submit(self, message_id: int, content: str, is_from_ai: bool, model=None) -> bool:
+        """Queue a saved `model` row, starting the service on first use; returns False if it will not be classified"""
+        if not content:
+            return False
+        self.start()
+        if self._thread is None:
+            return False
+        try:
+            self._queue.put_nowait((message_id, content, is_from_ai, time.monotonic(), model if model is not None else self.model))
+        except queue.Full:
+            with self._lock:
+                self._stats["dropped"] += 1
+            return False
+        return True
+
+    def _next_batch(self) -> List[Tuple[int, str, bool, float, Any]]:
+        """Wait for a message, then collect more until the batch is full or the oldest is due"""
+        try:
+            batch = [self._queue.get(timeout=1.0)]
+        except queue.Empty:
+            return []
+        deadline = batch[0][3] + self.max_delay
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            batch = self._next_batch()
+            if batch:
+                self.classify_batch(batch)
+
+    def classify_batch(self, batch: List[Tuple[int, str, bool, float, Any]]) -> None:
+        """Classify queued messages together and bulk-update their rows, one update per model"""
+        try:
+            labels = self.classifier.predict([m[1] for m in batch], [m[2] for m in batch])
+            mappings = {}
+            for message, predicted in zip(batch, labels):
+                values = {column: value for column, value in predicted.items() if value is not None}
+                if values:
+                    mappings.setdefault(message[4], []).append({"id": message[0], **values})
+            for model, rows in mappings.items():
+                self._write(model, rows)
+        except Exception as e:
+            logger.error(f"Error classifying {len(batch)} messages: {e}")
+            with self._lock:
+                self._stats["failed"] += len(batch)
+            return
+
+        now = time.monotonic()
+        latencies = [now - message[3] for message in batch]
+        with self._lock:
+            self._stats["classified"] += len(batch)
+            self._stats["batches"] += 1
+            self._stats["total_latency"] += sum(latencies)
+            self._stats["max_latency"] = max(self._stats["max_latency"], *latencies)
+
+    def _write(self, model, mappings: List[Dict[str, Any]]) -> None:
+        session = self.session_factories[model]()
+        try:
+            session.bulk_update_mappings(model, mappings)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get throughput counters and the delay between saving and labelling a message"""
+        with self._lock:
+            stats = dict(self._stats)
+        total_latency = stats.pop("total_latency")
+        stats["queued"] = self._queue.qsize()
+        stats["mean_latency_ms"] = round(total_latency * 1000 / stats["classified"], 1) if stats["classified"] else 0.0
+        stats["max_latency_ms"] = round(stats.pop("max_latency") * 1000, 1)
+        return stats
+
+    def close(self) -> None:
+        """Stop the background thread; queued messages are left unlabelled"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        self._stopped.set()
+        if thread is not None:
+            thread.join(timeout=5)
+
+
+# Create global instance
+message_classification = MessageClassificationService()
+atexit.register(message_classification.close)
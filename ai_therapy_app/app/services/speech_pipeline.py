@@ -0,0 +1,100 @@
+"""
+Sentence-pipelined speech
+Splits streamed LLM text into sentences and synthesizes them while the rest of the reply is generated
+"""
+
+import logging
+import os
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Threads that wait on synthesis jobs; the work itself runs in the TTS worker pool
+SPEECH_PIPELINE_THREADS = int(os.getenv("SPEECH_PIPELINE_THREADS", 8))
+# Shorter sentences are joined to the next one rather than voiced on their own
+MIN_SENTENCE_CHARS = int(os.getenv("MIN_SENTENCE_CHARS", 20))
+
+# Sentence-ending punctuation, optionally followed by closing quotes or brackets, then whitespace
+SENTENCE_END = re.compile(r"[.!?…]+[\"')\]”’]*\s+")
+ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "prof", "st", "e.g", "i.e", "vs"}
+
+_executor = ThreadPoolExecutor(max_workers=SPEECH_PIPELINE_THREADS, thread_name_prefix="speech-pipeline")
+
+
+def split_sentences(text: str, final: bool = False) -> Tuple[List[str], str]:
+    """
+    Split complete sentences off the front of a text buffer.
+
+    Args:
+        text: Text received so far that has not been split yet
+        final: Whether the text is complete, so the remainder is a sentence too
+
+    Returns:
+        The complete sentences and the remainder still waiting for more text.
+    """
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        candidate = text[start:match.end()].strip()
+        last_word = candidate.rstrip(".!?…\"')]”’").split()[-1:] or [""]
+        if last_word[0].lower() in ABBREVIATIONS or len(candidate) < MIN_SENTENCE_CHARS:
+            continue
+        sentences.append(candidate)
+        start = match.end()
+
+    remainder = text[start:]
+    if final and remainder.strip():
+        sentences.append(remainder.strip())
+        remainder = ""
+    return sentences, remainder
+
+
+def speak_as_generated(
+    fragments: Iterable[str],
+    synthesize: Callable[[str], Optional[bytes]]
+) -> Iterator[Tuple[str, object]]:
+    """
+    Pass text fragments through while voicing each sentence as soon as it is complete.
+
+    Yields ("token", fragment) for every fragment as it arrives, and
+    ("audio", {"index", "text", "audio"}) for every sentence. Sentences are synthesized
+    concurrently but their audio is yielded in order, as soon as each one and all
+    earlier ones are ready.
+    """
+    pending = deque()
+    indexes = count()
+    buffer = ""
+
+    def submit(sentences):
+        for sentence in sentences:
+            pending.append((next(indexes), sentence, _executor.submit(synthesize, sentence)))
+
+    def ready(block):
+        while pending and (block or pending[0][2].done()):
+            index, sentence, future = pending.popleft()
+            try:
+                audio = future.result()
+            except Exception as e:
+                logger.error(f"Error synthesizing sentence {index}: {e}")
+                audio = None
+            yield "audio", {"index": index, "text": sentence, "audio": audio}
+
+    try:
+        for fragment in fragments:
+            yield "token", fragment
+            sentences, buffer = split_sentences(buffer + fragment)
+            submit(sentences)
+            yield from ready(block=False)
+
+        sentences, buffer = split_sentences(buffer, final=True)
+        submit(sentences)
+        yield from ready(block=True)
+    finally:
+        # Drop queued sentences if the client goes away mid-reply
+        for _, _, future in pending:
+            future.cancel()
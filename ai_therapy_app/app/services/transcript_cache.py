@@ -0,0 +1,245 @@
+"""
+Session transcript cache
+Keeps conversation transcripts in Redis, shared by all workers, with a bounded in-process tier in front
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.lazy import LazyResource
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Cache limits
+TRANSCRIPT_CACHE_MAX_SESSIONS = int(os.getenv("TRANSCRIPT_CACHE_MAX_SESSIONS", 500))
+TRANSCRIPT_CACHE_LOCAL_TTL = int(os.getenv("TRANSCRIPT_CACHE_LOCAL_TTL", 300))
+TRANSCRIPT_CACHE_REDIS_TTL = int(os.getenv("TRANSCRIPT_CACHE_REDIS_TTL", 60 * 60 * 24))
+TRANSCRIPT_MAX_TURNS = int(os.getenv("TRANSCRIPT_MAX_TURNS", 500))
+
+
+def make_turn(role: str, content: str, timestamp: Optional[datetime] = None, message_id: Optional[int] = None) -> Dict[str, Any]:
+    """Build a transcript turn"""
+    return {
+        "role": role,
+        "content": content,
+        "timestamp": (timestamp or datetime.now()).isoformat(),
+        "message_id": message_id
+    }
+
+
+class TranscriptCache:
+    """
+    Two-tier transcript cache.
+
+    Redis holds each session's turns and a sequence counter, so every worker sees the
+    same transcript. The local tier is an LRU with a TTL that only fetches turns newer
+    than the ones it already holds. On a miss the transcript is rebuilt by the loader.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = TRANSCRIPT_CACHE_MAX_SESSIONS,
+        local_ttl: int = TRANSCRIPT_CACHE_LOCAL_TTL,
+        redis_ttl: int = TRANSCRIPT_CACHE_REDIS_TTL,
+        max_turns: int = TRANSCRIPT_MAX_TURNS
+    ):
+        self.max_sessions = max_sessions
+        self.local_ttl = local_ttl
+        self.redis_ttl = redis_ttl
+        self.max_turns = max_turns
+        self._redis = None
+        self.loader = None
+        # session_id -> {"seq": last sequence number, "turns": [...], "summary": {...}, "expires": ts}
+        self._local = OrderedDict()
+        # Guards only the local tier; Redis and the loader are called without it
+        self._lock = threading.Lock()
+
+    def configure(self, redis_client=None, loader: Optional[Callable[[str], List[Dict[str, Any]]]] = None) -> None:
+        """
+        Attach the shared Redis client and the loader used to rebuild transcripts.
+        The client may be a LazyResource that resolves to a client, or to None when Redis is unreachable.
+        """
+        self._redis = redis_client
+        self.loader = loader
+
+    @property
+    def redis(self):
+        """The Redis client, connecting on first use, or None to stay local"""
+        if isinstance(self._redis, LazyResource):
+            return self._redis.get()
+        return self._redis
+
+    # --- Local tier ---
+
+    def _local_get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return a live local entry, refreshing its LRU position"""
+        entry = self._local.get(session_id)
+        if entry is None:
+            return None
+        if entry["expires"] < time.time():
+            del self._local[session_id]
+            return None
+        self._local.move_to_end(session_id)
+        return entry
+
+    def _local_put(self, session_id: str, seq: int, turns: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Store an entry locally unless a newer one is there, evicting the least recently used sessions"""
+        previous = self._local.get(session_id) or {}
+        if previous.get("seq", -1) > seq:
+            # Another thread stored later turns while this one was fetching
+            self._local.move_to_end(session_id)
+            return previous
+        entry = {
+            "seq": seq,
+            "turns": turns[-self.max_turns:],
+            "summary": previous.get("summary"),
+            "expires": time.time() + self.local_ttl
+        }
+        self._local[session_id] = entry
+        self._local.move_to_end(session_id)
+        while len(self._local) > self.max_sessions:
+            self._local.popitem(last=False)
+        return entry
+
+    # --- Redis tier ---
+
+    @staticmethod
+    def _keys(session_id: str) -> Dict[str, str]:
+        base = f"transcript:{session_id}"
+        return {"turns": base, "seq": f"{base}:seq", "summary": f"{base}:summary"}
+
+    def _load(self, session_id: str) -> List[Dict[str, Any]]:
+        """Load a transcript with the loader and number its turns"""
+        turns = self.loader(session_id) if self.loader else []
+        for seq, turn in enumerate(turns, start=1):
+            turn["seq"] = seq
+        return turns[-self.max_turns:]
+
+    def _rebuild(self, session_id: str) -> List[Dict[str, Any]]:
+        """Rebuild a transcript from the loader and publish it to Redis"""
+        turns = self._load(session_id)
+        if self.redis is not None:
+            keys = self._keys(session_id)
+            pipe = self.redis.pipeline()
+            pipe.delete(keys["turns"])
+            if turns:
+                pipe.rpush(keys["turns"], *[json.dumps(t) for t in turns])
+            pipe.set(keys["seq"], turns[-1]["seq"] if turns else 0)
+            pipe.expire(keys["turns"], self.redis_ttl)
+            pipe.expire(keys["seq"], self.redis_ttl)
+            pipe.execute()
+        return turns
+
+    def get(self, session_id: str) -> List[Dict[str, Any]]:
+        """Get a session's transcript turns, oldest first"""
+        with self._lock:
+            entry = self._local_get(session_id)
+        if self.redis is None:
+            if entry is None:
+                turns = self._rebuild(session_id)
+                with self._lock:
+                    entry = self._local_put(session_id, turns[-1]["seq"] if turns else 0, turns)
+            return entry["turns"]
+
+        keys = self._keys(session_id)
+        try:
+            remote_seq = self.redis.get(keys["seq"])
+            if remote_seq is None:
+                turns = self._rebuild(session_id)
+                remote_seq = turns[-1]["seq"] if turns else 0
+            else:
+                remote_seq = int(remote_seq)
+                if entry is not None and entry["seq"] == remote_seq:
+                    return entry["turns"]
+                if entry is not None and 0 < remote_seq - entry["seq"] <= self.max_turns:
+                    # Fetch only the turns other workers added since our copy
+                    raw = self.redis.lrange(keys["turns"], -(remote_seq - entry["seq"]), -1)
+                    turns = entry["turns"] + [json.loads(t) for t in raw]
+                else:
+                    turns = [json.loads(t) for t in self.redis.lrange(keys["turns"], 0, -1)]
+        except Exception as e:
+            logger.error(f"Transcript cache Redis error for session {session_id}: {e}")
+            if entry is not None:
+                return entry["turns"]
+            turns = self._load(session_id)
+            remote_seq = turns[-1]["seq"] if turns else 0
+        with self._lock:
+            return self._local_put(session_id, remote_seq, turns)["turns"]
+
+    def append(self, session_id: str, turn: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Append a turn to a session's transcript and return the updated turns"""
+        turns = self.get(session_id)
+        seq = None
+        if self.redis is not None:
+            keys = self._keys(session_id)
+            try:
+                seq = int(self.redis.incr(keys["seq"]))
+                pipe = self.redis.pipeline()
+                pipe.rpush(keys["turns"], json.dumps(dict(turn, seq=seq)))
+                pipe.ltrim(keys["turns"], -self.max_turns, -1)
+                pipe.expire(keys["turns"], self.redis_ttl)
+                pipe.expire(keys["seq"], self.redis_ttl)
+                pipe.execute()
+            except Exception as e:
+                logger.error(f"Transcript cache Redis error for session {session_id}: {e}")
+
+        with self._lock:
+            entry = self._local.get(session_id) or {"seq": turns[-1]["seq"] if turns else 0, "turns": turns}
+            if seq is None:
+                # Local only, so the next number is ours to take
+                seq = entry["seq"] + 1
+            if seq == entry["seq"] + 1:
+                return self._local_put(session_id, seq, entry["turns"] + [dict(turn, seq=seq)])["turns"]
+            # Another worker or thread appended meanwhile; refetch rather than guess
+            self._local.pop(session_id, None)
+        return self.get(session_id)
+
+    def get_summary(self, session_id: str) -> Dict[str, Any]:
+        """Get the running summary of a session and the last turn sequence it covers"""
+        with self._lock:
+            entry = self._local_get(session_id)
+            local_summary = entry["summary"] if entry is not None else None
+        if self.redis is not None:
+            try:
+                raw = self.redis.get(self._keys(session_id)["summary"])
+                if raw:
+                    return json.loads(raw)
+            except Exception as e:
+                logger.error(f"Transcript cache Redis error for session {session_id}: {e}")
+        return local_summary or {"text": "", "covered": 0}
+
+    def set_summary(self, session_id: str, summary: Dict[str, Any]) -> None:
+        """Store a session summary unless a newer one is already stored"""
+        if summary["covered"] <= self.get_summary(session_id)["covered"]:
+            return
+        with self._lock:
+            entry = self._local_get(session_id)
+            if entry is not None:
+                entry["summary"] = summary
+        if self.redis is not None:
+            try:
+                self.redis.set(self._keys(session_id)["summary"], json.dumps(summary), ex=self.redis_ttl)
+            except Exception as e:
+                logger.error(f"Transcript cache Redis error for session {session_id}: {e}")
+
+    def invalidate(self, session_id: str) -> bool:
+        """Drop a session from both tiers; returns True if it was cached locally"""
+        with self._lock:
+            found = self._local.pop(session_id, None) is not None
+        if self.redis is not None:
+            try:
+                self.redis.delete(*self._keys(session_id).values())
+            except Exception as e:
+                logger.error(f"Transcript cache Redis error for session {session_id}: {e}")
+        return found
+
+
+# Create global instance
+transcript_cache = TranscriptCache()
@@ -0,0 +1,407 @@
+"""
+Text-to-speech service
+Runs pyttsx3 engines in a pool of worker processes and returns WAV audio as bytes
+"""
+
+import asyncio
+import atexit
+import hashlib
+import hmac
+import importlib.util
+import logging
+import multiprocessing
+import os
+import secrets
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
+
+from app.core.lazy import LazyResource
+from app.services.audio_codec import encode_audio
+from app.services.tts_cache import audio_cache_key, tts_cache
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Pool settings
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", 2))
+TTS_MAX_QUEUE = int(os.getenv("TTS_MAX_QUEUE", 8))
+TTS_QUEUE_TIMEOUT = float(os.getenv("TTS_QUEUE_TIMEOUT", 5))
+TTS_TIMEOUT = float(os.getenv("TTS_TIMEOUT", 30))
+
+# Audio id registry settings
+TTS_AUDIO_IDS = int(os.getenv("TTS_AUDIO_IDS", 10000))
+TTS_AUDIO_ID_TTL = int(os.getenv("TTS_AUDIO_ID_TTL", 60 * 60 * 24 * 7))
+
+# Engine settings
+TTS_RATE = int(os.getenv("TTS_RATE", 150))  # Slightly slower speed for therapeutic responses
+TTS_VOLUME = float(os.getenv("TTS_VOLUME", 0.9))
+
+# Per-process engine state, set up by _init_worker
+_engine = None
+_default_voice = None
+_scratch_path = None
+
+
+def _init_worker(rate: int, volume: float) -> None:
+    """Create this worker's own pyttsx3 engine"""
+    global _engine, _default_voice, _scratch_path
+    try:
+        import pyttsx3
+        engine = pyttsx3.init()
+        engine.setProperty('rate', rate)
+        engine.setProperty('volume', volume)
+
+        voices = engine.getProperty('voices')
+        if voices:
+            # Use a female voice if available (often the second voice on macOS)
+            _default_voice = voices[1].id if len(voices) > 1 else voices[0].id
+            engine.setProperty('voice', _default_voice)
+        _engine = engine
+    except Exception as e:
+        # Raising here would make the pool respawn the worker forever
+        logger.error(f"Failed to initialize pyttsx3 in TTS worker {os.getpid()}: {e}")
+
+    # pyttsx3 can only render to a file, so each worker reuses one scratch file,
+    # kept in shared memory where the platform has it
+    scratch_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    _scratch_path = os.path.join(scratch_dir, f"tts-{os.getpid()}.wav")
+
+
+def _synthesize(text: str, voice_id: Optional[str] = None) -> bytes:
+    """Render text with this worker's engine and return the WAV bytes"""
+    if _engine is None:
+        raise RuntimeError("TTS engine is not available in this worker")
+
+    voice = _default_voice
+    if voice_id:
+        for candidate in _engine.getProperty('voices'):
+            if voice_id in candidate.id:
+                voice = candidate.id
+                break
+    if voice:
+        _engine.setProperty('voice', voice)
+
+    _engine.save_to_file(text, _scratch_path)
+    _engine.runAndWait()
+    with open(_scratch_path, 'rb') as f:
+        return f.read()
+
+
+class TTSService:
+    """
+    Pool of TTS worker processes.
+
+    pyttsx3 engines are not thread-safe, so every worker process owns one. At most
+    workers + max_queue jobs are accepted at once; further callers wait up to
+    queue_timeout for a slot. A job that runs past its timeout restarts the pool,
+    since a stuck engine cannot be interrupted. Rendered audio is cached by content,
+    so repeated phrases skip the workers entirely.
+
+    Background audio is handed out under ids that are an HMAC of its cache key and
+    owner, so they cannot be guessed from the reply text. Issued ids are registered
+    locally and, when configured, in Redis so any worker can resolve them; unknown
+    ids are rejected without touching the cache.
+    """
+
+    def __init__(
+        self,
+        workers: int = TTS_WORKERS,
+        max_queue: int = TTS_MAX_QUEUE,
+        queue_timeout: float = TTS_QUEUE_TIMEOUT,
+        timeout: float = TTS_TIMEOUT,
+        cache=tts_cache
+    ):
+        self.workers = workers
+        self.cache = cache
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self.available = importlib.util.find_spec("pyttsx3") is not None
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._pool = None
+        self._lock = threading.Lock()
+        # Background jobs by audio id; their threads only wait on the worker pool
+        self._jobs = {}
+        self._background = ThreadPoolExecutor(max_workers=workers + max_queue, thread_name_prefix="tts-background")
+        # Issued audio ids -> cache keys, most recently issued last
+        self._ids = OrderedDict()
+        self._redis = None
+        self._secret = (os.getenv("AUDIO_ID_SECRET") or os.getenv("SECRET_KEY") or secrets.token_hex(32)).encode("utf-8")
+        if not self.available:
+            logger.error("pyttsx3 is not installed. TTS will not be available.")
+
+    def configure(self, redis_client=None, secret: Optional[str] = None) -> None:
+        """
+        Attach the Redis client that shares issued audio ids between workers, and the id secret.
+        The client may be a LazyResource that resolves to a client, or to None when Redis is unreachable.
+        """
+        self._redis = redis_client
+        if secret:
+            self._secret = secret.encode("utf-8")
+
+    @property
+    def redis(self):
+        """The Redis client, connecting on first use, or None to stay local"""
+        if isinstance(self._redis, LazyResource):
+            return self._redis.get()
+        return self._redis
+
+    def _get_pool(self):
+        """Start the worker pool on first use"""
+        with self._lock:
+            if self._pool is None:
+                # Spawned workers avoid inheriting speech driver state from the parent
+                context = multiprocessing.get_context("spawn")
+                self._pool = context.Pool(
+                    processes=self.workers,
+                    initializer=_init_worker,
+                    initargs=(TTS_RATE, TTS_VOLUME)
+                )
+                logger.info(f"TTS worker pool started with {self.workers} workers")
+            return self._pool
+
+    def _restart(self) -> None:
+        """Terminate the pool so the next job starts fresh workers"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.terminate()
+
+    @staticmethod
+    def cache_key(text: str, voice_id: Optional[str] = None, codec: str = "wav") -> str:
+        """Key audio by everything that changes how it sounds"""
+        return audio_cache_key(text, voice_id or "default", TTS_RATE, codec)
+
+    def audio_id(self, key: str, owner: Optional[str] = None) -> str:
+        """The id audio is served under for one owner"""
+        message = f"{owner or ''}\x00{key}".encode("utf-8")
+        return hmac.new(self._secret, message, hashlib.sha256).hexdigest()
+
+    def _register(self, audio_id: str, key: str) -> None:
+        """Remember which cache key an issued id points at"""
+        with self._lock:
+            self._ids[audio_id] = key
+            self._ids.move_to_end(audio_id)
+            while len(self._ids) > TTS_AUDIO_IDS:
+                self._ids.popitem(last=False)
+        if self.redis is not None:
+            try:
+                self.redis.setex(f"tts:audio:{audio_id}", TTS_AUDIO_ID_TTL, key)
+            except Exception as e:
+                logger.error(f"Error registering audio {audio_id}: {e}")
+
+    def _unregister(self, key: str) -> None:
+        """Forget the ids of audio that will never be rendered"""
+        with self._lock:
+            audio_ids = [audio_id for audio_id, k in self._ids.items() if k == key]
+            for audio_id in audio_ids:
+                del self._ids[audio_id]
+        if self.redis is not None and audio_ids:
+            try:
+                self.redis.delete(*[f"tts:audio:{audio_id}" for audio_id in audio_ids])
+            except Exception as e:
+                logger.error(f"Error unregistering audio for {key}: {e}")
+
+    def _lookup(self, audio_id: str) -> Optional[str]:
+        """The cache key behind an issued id, or None if no worker issued it"""
+        with self._lock:
+            key = self._ids.get(audio_id)
+        if key is not None or self.redis is None:
+            return key
+        try:
+            key = self.redis.get(f"tts:audio:{audio_id}")
+        except Exception as e:
+            logger.error(f"Error looking up audio {audio_id}: {e}")
+            return None
+        return key.decode("utf-8") if isinstance(key, bytes) else key
+
+    def cached(self, text: str, voice_id: Optional[str] = None, codec: str = "wav") -> Optional[bytes]:
+        """Get previously rendered audio without synthesizing on a miss"""
+        if not text or self.cache is None:
+            return None
+        audio = self.cache.get(self.cache_key(text, voice_id, codec))
+        if audio is None and codec != "wav":
+            # Encoding cached WAV audio is far cheaper than rendering it again
+            wav = self.cache.get(self.cache_key(text, voice_id))
+            if wav is not None:
+                audio = self._encode(text, voice_id, wav, codec)
+        return audio
+
+    def _encode(self, text: str, voice_id: Optional[str], wav: bytes, codec: str) -> Optional[bytes]:
+        """Encode rendered WAV audio and cache the result"""
+        try:
+            audio = encode_audio(wav, codec)
+        except Exception as e:
+            logger.error(f"Error encoding speech as {codec}: {e}")
+            return None
+        if self.cache is not None:
+            self.cache.put(self.cache_key(text, voice_id, codec), audio)
+        return audio
+
+    def _render(self, text: str, voice_id: Optional[str], timeout: Optional[float]) -> Optional[bytes]:
+        """Render WAV audio on the worker pool and cache it"""
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            logger.warning("TTS queue is full; skipping speech for this response")
+            return None
+        try:
+            job = self._get_pool().apply_async(_synthesize, (text, voice_id))
+            audio = job.get(timeout if timeout is not None else self.timeout)
+            if audio and self.cache is not None:
+                self.cache.put(self.cache_key(text, voice_id), audio)
+            return audio
+        except multiprocessing.TimeoutError:
+            logger.error("TTS job timed out; restarting the worker pool")
+            self._restart()
+            return None
+        except Exception as e:
+            logger.error(f"Error generating speech: {e}")
+            return None
+        finally:
+            self._slots.release()
+
+    def synthesize(
+        self,
+        text: str,
+        voice_id: Optional[str] = None,
+        codec: str = "wav",
+        timeout: Optional[float] = None
+    ) -> Optional[bytes]:
+        """
+        Convert text to speech.
+
+        Args:
+            text: The text to speak
+            voice_id: Optional substring of the engine voice id to use
+            codec: Output codec, one of audio_codec.AUDIO_CODECS
+            timeout: Seconds to wait for the job; defaults to the service timeout
+
+        Returns:
+            Audio bytes in the requested codec, or None if speech could not be generated.
+        """
+        if not text:
+            return None
+        audio = self.cached(text, voice_id, codec)
+        if audio is not None or not self.available:
+            return audio
+
+        wav = self._render(text, voice_id, timeout)
+        if wav is None or codec == "wav":
+            return wav
+        return self._encode(text, voice_id, wav, codec)
+
+    async def synthesize_async(self, text: str, voice_id: Optional[str] = None, codec: str = "wav") -> Optional[bytes]:
+        """Convert text to speech without blocking the caller's event loop"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.synthesize, text, voice_id, codec)
+
+    def submit(
+        self,
+        text: str,
+        voice_id: Optional[str] = None,
+        codec: str = "wav",
+        owner: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Start rendering audio in the background.
+
+        Args:
+            owner: The user the audio is for; only they can fetch it by the returned id
+
+        Returns:
+            The audio id to fetch it by, or None if no audio will be produced.
+        """
+        if not text:
+            return None
+        key = self.cache_key(text, voice_id, codec)
+        audio_id = self.audio_id(key, owner)
+        if self.cached(text, voice_id, codec) is not None:
+            self._register(audio_id, key)
+            return audio_id
+        if not self.available:
+            return None
+
+        self._register(audio_id, key)
+        with self._lock:
+            if key not in self._jobs:
+                self._jobs[key] = self._background.submit(self._run_job, key, text, voice_id, codec)
+        return audio_id
+
+    def _run_job(self, key: str, text: str, voice_id: Optional[str], codec: str) -> Optional[bytes]:
+        """Render one background job, then forget it; the cache keeps the audio"""
+        audio = None
+        try:
+            audio = self.synthesize(text, voice_id, codec)
+            return audio
+        finally:
+            with self._lock:
+                self._jobs.pop(key, None)
+            if audio is None:
+                self._unregister(key)
+
+    def fetch(self, audio_id: str, owner: Optional[str] = None, timeout: Optional[float] = None) -> Optional[bytes]:
+        """
+        Get audio by id, waiting up to timeout for a job that is still rendering it.
+        Returns None at once for ids that were not issued to this owner.
+        """
+        key = self._lookup(audio_id)
+        if key is None or not hmac.compare_digest(self.audio_id(key, owner), audio_id):
+            return None
+
+        timeout = self.timeout if timeout is None else timeout
+        audio = self.cache.get(key) if self.cache is not None else None
+        if audio is not None:
+            return audio
+
+        with self._lock:
+            job = self._jobs.get(key)
+        if job is not None:
+            try:
+                return job.result(timeout)
+            except Exception as e:
+                logger.error(f"Audio {audio_id} was not ready: {e}")
+                return None
+
+        # Another worker issued the id and is rendering it into the shared disk tier
+        deadline = time.monotonic() + timeout
+        while self.cache is not None and time.monotonic() < deadline:
+            time.sleep(0.1)
+            audio = self.cache.get(key, count_miss=False)
+            if audio is not None:
+                return audio
+            if self._lookup(audio_id) is None:
+                return None
+        return None
+
+    def warm(self, phrases: Iterable[str], codecs: Iterable[str] = ("wav",)) -> Optional[threading.Thread]:
+        """Render a list of phrases into the cache in the background, in each codec"""
+        if not self.available or self.cache is None:
+            return None
+
+        def run():
+            rendered = 0
+            for phrase in phrases:
+                for codec in codecs:
+                    if self.cached(phrase, codec=codec) is None and self.synthesize(phrase, codec=codec) is not None:
+                        rendered += 1
+            logger.info(f"TTS cache warmed with {rendered} new recordings; stats: {self.cache.stats()}")
+
+        thread = threading.Thread(target=run, name="tts-warm", daemon=True)
+        thread.start()
+        return thread
+
+    def close(self) -> None:
+        """Stop the worker processes"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+            pool.terminate()
+            pool.join()
+        self._background.shutdown(wait=False, cancel_futures=True)
+
+
+# Create global instance
+tts_service = TTSService()
+atexit.register(tts_service.close)
@@ -0,0 +1,196 @@
+"""
+Text-to-speech audio cache
+Content-addressed cache of synthesized audio with an in-memory LRU tier and a shared on-disk tier
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Cache limits
+TTS_CACHE_MEMORY_BYTES = int(os.getenv("TTS_CACHE_MEMORY_BYTES", 32 * 1024 * 1024))
+TTS_CACHE_DISK_BYTES = int(os.getenv("TTS_CACHE_DISK_BYTES", 512 * 1024 * 1024))
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "tts_cache")
+
+
+def audio_cache_key(text: str, voice: str, rate: int, codec: str) -> str:
+    """Hash everything that changes the rendered audio"""
+    return hashlib.sha256("\x00".join([text, voice, str(rate), codec]).encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """
+    Two-tier audio cache keyed by audio_cache_key().
+
+    The memory tier is an LRU bounded by total bytes. The disk tier is a directory of
+    one file per key, written atomically so several worker processes can share it;
+    when it grows past its bound the least recently used files are removed.
+    """
+
+    def __init__(
+        self,
+        memory_bytes: int = TTS_CACHE_MEMORY_BYTES,
+        disk_bytes: int = TTS_CACHE_DISK_BYTES,
+        directory: Optional[str] = TTS_CACHE_DIR
+    ):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.directory = directory
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self._disk_used = None
+        self._lock = threading.Lock()
+        # Held while rescanning the disk tier, so only one thread walks the directory at a time
+        self._disk_lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    # --- Memory tier ---
+
+    def _remember(self, key: str, audio: bytes) -> None:
+        """Store audio in memory, evicting least recently used entries"""
+        if len(audio) > self.memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_used -= len(previous)
+        self._memory[key] = audio
+        self._memory_used += len(audio)
+        while self._memory_used > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= len(evicted)
+            self._stats["evictions"] += 1
+
+    # --- Disk tier ---
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        """Read audio from disk and mark it as recently used"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            os.utime(path)
+            return audio
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.error(f"Error reading cached audio {key}: {e}")
+            return None
+
+    def _write_disk(self, key: str, audio: bytes) -> None:
+        """Write audio to disk atomically, then enforce the disk bound"""
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+            with os.fdopen(fd, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Error writing cached audio {key}: {e}")
+            return
+
+        with self._lock:
+            if self._disk_used is not None:
+                self._disk_used += len(audio)
+            used = self._disk_used
+        if used is None or used > self.disk_bytes:
+            self._evict_disk()
+
+    def _scan_disk(self):
+        """List cached files as (mtime, size, path), oldest first, with their total size"""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    info = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((info.st_mtime, info.st_size, path))
+        entries.sort()
+        return entries, sum(size for _, size, _ in entries)
+
+    def _evict_disk(self) -> None:
+        """Rescan the disk tier and, if it is over its bound, remove least recently used files until it is under 90%"""
+        if not self._disk_lock.acquire(blocking=False):
+            return  # Another thread is already rescanning
+        try:
+            # Rescan, since other processes share the directory
+            entries, used = self._scan_disk()
+            evicted = 0
+            if used > self.disk_bytes:
+                target = int(self.disk_bytes * 0.9)
+                for _, size, path in entries:
+                    if used <= target:
+                        break
+                    try:
+                        os.remove(path)
+                        used -= size
+                        evicted += 1
+                    except FileNotFoundError:
+                        used -= size
+                    except OSError as e:
+                        logger.error(f"Error evicting cached audio {path}: {e}")
+            with self._lock:
+                self._disk_used = used
+                self._stats["evictions"] += evicted
+        finally:
+            self._disk_lock.release()
+
+    # --- Public API ---
+
+    def get(self, key: str, count_miss: bool = True) -> Optional[bytes]:
+        """Get cached audio, checking memory before disk; polls for pending audio pass count_miss=False"""
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return audio
+
+        audio = self._read_disk(key) if self.directory else None
+        with self._lock:
+            if audio is None:
+                if count_miss:
+                    self._stats["misses"] += 1
+                return None
+            self._stats["disk_hits"] += 1
+            self._remember(key, audio)
+        return audio
+
+    def put(self, key: str, audio: bytes) -> None:
+        """Store audio in both tiers; the disk write happens outside the lock so lookups are not held up"""
+        with self._lock:
+            self._remember(key, audio)
+        if self.directory:
+            self._write_disk(key, audio)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get hit and miss counters and tier sizes"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_used
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear_memory(self) -> None:
+        """Drop the in-memory tier"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_used = 0
+
+
+# Create global instance
+tts_cache = TTSCache()
@@ -0,0 +1,85 @@
+"""
+Keyset pagination
+Pages through ordered queries with opaque cursors instead of OFFSET, so every page costs the same
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"datetime": value.isoformat()}
+    raise TypeError(f"Cannot put {type(value).__name__} in a cursor")
+
+
+def _object_hook(value: dict) -> Any:
+    if set(value) == {"datetime"}:
+        return datetime.fromisoformat(value["datetime"])
+    return value
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode the sort key of the last row on a page as a URL-safe cursor"""
+    data = json.dumps(list(values), default=_default, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """Decode a cursor made by encode_cursor; raises ValueError if it is malformed"""
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(data, object_hook=_object_hook)
+    except (TypeError, ValueError) as e:  # binascii.Error and JSONDecodeError are ValueErrors
+        raise ValueError(f"Invalid cursor: {e}") from e
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def _matches(column, value: Any) -> bool:
+    """Whether a cursor value has the Python type of the column it is compared with"""
+    try:
+        expected = column.type.python_type
+    except (AttributeError, NotImplementedError):
+        return True
+    if value is None:
+        return True
+    if isinstance(value, bool) and expected is not bool:
+        return False
+    return isinstance(value, expected)
+
+
+def keyset_page(query, columns: Sequence, cursor: Optional[str] = None, limit: int = 50,
+                descending: bool = False, offset: int = 0) -> Tuple[list, Optional[str]]:
+    """
+    One page of `query` ordered by `columns`, starting after `cursor`.
+
+    The last column must be unique (usually the primary key) so the order is total.
+    Row comparisons are spelled out as (a > x) OR (a = x AND b > y), which every
+    database can answer from a composite index on the same columns. Returns the rows
+    and the cursor of the next page, or None on the last page. `offset` skips rows
+    after ordering, for clients that still page by count.
+    """
+    from sqlalchemy import and_, or_
+
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(columns) or not all(_matches(c, v) for c, v in zip(columns, values)):
+            raise ValueError("Invalid cursor")
+        terms = []
+        for i, (column, value) in enumerate(zip(columns, values)):
+            after = column < value if descending else column > value
+            terms.append(and_(*[c == v for c, v in zip(columns[:i], values[:i])], after))
+        query = query.filter(or_(*terms))
+
+    query = query.order_by(*[column.desc() if descending else column.asc() for column in columns])
+    if offset:
+        query = query.offset(offset)
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([getattr(rows[-1], column.key) for column in columns])
@@ -1,41 +1,133 @@
+import argparse
+import json
 import os
-from PIL import Image, ImageDraw, ImageFont
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageDraw, ImageFont, features
 import shutil
 
+from app.services.avatars import (
+    AVATAR_WIDTHS,
+    DERIVATIVES_DIR,
+    DERIVATIVES_MANIFEST_PATH,
+    STATIC_DIR,
+    derivative_widths,
+    file_hash,
+    load_derivatives,
+    scan_avatars,
+    write_manifest,
+)
+
+# Derivative encodings, best compression first; AVIF needs a Pillow built with libavif
+DERIVATIVE_FORMATS = {
+    "avif": {"type": "image/avif", "format": "AVIF", "options": {"quality": 50, "speed": 6}},
+    "webp": {"type": "image/webp", "format": "WEBP", "options": {"quality": 80, "method": 6}},
+}
+
+
 def create_avatar(filename, text, bg_color=(200, 200, 200)):
     # Create a 200x200 image with a background color
     img = Image.new('RGB', (200, 200), bg_color)
     draw = ImageDraw.Draw(img)
-    
+
     # Add text
     try:
         font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 20)
     except:
         font = ImageFont.load_default()
-    
+
     # Center the text
     text_bbox = draw.textbbox((0, 0), text, font=font)
     text_width = text_bbox[2] - text_bbox[0]
     text_height = text_bbox[3] - text_bbox[1]
     x = (200 - text_width) // 2
     y = (200 - text_height) // 2
-    
+
     # Draw the text
     draw.text((x, y), text, fill=(0, 0, 0), font=font)
-    
+
     # Save the image
     os.makedirs(os.path.dirname(filename), exist_ok=True)
     img.save(filename)
 
-def main():
+
+def available_formats():
+    """Derivative formats this Pillow build can write"""
+    return [name for name in DERIVATIVE_FORMATS if features.check(name)]
+
+
+def render_derivatives(source_path, source_hash, formats, widths=AVATAR_WIDTHS):
+    """Write every size and format of one avatar and return its manifest entry (runs in a worker)"""
+    stem = os.path.splitext(source_path)[0].replace("/", "_")
+    with Image.open(os.path.join(STATIC_DIR, source_path)) as img:
+        img = img.convert("RGB")
+        sources = []
+        for name in formats:
+            encoding = DERIVATIVE_FORMATS[name]
+            variants = []
+            for width in derivative_widths(img.width, widths):
+                height = round(img.height * width / img.width)
+                path = f"{DERIVATIVES_DIR}/{stem}-{width}.{name}"
+                img.resize((width, height), Image.LANCZOS).save(
+                    os.path.join(STATIC_DIR, path), encoding["format"], **encoding["options"]
+                )
+                variants.append({"path": path, "width": width})
+            sources.append({"type": encoding["type"], "variants": variants})
+    return source_path, {"source_hash": source_hash, "width": img.width, "height": img.height, "sources": sources}
+
+
+def is_current(entry, source_hash, formats):
+    """Whether an avatar's derivatives were made from this exact picture, in these formats, and still exist"""
+    if entry is None or entry["source_hash"] != source_hash:
+        return False
+    if [s["type"] for s in entry["sources"]] != [DERIVATIVE_FORMATS[name]["type"] for name in formats]:
+        return False
+    return all(
+        os.path.exists(os.path.join(STATIC_DIR, variant["path"]))
+        for source in entry["sources"] for variant in source["variants"]
+    )
+
+
+def build_derivatives(workers=None):
+    """Render resized WebP/AVIF copies of changed avatars on a process pool and rewrite their manifest"""
+    formats = available_formats()
+    if not formats:
+        print("Pillow cannot write WebP or AVIF; no derivatives created")
+        return
+    os.makedirs(os.path.join(STATIC_DIR, DERIVATIVES_DIR), exist_ok=True)
+
+    previous = load_derivatives()
+    images = {}
+    jobs = []
+    for avatar in scan_avatars():
+        source_hash = file_hash(os.path.join(STATIC_DIR, avatar["path"]))
+        entry = previous.get(avatar["path"])
+        if is_current(entry, source_hash, formats):
+            images[avatar["path"]] = entry
+        else:
+            jobs.append((avatar["path"], source_hash))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(render_derivatives, path, source_hash, formats) for path, source_hash in jobs]
+        for future in futures:
+            path, entry = future.result()
+            images[path] = entry
+
+    with open(DERIVATIVES_MANIFEST_PATH, "w") as f:
+        json.dump({"images": dict(sorted(images.items()))}, f, indent=2)
+        f.write("\n")
+    print(f"Rendered {len(jobs)} avatars in {', '.join(formats)}; {len(images) - len(jobs)} were unchanged")
+
+
+def create_placeholders():
     base_dir = "static/images/avatars"
     genders = ["male", "female"]
     ethnicities = ["caucasian", "african_american", "asian", "hispanic", "middle_eastern", "south_asian"]
-    
-    # Clean up existing avatars directory
-    if os.path.exists(base_dir):
-        shutil.rmtree(base_dir)
-    
+
+    # Clean up existing avatar pictures, keeping the manifest so avatar ids stay the same
+    for gender in genders:
+        if os.path.exists(f"{base_dir}/{gender}"):
+            shutil.rmtree(f"{base_dir}/{gender}")
+
     for gender in genders:
         for ethnicity in ethnicities:
             # Create two avatars for each combination
@@ -43,7 +135,20 @@ def main():
                 filename = f"{base_dir}/{gender}/{gender}_{ethnicity}_{i}.jpg"
                 text = f"{gender.title()}\n{ethnicity.title()}\n#{i}"
                 create_avatar(filename, text)
+    print("Avatar images created successfully!")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create avatar placeholders and their resized WebP/AVIF copies")
+    parser.add_argument("--derivatives-only", action="store_true", help="Keep the current pictures; only update derivatives")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per core)")
+    args = parser.parse_args()
+
+    if not args.derivatives_only:
+        create_placeholders()
+    write_manifest()
+    build_derivatives(args.workers)
+
 
 if __name__ == "__main__":
     main()
-    print("Avatar images created successfully!") 
\ No newline at end of file
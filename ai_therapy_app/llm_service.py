@@ -4,72 +4,23 @@ Handles connection to LLM APIs for generating therapeutic responses
 """
 
 import os
-import openai
 from dotenv import load_dotenv
 import json
 import logging
 from datetime import datetime
-import io
-import torchaudio
-import base64
-import tempfile
 import random
+import threading
+from collections import OrderedDict
+from app.services.llm_client import llm_client
+from app.services.conversation_history import ConversationHistory
+from app.services.transcript_cache import transcript_cache, make_turn
+from app.services.tts import tts_service
+from app.services.audio_codec import negotiate_codec
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# --- TTS Integration ---
-try:
-    # Using pyttsx3 (cross-platform TTS that works on macOS)
-    import pyttsx3
-    import io
-    
-    # Initialize pyttsx3
-    tts_engine = pyttsx3.init()
-    # Set properties (optional)
-    tts_engine.setProperty('rate', 150)    # Slightly slower speed for therapeutic responses
-    tts_engine.setProperty('volume', 0.9)  # Volume (0.0 to 1.0)
-    
-    # Get available voices (optional, for customization)
-    voices = tts_engine.getProperty('voices')
-    # Select a voice - typically index 0 is system default
-    if voices:
-        # Use a female voice if available (often the second voice on macOS)
-        if len(voices) > 1:
-            tts_engine.setProperty('voice', voices[1].id)  # Usually a female voice on macOS
-        else:
-            tts_engine.setProperty('voice', voices[0].id)
-    
-    logger.info("pyttsx3 TTS engine initialized successfully.")
-    
-    # Function to convert text to speech audio bytes
-    def text_to_speech(text):
-        """Convert text to speech using pyttsx3 and return as WAV bytes."""
-        if not text:
-            return None
-        
-        # Create a temporary file for the audio
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
-            # Save speech to the file
-            tts_engine.save_to_file(text, temp_file.name)
-            tts_engine.runAndWait()
-            
-            # Read the file back into memory
-            temp_file.close()  # Close to ensure all data is written
-            with open(temp_file.name, 'rb') as f:
-                audio_data = f.read()
-            
-            # Delete the temporary file
-            os.unlink(temp_file.name)
-            
-        return audio_data
-        
-except ImportError as e:
-    logger.error(f"Failed to initialize pyttsx3 TTS: {e}. TTS will not be available.")
-    text_to_speech = lambda text: None
-# --- TTS Integration END ---
-
 # Load environment variables
 load_dotenv()
 
@@ -77,10 +28,8 @@ load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
     logger.warning("OPENAI_API_KEY not found in environment. Using demo mode.")
+llm_client.configure(api_key=api_key)
 
-# Message history cache for maintaining conversation context
-# Keys are session_ids, values are lists of message dicts
-message_history = {}
 
 # Define system prompt for therapy conversations
 THERAPY_SYSTEM_PROMPT = """
@@ -101,47 +50,70 @@ Follow these guidelines in all your responses:
 Your goal is to help the user gain insights, develop coping strategies, and feel heard and understood.
 """
 
-# Max number of messages to keep in history for context
-MAX_HISTORY_LENGTH = 10
+# Prompt used to fold older turns into a running summary
+SUMMARY_PROMPT = """
+Summarize the earlier part of this therapy conversation for the therapist's notes.
+Keep the user's main concerns, feelings, goals, and anything they asked to be remembered.
+Merge it with the existing summary if one is given. Use no more than a short paragraph.
+"""
 
-def get_llm_response(user_message, session_id, user_id=None, personalization_context=None):
-    """
-    Get a response from the LLM based on the user's message and conversation history.
-    Now includes audio generation using pyttsx3.
-    
-    Args:
-        user_message (str): The user's message
-        session_id (str): Unique identifier for the therapy session
-        user_id (str, optional): Identifier for the user
-        personalization_context (dict, optional): Additional context for personalization
-        
-    Returns:
-        (text_response, audio_data): A tuple containing the text response (str)
-                                     and the base64-encoded audio data (str or None).
-    """
-    ai_text_response = None
-    ai_audio_data = None
+# Reply used whenever the LLM call fails
+FALLBACK_RESPONSE = "I'm having trouble connecting with my thoughts right now. Could you give me a moment, and perhaps rephrase what you were saying? I want to be fully present for our conversation."
 
-    # Initialize session history if it doesn't exist
-    if session_id not in message_history:
-        message_history[session_id] = []
-    
-    # Add the current message to history
-    message_history[session_id].append({
-        "role": "user",
-        "content": user_message
-    })
-    
-    # Limit history length to avoid token limits
-    if len(message_history[session_id]) > MAX_HISTORY_LENGTH * 2:  # *2 because we count pairs of messages
-        message_history[session_id] = message_history[session_id][-MAX_HISTORY_LENGTH * 2:]
-    
-    # Build messages array for API call
-    messages = [{"role": "system", "content": THERAPY_SYSTEM_PROMPT}]
+# Canned replies used in demo mode
+DEMO_GENERIC_RESPONSES = [
+    "I understand how challenging that must be for you. Could you tell me more about how it affects your daily life?",
+    "It sounds like you're going through a lot right now. What coping strategies have helped you in the past?",
+    "Thank you for sharing that with me. How have you been managing these feelings so far?",
+    "That's a really important insight. How do you feel when you think about it that way?",
+    "I'm here to support you through this. What would be most helpful for you to focus on today?",
+    "I notice you mentioned feeling [emotion]. Could you tell me more about that?",
+    "It takes courage to talk about these things. What would be a small step you could take toward addressing this?",
+    "I'm curious about how this situation is affecting your relationships with others in your life.",
+    "Let's explore that further. What thoughts come up for you when you're in that situation?",
+    "That's a very common reaction, though I know it doesn't make it any easier. Have you considered trying mindfulness techniques?"
+]
+
+DEMO_KEYWORD_RESPONSES = {
+    "anxiety": "It sounds like anxiety might be playing a role here. Many people find breathing exercises helpful when anxiety arises. Would you like to explore some strategies that might help manage these feelings?",
+    "depression": "I'm hearing that you've been feeling low lately. Depression can make even small tasks feel overwhelming. What's one small thing you might be able to do today that could bring you a moment of peace or satisfaction?",
+    "relationship": "Relationships can be both deeply fulfilling and challenging. It seems this situation is having a significant impact on you. Could you tell me more about what patterns you've noticed in this relationship?",
+    "work": "Work-related stress can affect many areas of our lives. Finding a healthy work-life balance is important. What boundaries might you be able to set to create more space for yourself?"
+}
+
+# Phrases rendered into the TTS cache at startup
+TTS_WARM_PHRASES = [FALLBACK_RESPONSE] + list(DEMO_KEYWORD_RESPONSES.values()) + [
+    response for response in DEMO_GENERIC_RESPONSES if "[emotion]" not in response
+]
+
+# Sampling parameters shared by blocking and streamed completions
+COMPLETION_PARAMS = {
+    "model": "gpt-4o",  # Or another appropriate model
+    "temperature": 0.7,
+    "max_tokens": 500,
+    "top_p": 1.0,
+    "frequency_penalty": 0.5,
+    "presence_penalty": 0.6
+}
+
+
+# Personalization prompts by (profile id, profile version), least recently used first
+PERSONALIZATION_PROMPT_CACHE_SIZE = int(os.getenv("PERSONALIZATION_PROMPT_CACHE_SIZE", 1024))
+_personalization_prompts = OrderedDict()
+_personalization_prompts_lock = threading.Lock()
+
+
+def personalization_prompt(personalization_context):
+    """Build the system prompt fragment for a personalization context, reusing it while the profile is unchanged"""
+    key = (personalization_context.get("user_id"), personalization_context.get("profile_version"))
+    if key[1] is not None:
+        with _personalization_prompts_lock:
+            prompt = _personalization_prompts.get(key)
+            if prompt is not None:
+                _personalization_prompts.move_to_end(key)
+                return prompt
     
-    # Add personalization context if available
-    if personalization_context:
-        personalization_prompt = f"""
+    prompt = f"""
         Additional context about the user that may be helpful:
         - Name: {personalization_context.get('name', 'the user')}
         - Therapy goals: {personalization_context.get('goals', 'Not specified')}
@@ -150,10 +122,84 @@ def get_llm_response(user_message, session_id, user_id=None, personalization_con
         
         Use this information subtly to personalize your responses, but don't explicitly reference having this information.
         """
-        messages.append({"role": "system", "content": personalization_prompt})
     
-    # Add conversation history
-    messages.extend(message_history[session_id])
+    if key[1] is not None:
+        with _personalization_prompts_lock:
+            _personalization_prompts[key] = prompt
+            while len(_personalization_prompts) > PERSONALIZATION_PROMPT_CACHE_SIZE:
+                _personalization_prompts.popitem(last=False)
+    return prompt
+
+
+def summarize_turns(previous_summary, turns):
+    """Fold conversation turns into the running summary of a session"""
+    messages = [{"role": "system", "content": SUMMARY_PROMPT}]
+    if previous_summary:
+        messages.append({"role": "system", "content": f"Existing summary: {previous_summary}"})
+    transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+    messages.append({"role": "user", "content": transcript})
+    return llm_client.chat_sync(
+        messages,
+        model=COMPLETION_PARAMS["model"],
+        temperature=0.3,
+        max_tokens=200
+    ).strip()
+
+
+# Keeps each prompt within the token budget, summarizing older turns in the background
+conversation_history = ConversationHistory(transcript_cache, summarizer=summarize_turns if api_key else None)
+
+
+def _prepare_messages(user_message, session_id, personalization_context=None):
+    """Record the user's message in the session transcript and build the API messages array"""
+    turns = transcript_cache.get(session_id)
+    
+    # A transcript rebuilt from stored messages may already end with this message
+    if not (turns and turns[-1]["role"] == "user" and turns[-1]["content"] == user_message):
+        turns = transcript_cache.append(session_id, make_turn("user", user_message))
+    
+    # Build messages array for API call
+    messages = [{"role": "system", "content": THERAPY_SYSTEM_PROMPT}]
+    
+    # Add personalization context if available
+    if personalization_context:
+        messages.append({"role": "system", "content": personalization_prompt(personalization_context)})
+    
+    # Add as much conversation history as the token budget allows
+    reserved_tokens = conversation_history.counter.count_messages(messages)
+    messages.extend(conversation_history.build_window(session_id, turns, reserved_tokens))
+    return messages
+
+
+def _record_reply(session_id, ai_response):
+    """Add the AI reply to the session transcript; the routes persist the same text"""
+    transcript_cache.append(session_id, make_turn("assistant", ai_response))
+
+
+def warm_tts_cache():
+    """Pre-render the fixed replies into the TTS cache in the background"""
+    return tts_service.warm(TTS_WARM_PHRASES, codecs=(negotiate_codec(None),))
+
+
+def get_llm_response(user_message, session_id, user_id=None, personalization_context=None, audio_codec="wav", audio_owner=None):
+    """
+    Get a response from the LLM based on the user's message and conversation history.
+    Audio for the reply is rendered in the background; fetch it with tts_service.fetch(audio_id, owner=audio_owner).
+    
+    Args:
+        user_message (str): The user's message
+        session_id (str): Unique identifier for the therapy session
+        user_id (str, optional): Identifier for the user
+        personalization_context (dict, optional): Additional context for personalization
+        audio_codec (str, optional): Codec for the audio, one of audio_codec.AUDIO_CODECS
+        audio_owner (str, optional): Who may fetch the audio; defaults to user_id
+        
+    Returns:
+        (text_response, audio_id): A tuple containing the text response (str)
+                                   and the id of its audio (str or None).
+    """
+    messages = _prepare_messages(user_message, session_id, personalization_context)
+    audio_owner = audio_owner or user_id
     
     try:
         # Check if API key is available
@@ -161,72 +207,69 @@ def get_llm_response(user_message, session_id, user_id=None, personalization_con
             # Demo mode - return a more sophisticated canned response
             logger.info("Using demo mode for LLM response")
             demo_response = generate_demo_response(user_message, personalization_context)
-            # No audio in demo mode
-            return demo_response, None
-        
-        # Call OpenAI API
-        response = openai.chat.completions.create(
-            model="gpt-4o",  # Or another appropriate model
-            messages=messages,
-            temperature=0.7,
-            max_tokens=500,
-            top_p=1.0,
-            frequency_penalty=0.5,
-            presence_penalty=0.6
-        )
-        
-        # Extract and return the response text
-        ai_response = response.choices[0].message.content.strip()
+            _record_reply(session_id, demo_response)
+            # Canned lines are usually already in the TTS cache
+            return demo_response, tts_service.submit(demo_response, codec=audio_codec, owner=audio_owner)
         
-        # Save the response to history
-        message_history[session_id].append({
-            "role": "assistant",
-            "content": ai_response
-        })
+        # Call OpenAI API through the shared pooled client
+        ai_response = llm_client.chat_sync(messages, **COMPLETION_PARAMS).strip()
         
-        ai_text_response = ai_response
+        # Save the response to the transcript
+        _record_reply(session_id, ai_response)
         
-        # Generate speech audio from the text (using pyttsx3)
-        try:
-            logger.info(f"Generating TTS audio for session {session_id}...")
-            audio_data = text_to_speech(ai_text_response)
-            # Convert to base64 for JSON transmission
-            if audio_data:
-                ai_audio_data = base64.b64encode(audio_data).decode('utf-8')
-                logger.info(f"Generated audio for response: {len(audio_data)} bytes")
-            else:
-                ai_audio_data = None
-                logger.warning("Failed to generate audio for response")
-        except Exception as e:
-            logger.error(f"Error generating speech: {e}")
-            ai_audio_data = None
-        
-        return ai_text_response, ai_audio_data
+        # Render speech in the background so the text is not held up by TTS
+        return ai_response, tts_service.submit(ai_response, codec=audio_codec, owner=audio_owner)
         
     except Exception as e:
         logger.error(f"Error getting LLM response: {str(e)}")
-        # Return error text and None for audio
-        error_message = "I'm having trouble connecting with my thoughts right now. Could you give me a moment, and perhaps rephrase what you were saying? I want to be fully present for our conversation."
-        return error_message, None
+        _record_reply(session_id, FALLBACK_RESPONSE)
+        # Return error text with its (usually pre-rendered) audio
+        return FALLBACK_RESPONSE, tts_service.submit(FALLBACK_RESPONSE, codec=audio_codec, owner=audio_owner)
+
+
+def stream_llm_response(user_message, session_id, user_id=None, personalization_context=None):
+    """
+    Stream a response from the LLM, yielding text fragments as they arrive.
+    The complete reply is added to the session transcript once the stream finishes.
+    
+    Args:
+        user_message (str): The user's message
+        session_id (str): Unique identifier for the therapy session
+        user_id (str, optional): Identifier for the user
+        personalization_context (dict, optional): Additional context for personalization
+        
+    Yields:
+        str: Successive fragments of the text response.
+    """
+    messages = _prepare_messages(user_message, session_id, personalization_context)
+    
+    if not api_key:
+        # Demo mode - the canned response arrives as a single fragment
+        logger.info("Using demo mode for streamed LLM response")
+        demo_response = generate_demo_response(user_message, personalization_context)
+        _record_reply(session_id, demo_response)
+        yield demo_response
+        return
+    
+    chunks = []
+    try:
+        for delta in llm_client.stream_sync(messages, **COMPLETION_PARAMS):
+            chunks.append(delta)
+            yield delta
+    except Exception as e:
+        logger.error(f"Error streaming LLM response: {str(e)}")
+        # Only fall back if nothing has reached the client yet
+        if not chunks:
+            chunks.append(FALLBACK_RESPONSE)
+            yield FALLBACK_RESPONSE
+    
+    # Save whatever reached the client to the transcript
+    _record_reply(session_id, "".join(chunks).strip())
 
 
 def generate_demo_response(user_message, personalization_context=None):
     """Generate a demonstration response when no API key is available."""
     
-    # Generic supportive responses
-    generic_responses = [
-        "I understand how challenging that must be for you. Could you tell me more about how it affects your daily life?",
-        "It sounds like you're going through a lot right now. What coping strategies have helped you in the past?",
-        "Thank you for sharing that with me. How have you been managing these feelings so far?",
-        "That's a really important insight. How do you feel when you think about it that way?",
-        "I'm here to support you through this. What would be most helpful for you to focus on today?",
-        "I notice you mentioned feeling [emotion]. Could you tell me more about that?",
-        "It takes courage to talk about these things. What would be a small step you could take toward addressing this?",
-        "I'm curious about how this situation is affecting your relationships with others in your life.",
-        "Let's explore that further. What thoughts come up for you when you're in that situation?",
-        "That's a very common reaction, though I know it doesn't make it any easier. Have you considered trying mindfulness techniques?"
-    ]
-    
     # Simple keyword matching for slightly more relevant responses
     # Note: This is very basic and not a replacement for a real LLM!
     anxiety_keywords = ["anxious", "anxiety", "worry", "panic", "stress", "afraid", "fear"]
@@ -238,21 +281,21 @@ def generate_demo_response(user_message, personalization_context=None):
     
     # Check for keyword matches and return appropriate response
     if any(keyword in message_lower for keyword in anxiety_keywords):
-        return "It sounds like anxiety might be playing a role here. Many people find breathing exercises helpful when anxiety arises. Would you like to explore some strategies that might help manage these feelings?"
+        return DEMO_KEYWORD_RESPONSES["anxiety"]
     
     elif any(keyword in message_lower for keyword in depression_keywords):
-        return "I'm hearing that you've been feeling low lately. Depression can make even small tasks feel overwhelming. What's one small thing you might be able to do today that could bring you a moment of peace or satisfaction?"
+        return DEMO_KEYWORD_RESPONSES["depression"]
     
     elif any(keyword in message_lower for keyword in relationship_keywords):
-        return "Relationships can be both deeply fulfilling and challenging. It seems this situation is having a significant impact on you. Could you tell me more about what patterns you've noticed in this relationship?"
+        return DEMO_KEYWORD_RESPONSES["relationship"]
     
     elif any(keyword in message_lower for keyword in work_keywords):
-        return "Work-related stress can affect many areas of our lives. Finding a healthy work-life balance is important. What boundaries might you be able to set to create more space for yourself?"
+        return DEMO_KEYWORD_RESPONSES["work"]
     
     # If no keywords match, return a random generic response
     else:
         # If personalization context is available, insert name for a more personal touch
-        selected_response = random.choice(generic_responses)
+        selected_response = random.choice(DEMO_GENERIC_RESPONSES)
         if personalization_context and "name" in personalization_context:
             # Replace "you" with name occasionally to personalize
             if "you" in selected_response and random.random() > 0.5:
@@ -267,8 +310,5 @@ def generate_demo_response(user_message, personalization_context=None):
 
 
 def clear_session_history(session_id):
-    """Clear conversation history for a specific session"""
-    if session_id in message_history:
-        del message_history[session_id]
-        return True
-    return False 
\ No newline at end of file
+    """Clear the cached conversation transcript and summary for a specific session"""
+    return transcript_cache.invalidate(session_id) 
\ No newline at end of file
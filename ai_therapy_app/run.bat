@@ -17,6 +17,11 @@ if %ERRORLEVEL% neq 0 (
     exit /b 1
 )
 
+REM Build avatar copies and fingerprinted static files; unchanged files are skipped
+echo Building static assets...
+python create_avatars.py --derivatives-only || exit /b 1
+python -m app.core.static_assets || exit /b 1
+
 REM Run the application
 echo Starting Mental Health AI Therapy Web Application...
 python run.py %* 
\ No newline at end of file
@@ -9,7 +9,7 @@ import subprocess
 import sys
 import webbrowser
 from time import sleep
-from web_app import app
+from web_app import app, warm_up_app
 
 def main():
     """Run the AI Therapy App"""
@@ -24,6 +24,9 @@ def main():
     # Set the static folder path explicitly
     app.static_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
     
+    # Connect and fill caches in the background so startup stays fast
+    warm_up_app()
+    
     print(f"✨ AI video avatar and personalization features are ready to use!")
     print(f"Starting application on http://localhost:{port}")
     app.run(debug=args.debug, host='0.0.0.0', port=port)
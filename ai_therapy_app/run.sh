@@ -16,6 +16,11 @@ if ! command -v python3 &> /dev/null; then
     exit 1
 fi
 
+# Build avatar copies and fingerprinted static files; unchanged files are skipped
+echo "Building static assets..."
+python3 create_avatars.py --derivatives-only || exit 1
+python3 -m app.core.static_assets || exit 1
+
 # Run the application
 echo "Starting Mental Health AI Therapy Web Application..."
 python3 run.py "$@" 
\ No newline at end of file
@@ -0,0 +1,56 @@
+/**
+ * Keyset pagination
+ * Loads further pages for the buttons rendered by the load_more macro
+ */
+
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('[data-load-more]').forEach(function(button) {
+        const target = document.querySelector(button.dataset.target);
+        const prepend = button.dataset.position === 'prepend';
+        let loading = false;
+
+        async function loadPage() {
+            if (loading || !button.dataset.cursor) return;
+            loading = true;
+            button.disabled = true;
+            try {
+                const url = new URL(button.dataset.loadMore, window.location.href);
+                url.searchParams.set('cursor', button.dataset.cursor);
+                const response = await fetch(url, { headers: { 'Accept': 'application/json' } });
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                const page = await response.json();
+
+                if (prepend) {
+                    // Keep the messages in view where they were while older ones go above them
+                    const fromBottom = target.scrollHeight - target.scrollTop;
+                    target.insertAdjacentHTML('afterbegin', page.html);
+                    target.scrollTop = target.scrollHeight - fromBottom;
+                } else {
+                    target.insertAdjacentHTML('beforeend', page.html);
+                }
+
+                if (page.next_cursor) {
+                    button.dataset.cursor = page.next_cursor;
+                } else {
+                    button.parentElement.remove();
+                    if (observer) observer.disconnect();
+                }
+            } catch (error) {
+                console.error('Error loading more:', error);
+            } finally {
+                loading = false;
+                button.disabled = false;
+            }
+        }
+
+        button.addEventListener('click', loadPage);
+
+        // Appended pages push the button down, so it can load itself as it scrolls into view
+        const observer = !prepend && 'IntersectionObserver' in window
+            ? new IntersectionObserver(function(entries) {
+                if (entries.some(entry => entry.isIntersecting)) loadPage();
+            })
+            : null;
+        if (observer) observer.observe(button);
+    });
+});
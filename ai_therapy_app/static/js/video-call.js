@@ -489,17 +489,14 @@ export class TherapyVideoCall {
         
         try {
             const sessionId = this.options.sessionId || 'temp-session';
-            console.log('Making API call to:', `/sessions/${sessionId}/videocall`);
+            console.log('Making API call to:', `/sessions/${sessionId}/videocall/stream`);
             
-            const response = await fetch(`/sessions/${sessionId}/videocall`, {
+            const response = await fetch(`/sessions/${sessionId}/videocall/stream`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
                 },
-                body: JSON.stringify({ 
-                    action: 'message',
-                    message: userMessage 
-                })
+                body: JSON.stringify({ message: userMessage })
             });
             
             console.log('API response status:', response.status);
@@ -510,14 +507,38 @@ export class TherapyVideoCall {
                 throw new Error(`API request failed: ${response.status} - ${errorText}`);
             }
             
-            const data = await response.json();
+            // Collect streamed tokens; the final 'done' event carries the full reply.
+            // Sentence audio arrives in order and is queued so playback starts with the first sentence.
+            let streamedText = '';
+            let data = {};
+            let playback = Promise.resolve();
+            let audioSegments = 0;
+            await readEventStream(response, (event, payload) => {
+                if (event === 'token') {
+                    streamedText += payload.token;
+                } else if (event === 'audio') {
+                    if (payload.audio) {
+                        audioSegments++;
+                        playback = playback.then(() => this._playAudioSegment(payload.audio, payload.audio_mime));
+                    }
+                } else if (event === 'done') {
+                    data = payload;
+                } else if (event === 'error') {
+                    throw new Error(payload.message);
+                }
+            });
             console.log('API response data:', data);
             
             // Show the AI response
-            const aiResponse = data.response || 'I apologize, but I had trouble processing your message.';
+            const aiResponse = data.response || streamedText || 'I apologize, but I had trouble processing your message.';
             
-            // If using photorealistic avatar, animate talking
-            if (this.options.avatarType === 'photorealistic') {
+            if (audioSegments > 0) {
+                // The server voiced the reply; finish playing it before the next turn
+                await this._addAIMessage(aiResponse);
+                await playback;
+                this._handleAvatarTalking(false);
+            } else if (this.options.avatarType === 'photorealistic') {
+                // If using photorealistic avatar, animate talking
                 this._handleAvatarTalking(true);
                 await this._addAIMessage(aiResponse);
                 
@@ -563,6 +584,21 @@ export class TherapyVideoCall {
         }
     }
     
+    /**
+     * Play one base64-encoded audio segment, resolving when it finishes
+     * @param {string} base64Audio - Encoded audio data
+     * @param {string} mimeType - Audio media type, e.g. 'audio/mpeg'
+     */
+    _playAudioSegment(base64Audio, mimeType) {
+        return new Promise(resolve => {
+            const audio = new Audio(`data:${mimeType || 'audio/wav'};base64,${base64Audio}`);
+            this._handleAvatarTalking(true);
+            audio.onended = resolve;
+            audio.onerror = resolve;
+            audio.play().catch(resolve);
+        });
+    }
+    
     _updateCallUI(isActive) {
         // Show/hide UI elements based on call state
         if (this.options.userVideoElement) {
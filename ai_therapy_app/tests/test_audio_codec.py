@@ -0,0 +1,68 @@
+"""
+Tests for audio codec negotiation
+"""
+import base64
+import os
+import sys
+import unittest
+from unittest import mock
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import audio_codec
+
+
+class TestNegotiateCodec(unittest.TestCase):
+    """Tests for negotiate_codec with PyAV available"""
+
+    def setUp(self):
+        patcher = mock.patch.object(audio_codec, "AV_AVAILABLE", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_no_audio_type_uses_default(self):
+        """JSON-only clients get the default codec"""
+        self.assertEqual(audio_codec.negotiate_codec("application/json"), audio_codec.DEFAULT_AUDIO_CODEC)
+        self.assertEqual(audio_codec.negotiate_codec(None), audio_codec.DEFAULT_AUDIO_CODEC)
+
+    def test_quality_values_rank_types(self):
+        """The highest q-value wins"""
+        accept = "application/json, audio/ogg;q=0.5, audio/mpeg;q=0.9"
+
+        self.assertEqual(audio_codec.negotiate_codec(accept), "mp3")
+
+    def test_server_preference_breaks_ties(self):
+        """Equal q-values prefer the smaller codec"""
+        self.assertEqual(audio_codec.negotiate_codec("audio/wav, audio/ogg, audio/mpeg"), "opus")
+
+    def test_refused_types_are_skipped(self):
+        """q=0 excludes a type"""
+        self.assertEqual(audio_codec.negotiate_codec("audio/ogg;q=0, audio/wav"), "wav")
+
+    def test_without_pyav_only_wav(self):
+        """Without PyAV every client gets WAV"""
+        with mock.patch.object(audio_codec, "AV_AVAILABLE", False):
+            self.assertEqual(audio_codec.negotiate_codec("audio/ogg"), "wav")
+
+
+class TestAudioPayload(unittest.TestCase):
+    """Tests for audio_payload"""
+
+    def test_base64_encodes_once(self):
+        """Raw audio is base64-encoded exactly once"""
+        payload = audio_codec.audio_payload(b"OggS", "opus")
+
+        self.assertEqual(base64.b64decode(payload["audio"]), b"OggS")
+        self.assertEqual(payload["audio_mime"], "audio/ogg")
+
+    def test_missing_audio(self):
+        """No audio still reports the codec"""
+        payload = audio_codec.audio_payload(None, "mp3")
+
+        self.assertIsNone(payload["audio"])
+        self.assertEqual(payload["audio_format"], "mp3")
+
+
+if __name__ == "__main__":
+    unittest.main()
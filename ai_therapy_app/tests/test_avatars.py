@@ -0,0 +1,113 @@
+"""
+Tests for the therapist avatar registry and manifest
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.avatars import (
+    AVATAR_MANIFEST_PATH, AvatarRegistry, avatar_registry, derivative_widths, scan_avatars
+)
+
+
+class TestScanAvatars(unittest.TestCase):
+    """Tests for scan_avatars"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        for path in ("images/avatars/female/female_asian_1.jpg",
+                     "images/avatars/female/female_asian_2.jpg",
+                     "images/therapist_avatars/female/female_asian_1.jpg",
+                     "images/therapist_avatars/male/male_african_1.jpg",
+                     "images/avatars/female/notes.txt"):
+            full_path = os.path.join(self.directory.name, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            open(full_path, "wb").close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_existing_avatars_keep_id_and_name(self):
+        """Known pictures keep their ids; new ones get the next free id"""
+        existing = [{"id": "7", "name": "Lucy", "gender": "female", "ethnicity": "asian", "number": 2}]
+        avatars = {a["path"]: a for a in scan_avatars(self.directory.name, existing=existing)}
+
+        self.assertEqual(avatars["images/avatars/female/female_asian_2.jpg"]["id"], "7")
+        self.assertEqual(avatars["images/avatars/female/female_asian_2.jpg"]["name"], "Lucy")
+        self.assertEqual(avatars["images/avatars/female/female_asian_1.jpg"]["id"], "8")
+
+    def test_earlier_directories_win_and_aliases_apply(self):
+        """Duplicates in later directories are skipped and old ethnicity names are mapped"""
+        avatars = scan_avatars(self.directory.name)
+
+        self.assertEqual(len(avatars), 3)
+        african = [a for a in avatars if a["gender"] == "male"][0]
+        self.assertEqual(african["ethnicity"], "african_american")
+        self.assertEqual(african["path"], "images/therapist_avatars/male/male_african_1.jpg")
+
+
+class TestDerivativeWidths(unittest.TestCase):
+    """Tests for derivative_widths"""
+
+    def test_never_upscales(self):
+        """Pictures are only ever made smaller"""
+        self.assertEqual(derivative_widths(200, (160, 320, 640)), [160, 200])
+        self.assertEqual(derivative_widths(100, (160, 320, 640)), [100])
+
+    def test_large_pictures_are_capped(self):
+        """Pictures wider than the largest size get every standard size"""
+        self.assertEqual(derivative_widths(2000, (320, 160, 640)), [160, 320, 640])
+
+
+class TestAvatarRegistry(unittest.TestCase):
+    """Tests for AvatarRegistry"""
+
+    def setUp(self):
+        self.registry = AvatarRegistry([
+            {"id": "1", "name": "Michael", "gender": "male", "ethnicity": "caucasian", "number": 1, "path": "a.jpg"},
+            {"id": "3", "name": "Emily", "gender": "female", "ethnicity": "caucasian", "number": 1, "path": "b.jpg"},
+            {"id": "2", "name": "Lucy", "gender": "female", "ethnicity": "asian", "number": 1, "path": "c.jpg"}
+        ], default_id="3")
+
+    def test_catalog_follows_display_order(self):
+        """Groups are listed in the picker's ethnicity order"""
+        self.assertEqual(list(self.registry.catalog["female"]), ["caucasian", "asian"])
+        self.assertEqual([a["id"] for a in self.registry.catalog["male"]["caucasian"]], ["1"])
+
+    def test_select(self):
+        """The chosen avatar is used only if it belongs to the chosen group"""
+        self.assertEqual(self.registry.select("female", "asian", "2")["name"], "Lucy")
+        self.assertEqual(self.registry.select("female", "asian", "1")["name"], "Lucy")
+        self.assertEqual(self.registry.select("female", "hispanic", "2")["name"], "Emily")
+        self.assertEqual(self.registry.select(None, None)["name"], "Emily")
+
+    def test_default_preferences(self):
+        """New users get the default avatar's group and id"""
+        self.assertEqual(self.registry.default_preferences(),
+                         {"gender": "female", "ethnicity": "caucasian", "avatar_id": "3"})
+
+    def test_derivatives_become_sources(self):
+        """Generated WebP/AVIF copies are attached to their avatar; others have none"""
+        sources = [{"type": "image/webp", "variants": [{"path": "a-160.webp", "width": 160}]}]
+        registry = AvatarRegistry([
+            {"id": "1", "name": "Michael", "gender": "male", "ethnicity": "caucasian", "number": 1, "path": "a.jpg"},
+            {"id": "2", "name": "James", "gender": "male", "ethnicity": "caucasian", "number": 2, "path": "b.jpg"}
+        ], derivatives={"a.jpg": {"source_hash": "x", "sources": sources}})
+
+        self.assertEqual(registry.get("1")["sources"], sources)
+        self.assertEqual(registry.get("2")["sources"], [])
+
+    def test_shipped_manifest_matches_pictures(self):
+        """Every avatar in the shipped manifest points at a picture that exists"""
+        self.assertTrue(os.path.exists(AVATAR_MANIFEST_PATH))
+        static_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+        for avatar in avatar_registry.by_id.values():
+            self.assertTrue(os.path.exists(os.path.join(static_dir, avatar["path"])), avatar["path"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+"""
+Tests for token-budgeted conversation history
+"""
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.conversation_history import ConversationHistory, TokenCounter, MESSAGE_TOKEN_OVERHEAD
+from app.services.transcript_cache import TranscriptCache, make_turn
+
+
+class WordCounter:
+    """Counts one token per word so budgets are easy to reason about"""
+
+    def count(self, text):
+        return len(text.split())
+
+    def count_messages(self, messages):
+        return sum(self.count(m["content"]) + MESSAGE_TOKEN_OVERHEAD for m in messages)
+
+
+def make_turns(store, session_id, count, words=5):
+    """Append alternating user/assistant turns of a fixed length to a transcript"""
+    roles = ["user", "assistant"]
+    turns = []
+    for i in range(count):
+        turns = store.append(session_id, make_turn(roles[i % 2], " ".join([f"w{i}"] * words)))
+    return turns
+
+
+class TestConversationHistory(unittest.TestCase):
+    """Tests for ConversationHistory"""
+
+    def setUp(self):
+        """Use a local-only transcript store"""
+        self.store = TranscriptCache()
+
+    def test_everything_fits_within_budget(self):
+        """Short conversations are sent in full"""
+        history = ConversationHistory(self.store, budget=1000, counter=WordCounter())
+        turns = make_turns(self.store, "s1", 4)
+
+        window = history.build_window("s1", turns)
+
+        self.assertEqual([m["content"] for m in window], [t["content"] for t in turns])
+
+    def test_window_respects_budget(self):
+        """Only the newest turns that fit the budget are sent"""
+        history = ConversationHistory(self.store, budget=30, counter=WordCounter())
+        turns = make_turns(self.store, "s1", 10)  # 9 tokens per turn
+
+        window = history.build_window("s1", turns, reserved_tokens=5)
+
+        self.assertEqual(len(window), 2)
+        self.assertEqual(window[-1]["content"], turns[-1]["content"])
+
+    def test_newest_turn_always_kept(self):
+        """A single oversized turn is still sent"""
+        history = ConversationHistory(self.store, budget=3, counter=WordCounter())
+        turns = make_turns(self.store, "s1", 1, words=50)
+
+        window = history.build_window("s1", turns)
+
+        self.assertEqual(len(window), 1)
+
+    def test_overflow_is_summarized_and_trimmed(self):
+        """Overflowing turns fold into a summary that replaces them"""
+        folded = []
+
+        def summarizer(previous, overflow):
+            folded.append(len(overflow))
+            return "earlier talk"
+
+        history = ConversationHistory(self.store, budget=30, counter=WordCounter(), summarizer=summarizer)
+        turns = make_turns(self.store, "s1", 10)
+
+        history.build_window("s1", turns)
+        history.wait_for_summaries(timeout=5)
+        window = history.build_window("s1", turns)
+
+        self.assertEqual(folded[0], 7)
+        self.assertIn("earlier talk", window[0]["content"])
+        self.assertEqual(window[0]["role"], "system")
+        self.assertEqual(self.store.get_summary("s1")["covered"], 7)
+        # Summarized turns are no longer sent
+        self.assertNotIn(turns[0]["content"], [m["content"] for m in window])
+
+    def test_invalidated_session_drops_summary(self):
+        """Invalidating a session discards its summary"""
+        history = ConversationHistory(self.store, budget=30, counter=WordCounter(), summarizer=lambda previous, overflow: "notes")
+        turns = make_turns(self.store, "s1", 10)
+        history.build_window("s1", turns)
+        history.wait_for_summaries(timeout=5)
+
+        self.store.invalidate("s1")
+        window = history.build_window("s1", make_turns(self.store, "s1", 2))
+
+        self.assertTrue(all(m["role"] != "system" for m in window))
+
+
+class TestTokenCounter(unittest.TestCase):
+    """Tests for TokenCounter loading"""
+
+    def test_count_never_waits_for_the_tokenizer(self):
+        """Before warm-up, counts are estimated while the tokenizer loads in the background"""
+        counter = TokenCounter()
+        started, release = threading.Event(), threading.Event()
+        loads = []
+
+        def slow_start():
+            loads.append(threading.current_thread().name)
+            started.set()
+            release.wait(5)
+
+        with mock.patch.object(counter, "start", side_effect=slow_start):
+            self.assertEqual(counter.count("a" * 40), 10)
+            self.assertEqual(counter.count("a" * 40), 10)
+            self.assertTrue(started.wait(5))
+            release.set()
+
+        self.assertEqual(loads, ["tokenizer-load"])
+
+    def test_missing_tokenizer_falls_back_to_estimates(self):
+        """A tokenizer that cannot be loaded leaves the counter estimating"""
+        counter = TokenCounter(tokenizer_file="/nonexistent/tokenizer.json")
+        with mock.patch.dict(sys.modules, {"tokenizers": None}):
+            counter.start()
+
+        self.assertEqual(counter.count("a" * 40), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
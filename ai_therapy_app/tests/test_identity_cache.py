@@ -0,0 +1,56 @@
+"""
+Tests for the session identity cache
+"""
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.identity_cache import IdentityCache, UserIdentity, cookie_key
+
+
+class TestIdentityCache(unittest.TestCase):
+    """Tests for IdentityCache"""
+
+    def setUp(self):
+        self.cache = IdentityCache(ttl=30, max_entries=2)
+        self.alice = UserIdentity(1, "alice@example.com")
+        self.bob = UserIdentity(2, "bob@example.com")
+
+    def test_cookies_are_hashed(self):
+        """Keys are stable digests of the cookie, and a missing cookie has no key"""
+        self.assertEqual(cookie_key("abc"), cookie_key("abc"))
+        self.assertNotIn("abc", cookie_key("abc"))
+        self.assertIsNone(cookie_key(None))
+
+    def test_entries_expire(self):
+        """Identities are forgotten after the TTL"""
+        with patch("app.core.identity_cache.time.monotonic", return_value=100.0):
+            self.cache.put("a", self.alice)
+            self.assertEqual(self.cache.get("a"), self.alice)
+        with patch("app.core.identity_cache.time.monotonic", return_value=131.0):
+            self.assertIsNone(self.cache.get("a"))
+
+    def test_least_recently_used_is_evicted(self):
+        """The cache stays within max_entries"""
+        self.cache.put("a", self.alice)
+        self.cache.put("b", self.bob)
+        self.cache.get("a")
+        self.cache.put("c", self.bob)
+
+        self.assertEqual(self.cache.get("a"), self.alice)
+        self.assertIsNone(self.cache.get("b"))
+
+    def test_zero_ttl_disables_cache(self):
+        """With IDENTITY_CACHE_TTL=0 nothing is cached"""
+        cache = IdentityCache(ttl=0)
+        cache.put("a", self.alice)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
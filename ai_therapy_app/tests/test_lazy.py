@@ -0,0 +1,77 @@
+"""
+Tests for lazy initialization helpers
+"""
+import os
+import sys
+import threading
+import unittest
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.lazy import LazyResource, import_time_report, warm_up
+
+
+class TestLazyResource(unittest.TestCase):
+    """Tests for LazyResource"""
+
+    def test_builds_once_on_first_use(self):
+        """The factory runs once, and not before the value is needed"""
+        calls = []
+        resource = LazyResource(lambda: calls.append(1) or "value")
+
+        self.assertFalse(resource.ready)
+        self.assertEqual(calls, [])
+        threads = [threading.Thread(target=resource.get) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(resource.get(), "value")
+        self.assertEqual(calls, [1])
+
+    def test_forwards_attributes(self):
+        """A lazy resource can be used like the value it wraps"""
+        resource = LazyResource(lambda: "hello")
+
+        self.assertEqual(resource.upper(), "HELLO")
+
+    def test_reset(self):
+        """Reset makes the next use rebuild the value"""
+        values = iter([1, 2])
+        resource = LazyResource(lambda: next(values))
+        resource.get()
+        resource.reset()
+
+        self.assertEqual(resource.get(), 2)
+
+
+class TestWarmUp(unittest.TestCase):
+    """Tests for warm_up"""
+
+    def test_failed_step_does_not_stop_others(self):
+        """Every step runs even if an earlier one fails"""
+        done = []
+
+        def failing():
+            raise RuntimeError("unreachable")
+
+        warm_up(failing, lambda: done.append(True)).join(5)
+
+        self.assertEqual(done, [True])
+
+
+class TestImportTimeReport(unittest.TestCase):
+    """Tests for import_time_report"""
+
+    def test_reports_packages(self):
+        """Import time is broken down by top-level package"""
+        total, rows = import_time_report("json")
+
+        self.assertIn("json", [name for name, _, _ in rows])
+        self.assertEqual(total, sum(us for _, us, _ in rows))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+Tests for the LLM service
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm_service
+
+
+class TestStreamLLMResponse(unittest.TestCase):
+    """Tests for streamed LLM responses"""
+
+    def setUp(self):
+        """Start every test with an empty session transcript"""
+        llm_service.clear_session_history("stream-test")
+
+    def test_demo_mode_yields_single_fragment(self):
+        """Demo mode streams the canned response in one fragment"""
+        with mock.patch.object(llm_service, "api_key", None):
+            fragments = list(llm_service.stream_llm_response("I feel anxious", "stream-test"))
+
+        self.assertEqual(len(fragments), 1)
+        self.assertIn("anxiety", fragments[0])
+
+    def test_tokens_are_yielded_and_recorded(self):
+        """Tokens are yielded as they arrive and the full reply is saved to the transcript"""
+        with mock.patch.object(llm_service, "api_key", "test-key"), \
+                mock.patch.object(llm_service.llm_client, "stream_sync", return_value=iter(["Hello", " there."])):
+            fragments = list(llm_service.stream_llm_response("Hi", "stream-test"))
+
+        self.assertEqual(fragments, ["Hello", " there."])
+        history = llm_service.transcript_cache.get("stream-test")
+        self.assertEqual((history[-2]["role"], history[-2]["content"]), ("user", "Hi"))
+        self.assertEqual((history[-1]["role"], history[-1]["content"]), ("assistant", "Hello there."))
+
+    def test_error_before_first_token_falls_back(self):
+        """A failure before any token arrives yields the fallback response"""
+        with mock.patch.object(llm_service, "api_key", "test-key"), \
+                mock.patch.object(llm_service.llm_client, "stream_sync", side_effect=RuntimeError("down")):
+            fragments = list(llm_service.stream_llm_response("Hi", "stream-test"))
+
+        self.assertEqual(fragments, [llm_service.FALLBACK_RESPONSE])
+
+
+class TestPersonalizationPrompt(unittest.TestCase):
+    """Tests for the cached personalization prompt fragment"""
+
+    def test_prompt_is_reused_per_profile_version(self):
+        """The same profile version gets the same prompt object back"""
+        context = {"user_id": "prompt-test", "profile_version": 1, "name": "Sam"}
+        prompt = llm_service.personalization_prompt(context)
+
+        self.assertIn("Sam", prompt)
+        self.assertIs(llm_service.personalization_prompt(dict(context)), prompt)
+        self.assertIsNot(llm_service.personalization_prompt({**context, "profile_version": 2}), prompt)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+"""
+Tests for micro-batched message classification
+"""
+import importlib.util
+import os
+import sys
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ai.message_classifier import MessageClassifier, benchmark
+from app.services.message_classification import MessageClassificationService
+
+
+class KeywordClassifier:
+    """Labels messages by a keyword, recording each batch it is given"""
+
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, texts, is_from_ai):
+        self.batches.append(list(texts))
+        return [
+            {"therapy_technique": "reframing"} if from_ai else {"emotion": "anxious" if "worried" in text else None}
+            for text, from_ai in zip(texts, is_from_ai)
+        ]
+
+
+class TestMessageClassificationService(unittest.TestCase):
+    """Tests for MessageClassificationService"""
+
+    def setUp(self):
+        self.session = MagicMock()
+        self.model = object()
+        self.classifier = KeywordClassifier()
+        self.service = MessageClassificationService(batch_size=3, max_delay=0.2)
+        self.service.configure(session_factory=lambda: self.session, model=self.model, classifier=self.classifier)
+
+    def tearDown(self):
+        self.service.close()
+
+    def test_batch_is_written_in_one_bulk_update(self):
+        """Labels for a batch go to the database together; empty predictions are skipped"""
+        now = time.monotonic()
+        self.service.classify_batch([
+            (1, "I'm worried about work", False, now, self.model),
+            (2, "Let's look at that differently", True, now, self.model),
+            (3, "Thanks", False, now, self.model)
+        ])
+
+        self.session.bulk_update_mappings.assert_called_once_with(self.model, [
+            {"id": 1, "emotion": "anxious"},
+            {"id": 2, "therapy_technique": "reframing"}
+        ])
+        self.session.commit.assert_called_once()
+        self.assertEqual(self.service.stats()["classified"], 3)
+
+    def test_labels_go_back_through_the_saving_sessionmaker(self):
+        """Messages watched from two databases are each written to their own"""
+        other_session, other_model = MagicMock(), object()
+        self.service.session_factories[other_model] = lambda: other_session
+        now = time.monotonic()
+        self.service.classify_batch([
+            (1, "I'm worried", False, now, self.model),
+            (1, "Still worried", False, now, other_model)
+        ])
+
+        self.session.bulk_update_mappings.assert_called_once_with(self.model, [{"id": 1, "emotion": "anxious"}])
+        other_session.bulk_update_mappings.assert_called_once_with(other_model, [{"id": 1, "emotion": "anxious"}])
+
+    def test_failed_write_is_counted(self):
+        """A database error drops the batch without stopping the service"""
+        self.session.bulk_update_mappings.side_effect = RuntimeError("locked")
+        self.service.classify_batch([(1, "I'm worried", False, time.monotonic(), self.model)])
+
+        self.session.rollback.assert_called_once()
+        self.assertEqual(self.service.stats()["failed"], 1)
+
+    def test_queued_messages_are_batched_within_max_delay(self):
+        """A partial batch is classified once its oldest message has waited max_delay"""
+        self.service.start()
+        self.assertTrue(self.service.submit(1, "I'm worried", False))
+        self.assertTrue(self.service.submit(2, "Try this", True))
+
+        deadline = time.monotonic() + 5
+        while self.service.stats()["classified"] < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        self.assertEqual(self.classifier.batches, [["I'm worried", "Try this"]])
+        self.assertLess(self.service.stats()["max_latency_ms"], 1000)
+
+    def test_first_submit_starts_the_service(self):
+        """Workers that never ran warm-up still classify messages"""
+        self.assertTrue(self.service.submit(1, "I'm worried", False))
+        self.assertIsNotNone(self.service._thread)
+
+    def test_without_a_model_nothing_is_queued(self):
+        """Without a trained classifier, submitting is a no-op and the model is looked for once"""
+        service = MessageClassificationService()
+        with patch.object(MessageClassifier, "load", return_value=None) as load:
+            self.assertFalse(service.submit(1, "I'm worried", False))
+            self.assertFalse(service.submit(2, "Still worried", False))
+        load.assert_called_once()
+
+
+@unittest.skipUnless(importlib.util.find_spec("sqlalchemy"), "sqlalchemy is not installed")
+class TestWatch(unittest.TestCase):
+    """Tests for queueing committed messages from watched sessionmakers"""
+
+    def test_each_watched_sessionmaker_queues_its_own_model(self):
+        """Commits through either sessionmaker are queued with the model that saved them"""
+        from sqlalchemy import Boolean, Column, Integer, Text, create_engine
+        from sqlalchemy.orm import declarative_base, sessionmaker
+
+        factories, models = [], []
+        for _ in range(2):
+            Base = declarative_base()
+
+            class Message(Base):
+                __tablename__ = "message"
+                id = Column(Integer, primary_key=True)
+                content = Column(Text)
+                is_from_ai = Column(Boolean)
+
+            engine = create_engine("sqlite://")
+            Base.metadata.create_all(engine)
+            factories.append(sessionmaker(bind=engine))
+            models.append(Message)
+
+        service = MessageClassificationService()
+        for factory, model in zip(factories, models):
+            service.watch(factory, model)
+        with patch.object(service, "submit") as submit:
+            for factory, model in zip(factories, models):
+                session = factory()
+                session.add(model(content="I'm worried", is_from_ai=False))
+                session.commit()
+                session.close()
+
+        self.assertEqual(submit.call_args_list, [((1, "I'm worried", False, model),) for model in models])
+        self.assertEqual(service.session_factories, dict(zip(models, factories)))
+
+
+class TestBenchmark(unittest.TestCase):
+    """Tests for the classifier throughput benchmark"""
+
+    def test_reports_each_batch_size(self):
+        """Every message is classified once per batch size"""
+        calls = []
+        results = benchmark(lambda texts, flags: calls.append(len(texts)), ["a"] * 10, [False] * 10, (1, 4))
+
+        self.assertEqual([r["batch_size"] for r in results], [1, 4])
+        self.assertEqual(calls, [1] * 10 + [4, 4, 2])
+        self.assertTrue(all(r["messages_per_second"] > 0 for r in results))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+"""
+Tests for incremental mood statistics
+"""
+import os
+import random
+import sys
+import unittest
+from datetime import datetime, timedelta
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ai.mood_stats import MoodStats, MoodWindow
+from app.ai.personalization import PersonalizationEngine, UserProfile
+from app.ai.timeseries import MoodSeries
+
+
+def reference_summary(scores):
+    """Recompute the summary from scratch the way it used to be calculated"""
+    if len(scores) < 2:
+        return {"trend": "unknown", "stability": "unknown"}
+    avg = sum(scores) / len(scores)
+    first, second = scores[:len(scores) // 2], scores[len(scores) // 2:]
+    first_avg, second_avg = sum(first) / len(first), sum(second) / len(second)
+    trend = "improving" if second_avg > first_avg + 1 else "declining" if second_avg < first_avg - 1 else "stable"
+    std_dev = (sum((x - avg) ** 2 for x in scores) / len(scores)) ** 0.5
+    stability = ("very stable" if std_dev < 1 else "stable" if std_dev < 2
+                 else "somewhat unstable" if std_dev < 3 else "unstable")
+    return {"trend": trend, "stability": stability, "average_score": round(avg, 1), "recent_scores": scores}
+
+
+class TestMoodWindow(unittest.TestCase):
+    """Tests for MoodWindow"""
+
+    def test_matches_full_recomputation(self):
+        """Sliding statistics agree with recomputing over the last scores"""
+        rng = random.Random(7)
+        for size in (1, 2, 7, 30):
+            window = MoodWindow(size)
+            scores = []
+            for _ in range(200):
+                score = rng.randint(1, 10)
+                scores.append(score)
+                window.add(score)
+                self.assertEqual(window.summary(), reference_summary(scores[-size:]))
+
+    def test_trend_follows_recent_scores(self):
+        """Improvement shows up once the window has moved past the low scores"""
+        window = MoodWindow(4)
+        for score in (2, 2, 2, 2, 8, 8):
+            window.add(score)
+        self.assertEqual(window.summary()["trend"], "improving")
+        self.assertEqual(window.scores(), [2, 2, 8, 8])
+
+
+class TestMoodStats(unittest.TestCase):
+    """Tests for MoodStats and its use in profiles"""
+
+    def test_windows_are_independent(self):
+        """Each window only sees its own number of recent scores"""
+        stats = MoodStats(windows=(2, 5))
+        for score in (1, 1, 1, 9, 9):
+            stats.add(score)
+        self.assertEqual(stats.summary(2)["average_score"], 9)
+        self.assertEqual(stats.summary(5)["average_score"], 4.2)
+
+    def test_built_from_stored_series(self):
+        """Statistics rebuilt from a stored series match incremental updates"""
+        start = datetime(2024, 1, 1)
+        series = MoodSeries()
+        incremental = MoodStats()
+        for i in range(100):
+            series.append(start + timedelta(days=i), i % 10)
+            incremental.add(i % 10)
+
+        rebuilt = MoodStats.from_series(series)
+        for size in rebuilt.windows:
+            self.assertEqual(rebuilt.summary(size), incremental.summary(size))
+
+    def test_context_uses_profile_stats(self):
+        """The personalization context reports the trend of recent moods"""
+        engine = PersonalizationEngine()
+        profile = UserProfile("user-1")
+        profile.update_data_permissions({"data_collection_consent": True})
+        engine.profiles.put("user-1", profile)
+        for score in (3, 3, 3, 8, 8, 8):
+            profile.add_mood_data(score)
+
+        mood_trend = engine.generate_personalization_context("user-1")["mood_trend"]
+        self.assertEqual(mood_trend["trend"], "improving")
+        self.assertEqual(mood_trend["recent_scores"], [3, 3, 3, 8, 8, 8])
+
+
+if __name__ == "__main__":
+    unittest.main()
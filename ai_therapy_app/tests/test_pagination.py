@@ -0,0 +1,153 @@
+"""
+Tests for keyset pagination
+"""
+import importlib.util
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.pagination import decode_cursor, encode_cursor, keyset_page
+
+SQLALCHEMY_AVAILABLE = importlib.util.find_spec("sqlalchemy") is not None
+FASTAPI_AVAILABLE = importlib.util.find_spec("fastapi") is not None
+
+
+class TestCursors(unittest.TestCase):
+    """Tests for encode_cursor and decode_cursor"""
+
+    def test_round_trip(self):
+        """Datetimes and ids survive encoding"""
+        values = [datetime(2024, 5, 1, 9, 30, 15, 120), 42]
+        cursor = encode_cursor(values)
+        self.assertRegex(cursor, r"^[A-Za-z0-9_-]+$")
+        self.assertEqual(decode_cursor(cursor), values)
+
+    def test_malformed_cursors_are_rejected(self):
+        """Anything that is not a cursor raises ValueError"""
+        for cursor in ("not a cursor!", encode_cursor([1])[:-2] + "@@", "eyJhIjogMX0"):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+
+@unittest.skipUnless(SQLALCHEMY_AVAILABLE, "sqlalchemy is not installed")
+class TestKeysetPage(unittest.TestCase):
+    """Tests for keyset_page against SQLite"""
+
+    def setUp(self):
+        from sqlalchemy import Column, DateTime, Integer, create_engine
+        from sqlalchemy.orm import declarative_base, sessionmaker
+
+        Base = declarative_base()
+
+        class Message(Base):
+            __tablename__ = "messages"
+            id = Column(Integer, primary_key=True)
+            timestamp = Column(DateTime, nullable=False)
+
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        self.db = sessionmaker(bind=engine)()
+        # Pairs of messages share a timestamp, so the id has to break ties
+        start = datetime(2024, 1, 1)
+        self.db.add_all(Message(id=i, timestamp=start + timedelta(minutes=i // 2)) for i in range(1, 12))
+        self.db.commit()
+        self.Message = Message
+        self.columns = (Message.timestamp, Message.id)
+
+    def tearDown(self):
+        self.db.close()
+
+    def collect(self, descending):
+        ids, cursor, pages = [], None, 0
+        while True:
+            rows, cursor = keyset_page(self.db.query(self.Message), self.columns, cursor, 3, descending)
+            ids.extend(row.id for row in rows)
+            pages += 1
+            if cursor is None:
+                return ids, pages
+
+    def test_pages_cover_every_row_once(self):
+        """Walking the cursors visits each row exactly once, in order, in both directions"""
+        self.assertEqual(self.collect(False), (list(range(1, 12)), 4))
+        self.assertEqual(self.collect(True), (list(range(11, 0, -1)), 4))
+
+    def test_exact_last_page_has_no_cursor(self):
+        """A page that ends on the last row does not point at an empty page"""
+        rows, cursor = keyset_page(self.db.query(self.Message), self.columns, limit=11)
+        self.assertEqual(len(rows), 11)
+        self.assertIsNone(cursor)
+
+    def test_offset_applies_after_ordering(self):
+        """Count-based paging skips rows of the ordered query"""
+        rows, cursor = keyset_page(self.db.query(self.Message), self.columns, limit=3, offset=4)
+        self.assertEqual([row.id for row in rows], [5, 6, 7])
+        self.assertIsNotNone(cursor)
+
+    def test_cursor_must_match_columns(self):
+        """A cursor for a different sort key is rejected"""
+        with self.assertRaises(ValueError):
+            keyset_page(self.db.query(self.Message), self.columns, encode_cursor([1]))
+
+    def test_cursor_values_must_match_column_types(self):
+        """Well-formed cursors holding values of the wrong type are rejected before the query runs"""
+        for values in (["x", 1], [{}, 1], [datetime(2024, 1, 1), "1"], [datetime(2024, 1, 1), True]):
+            with self.assertRaises(ValueError):
+                keyset_page(self.db.query(self.Message), self.columns, encode_cursor(values))
+
+
+@unittest.skipUnless(SQLALCHEMY_AVAILABLE and FASTAPI_AVAILABLE, "sqlalchemy or fastapi is not installed")
+class TestSessionEndpoints(unittest.TestCase):
+    """Tests for the paginated session API endpoints"""
+
+    def setUp(self):
+        from fastapi import Response
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.db.session import Base
+        from app.models.therapy import SessionType, TherapyApproach, TherapyMessage, TherapySession
+        from app.models.user import User
+
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        self.db = sessionmaker(bind=engine)()
+        self.user = User(id=1, email="user@example.com", hashed_password="x")
+        start = datetime(2024, 1, 1)
+        self.db.add(self.user)
+        self.db.add_all(
+            TherapySession(id=i, user_id=1, session_type=SessionType.TEXT, therapy_approach=TherapyApproach.CBT,
+                           scheduled_start=start + timedelta(days=i), scheduled_end=start + timedelta(days=i, hours=1))
+            for i in range(1, 6)
+        )
+        self.db.add_all(
+            TherapyMessage(id=i, session_id=1, content=f"message {i}", timestamp=start + timedelta(minutes=i))
+            for i in range(1, 6)
+        )
+        self.db.commit()
+        self.Response = Response
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_skip_still_pages_sessions(self):
+        """Legacy ?skip=N requests page newest first by count"""
+        from app.api.api_v1.endpoints.sessions import read_sessions
+
+        sessions = read_sessions(self.Response(), db=self.db, cursor=None, skip=2, limit=2, status=None,
+                                 start_date=None, end_date=None, current_user=self.user)
+        self.assertEqual([session.id for session in sessions], [3, 2])
+
+    def test_skip_still_pages_messages(self):
+        """Legacy ?skip=N requests page messages oldest first by count"""
+        from app.api.api_v1.endpoints.sessions import read_session_messages
+
+        messages = read_session_messages(db=self.db, response=self.Response(), session_id=1, cursor=None,
+                                         skip=3, limit=10, current_user=self.user)
+        self.assertEqual([message.id for message in messages], [4, 5])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+"""
+Tests for profile versions and personalization context caching
+"""
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ai.personalization import PersonalizationEngine, UserProfile
+
+
+class TestProfileVersion(unittest.TestCase):
+    """Tests for UserProfile.version"""
+
+    def test_mutators_bump_version(self):
+        """Every change that affects the context gives a higher version"""
+        profile = UserProfile("user-1")
+        versions = [profile.version]
+        profile.add_mood_data(6)
+        versions.append(profile.version)
+        profile.update_therapy_approaches({"cbt": 8})
+        versions.append(profile.version)
+        profile.clear_topic_interests()
+        versions.append(profile.version)
+
+        self.assertEqual(versions, sorted(set(versions)))
+
+    def test_session_interactions_keep_version(self):
+        """Recording a chat turn does not invalidate the context"""
+        profile = UserProfile("user-1")
+        version = profile.version
+        profile.record_session_interaction("s1", {})
+        self.assertEqual(profile.version, version)
+
+    def test_versions_are_unique_across_objects(self):
+        """A reloaded copy of a profile never shares a version with the old one"""
+        self.assertNotEqual(UserProfile("user-1").version, UserProfile("user-1").version)
+
+
+class TestContextCache(unittest.TestCase):
+    """Tests for PersonalizationEngine.generate_personalization_context"""
+
+    def setUp(self):
+        self.engine = PersonalizationEngine()
+        self.profile = UserProfile("user-1")
+        self.profile.update_data_permissions({"data_collection_consent": True})
+        self.engine.profiles.put("user-1", self.profile)
+
+    def test_context_is_reused_until_profile_changes(self):
+        """The context is built once per profile version"""
+        with patch.object(self.engine, "_build_personalization_context",
+                          wraps=self.engine._build_personalization_context) as build:
+            self.engine.generate_personalization_context("user-1")
+            self.profile.record_session_interaction("s1", {})
+            context = self.engine.generate_personalization_context("user-1")
+            self.assertEqual(build.call_count, 1)
+            self.assertEqual(context["session_count"], 1)
+
+            self.profile.update_topic_interest("sleep", 0.9)
+            context = self.engine.generate_personalization_context("user-1")
+            self.assertEqual(build.call_count, 2)
+            self.assertEqual(context["top_interests"], {"sleep": 0.9})
+            self.assertEqual(context["profile_version"], self.profile.version)
+
+    def test_consent_change_rebuilds_context(self):
+        """Revoking consent drops the detailed context"""
+        self.assertIn("mood_trend", self.engine.generate_personalization_context("user-1"))
+        self.profile.update_data_permissions({"data_collection_consent": False})
+        self.assertNotIn("mood_trend", self.engine.generate_personalization_context("user-1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+"""
+Tests for the in-memory profile cache
+"""
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ai import personalization
+from app.ai.personalization import PersonalizationEngine
+from app.ai.profile_cache import PROFILE_CACHE_MIN_ENTRY_BYTES, ProfileCache, profile_size
+from app.ai.profile_store import ProfileStore
+from app.ai.profile_writer import ProfileWriter
+
+
+class Sized:
+    """Cached value with a settable size"""
+
+    def __init__(self, stored_bytes=0):
+        self.stored_bytes = stored_bytes
+
+
+class TestProfileCache(unittest.TestCase):
+    """Tests for ProfileCache"""
+
+    def setUp(self):
+        self.evicted = []
+
+    def make_cache(self, **kwargs):
+        return ProfileCache(on_evict=lambda key, value: self.evicted.append(key), **kwargs)
+
+    def test_least_recently_used_is_evicted(self):
+        """The entry bound evicts the least recently used profile"""
+        cache = self.make_cache(max_entries=2)
+        cache.put("a", Sized())
+        cache.put("b", Sized())
+        cache.get("a")
+        cache.put("c", Sized())
+
+        self.assertEqual(self.evicted, ["b"])
+        self.assertIn("a", cache)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_byte_bound_follows_growth(self):
+        """Profiles that grow are re-measured and push older ones out"""
+        cache = self.make_cache(max_bytes=100, sizeof=lambda profile: profile.stored_bytes)
+        first, second = Sized(40), Sized(40)
+        cache.put("a", first)
+        cache.put("b", second)
+        self.assertEqual(cache.stats()["resident_bytes"], 80)
+
+        second.stored_bytes = 90
+        cache.get("b")
+
+        self.assertEqual(self.evicted, ["a"])
+        self.assertEqual(cache.stats()["resident_bytes"], 90)
+
+    def test_unsaved_profiles_count_toward_the_byte_bound(self):
+        """Profiles never saved, such as those without consent, are charged the minimum size"""
+        self.assertEqual(profile_size(Sized(0)), PROFILE_CACHE_MIN_ENTRY_BYTES)
+        self.assertEqual(profile_size(Sized(PROFILE_CACHE_MIN_ENTRY_BYTES * 2)), PROFILE_CACHE_MIN_ENTRY_BYTES * 2)
+
+        cache = self.make_cache(max_bytes=PROFILE_CACHE_MIN_ENTRY_BYTES * 2)
+        for key in "abc":
+            cache.put(key, Sized())
+        self.assertEqual(self.evicted, ["a"])
+
+    def test_expired_entries_are_evicted(self):
+        """Entries past their TTL are handed to on_evict and count as misses"""
+        cache = self.make_cache(ttl=0)
+        cache.put("a", Sized())
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(self.evicted, ["a"])
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["expirations"]), (0, 1, 1))
+
+    def test_pop_does_not_call_on_evict(self):
+        """Removing a deleted profile does not try to save it"""
+        cache = self.make_cache()
+        cache.put("a", Sized())
+
+        self.assertIsNotNone(cache.pop("a"))
+        self.assertEqual(self.evicted, [])
+        self.assertIsNone(cache.pop("a"))
+
+    def test_negative_entries(self):
+        """Missing users are remembered until they are cached or expire"""
+        cache = self.make_cache()
+        cache.mark_missing("a")
+        self.assertTrue(cache.is_missing("a"))
+
+        cache.put("a", Sized())
+        self.assertFalse(cache.is_missing("a"))
+
+        expiring = self.make_cache(ttl=0)
+        expiring.mark_missing("a")
+        self.assertFalse(expiring.is_missing("a"))
+
+
+class TestEngineProfileCache(unittest.TestCase):
+    """Tests for PersonalizationEngine profile caching"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ProfileStore(os.path.join(self.directory.name, "profiles.sqlite3"))
+        self.writer = ProfileWriter(interval=60)
+        self.patches = [
+            patch.object(personalization, "profile_store", self.store),
+            patch.object(personalization, "profile_writer", self.writer)
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.writer.close()
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_missing_profiles_skip_the_store(self):
+        """A user without a profile is looked up in the store only once"""
+        engine = PersonalizationEngine()
+        engine.get_user_profile("user-1")
+        engine.profiles.pop("user-1")
+        engine.profiles.mark_missing("user-1")
+
+        with patch.object(self.store, "read") as read:
+            engine.get_user_profile("user-1")
+        read.assert_not_called()
+
+    def test_evicted_profiles_are_saved(self):
+        """Pending updates are saved when a profile is evicted"""
+        engine = PersonalizationEngine()
+        engine.profiles.max_entries = 1
+        profile = engine.get_user_profile("user-1")
+        profile.data_collection_consent = True
+        engine.update_profile_from_session("user-1", {"session_id": "s1", "mood_score": 6})
+
+        engine.get_user_profile("user-2")
+
+        self.assertEqual(self.writer.pending(), 0)
+        self.assertTrue(self.store.exists(profile.secure_id))
+        self.assertEqual(len(engine.get_user_profile("user-1").mood_patterns), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+"""
+Tests for versioned profile section records and lazy section loading
+"""
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ai import profile_codec
+from app.ai.personalization import PersonalizationEngine, UserProfile
+from app.ai.profile_codec import SECTION_SCHEMA_VERSION, dump_section, is_current_record, load_section
+from app.ai.profile_store import ProfileStore
+
+SAMPLE = {"goal": "sleep better", "created_at": datetime(2024, 4, 1, 12, 30), "priority": 2, "tags": ["rest"]}
+
+
+class TestProfileCodec(unittest.TestCase):
+    """Tests for section records"""
+
+    def test_json_codec_round_trip(self):
+        """Without msgpack, sections are JSON payloads inside a record"""
+        with patch.object(profile_codec, "MSGPACK_AVAILABLE", False):
+            data = dump_section(SAMPLE)
+        self.assertTrue(is_current_record(data))
+        self.assertEqual(data[3:4], profile_codec.CODEC_JSON)
+        self.assertEqual(load_section(data), SAMPLE)
+
+    @unittest.skipUnless(profile_codec.MSGPACK_AVAILABLE, "msgpack is not installed")
+    def test_msgpack_codec_round_trip(self):
+        """With msgpack, sections are smaller than their JSON form"""
+        data = dump_section(SAMPLE)
+        self.assertEqual(data[3:4], profile_codec.CODEC_MSGPACK)
+        self.assertEqual(load_section(data), SAMPLE)
+        with patch.object(profile_codec, "MSGPACK_AVAILABLE", False):
+            self.assertLess(len(data), len(dump_section(SAMPLE)))
+
+    def test_binary_payloads_pass_through(self):
+        """Bytes encoded by their owner come back unchanged"""
+        self.assertEqual(load_section(dump_section(b"\x01\x02")), b"\x01\x02")
+
+    def test_older_formats_are_read(self):
+        """JSON text from before versioned records still decodes"""
+        self.assertEqual(load_section('{"when":{"$datetime":"2024-01-01T00:00:00"}}'), {"when": datetime(2024, 1, 1)})
+
+    def test_newer_schema_is_rejected(self):
+        """Records from a newer schema version are not misread"""
+        data = bytearray(dump_section({}))
+        data[2] = SECTION_SCHEMA_VERSION + 1
+        with self.assertRaises(ValueError):
+            load_section(bytes(data))
+
+
+class TestLazySections(unittest.TestCase):
+    """Tests for decoding profile sections on first use"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ProfileStore(os.path.join(self.directory.name, "profiles.sqlite3"))
+        profile = UserProfile("user-1")
+        profile.data_collection_consent = True
+        profile.add_therapy_goal("sleep better")
+        profile.add_mood_data(5)
+        profile.update_communication_style({"verbosity": "brief"})
+        profile.save(store=self.store)
+        self.secure_id = profile.secure_id
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_sections_are_decoded_on_first_use(self):
+        """Only the sections that are used get decoded"""
+        loaded = UserProfile.load("user-1", store=self.store)
+        self.assertTrue(loaded.data_collection_consent)
+        self.assertNotIn("therapy_goals", loaded.__dict__)
+
+        self.assertEqual(loaded.communication_style, {"verbosity": "brief"})
+        self.assertIn("communication_style", loaded.__dict__)
+        self.assertNotIn("therapy_goals", loaded.__dict__)
+        self.assertEqual(loaded.therapy_goals[0]["goal"], "sleep better")
+
+    def test_context_without_consent_skips_history(self):
+        """The basic context for a non-consenting user leaves mood and goals encoded"""
+        loaded = UserProfile.load("user-1", store=self.store)
+        loaded.update_data_permissions({"data_collection_consent": False})
+        engine = PersonalizationEngine()
+        engine.profiles.put("user-1", loaded)
+
+        context = engine.generate_personalization_context("user-1")
+        self.assertEqual(context["communication_style"], {"verbosity": "brief"})
+        self.assertNotIn("mood_patterns", loaded.__dict__)
+        self.assertNotIn("therapy_goals", loaded.__dict__)
+
+    def test_undecoded_sections_are_not_rewritten(self):
+        """Saving after a small change writes only that section, never the consent in meta"""
+        loaded = UserProfile.load("user-1", store=self.store)
+        loaded.update_topic_interest("work", 0.7)
+        with patch.object(self.store, "write", wraps=self.store.write) as write:
+            loaded.save(store=self.store)
+        self.assertEqual(set(write.call_args[0][1]), {"topic_interests"})
+
+    def test_older_rows_are_rewritten_as_records(self):
+        """Sections stored as JSON text are upgraded on the next save"""
+        self.store.write(self.secure_id, {"preferences": b""})
+        self.store._connect().execute(
+            "UPDATE profile_sections SET data = ? WHERE secure_id = ? AND section = 'preferences'",
+            ('{"theme":"dark"}', self.secure_id)
+        )
+
+        loaded = UserProfile.load("user-1", store=self.store)
+        self.assertEqual(loaded.preferences, {"theme": "dark"})
+        loaded.save(store=self.store)
+        self.assertTrue(is_current_record(self.store.read_raw(self.secure_id, ["preferences"])["preferences"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
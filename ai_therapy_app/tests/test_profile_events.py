@@ -0,0 +1,197 @@
+"""
+Tests for cross-worker profile invalidation
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ai import personalization
+from app.ai.personalization import PersonalizationEngine, UserProfile
+from app.ai.profile_events import ProfileInvalidationBus
+from app.ai.profile_store import ProfileStore
+from app.ai.profile_writer import ProfileWriter
+
+
+class PublishRecorder:
+    """Redis stand-in that records published messages and counts subscriptions"""
+
+    def __init__(self):
+        self.published = []
+        self.subscriptions = 0
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+    def pubsub(self, **kwargs):
+        return QuietPubSub(self)
+
+
+class QuietPubSub:
+    """Subscription on which nothing ever arrives"""
+
+    def __init__(self, redis):
+        self.redis = redis
+
+    def subscribe(self, channel):
+        self.redis.subscriptions += 1
+
+    def get_message(self, timeout=None):
+        time.sleep(0.01)
+
+    def close(self):
+        pass
+
+
+class TestProfileInvalidationBus(unittest.TestCase):
+    """Tests for ProfileInvalidationBus"""
+
+    def test_other_workers_messages_are_applied(self):
+        """Messages from another worker reach on_invalidate, our own are ignored"""
+        received = []
+        sender, receiver = ProfileInvalidationBus(), ProfileInvalidationBus()
+        redis = PublishRecorder()
+        sender.configure(redis)
+        receiver.configure(redis, on_invalidate=lambda user_id, version: received.append((user_id, version)))
+
+        sender.publish(7, 42)
+        _, message = redis.published[0]
+        receiver.handle(message)
+        sender.handle(message)
+
+        self.assertEqual(received, [(7, 42)])
+        self.assertEqual(json.loads(message)["version"], 42)
+
+    def test_without_redis_nothing_happens(self):
+        """A bus without Redis neither publishes nor starts a listener"""
+        bus = ProfileInvalidationBus()
+        bus.publish(1, 1)
+        bus.start()
+        self.assertIsNone(bus._thread)
+
+    def test_listener_starts_on_first_publish(self):
+        """Workers that never ran warm-up still subscribe, once"""
+        bus = ProfileInvalidationBus()
+        redis = PublishRecorder()
+        bus.configure(redis)
+        bus.publish(1, 1)
+        bus.publish(1, 2)
+
+        deadline = time.monotonic() + 5
+        while redis.subscriptions == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        bus.close()
+        self.assertEqual(redis.subscriptions, 1)
+
+        bus.publish(1, 3)
+        self.assertIsNone(bus._thread)
+
+    def test_malformed_messages_are_ignored(self):
+        """Garbage on the channel does not reach the cache"""
+        received = []
+        bus = ProfileInvalidationBus()
+        bus.configure(None, on_invalidate=lambda *args: received.append(args))
+        bus.handle(b"not json")
+        self.assertEqual(received, [])
+
+
+class TestEngineInvalidation(unittest.TestCase):
+    """Tests for PersonalizationEngine reacting to invalidations"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ProfileStore(os.path.join(self.directory.name, "profiles.sqlite3"))
+        self.writer = ProfileWriter(interval=60)
+        self.bus = ProfileInvalidationBus()
+        self.redis = PublishRecorder()
+        self.bus.configure(self.redis)
+        self.patches = [
+            patch.object(personalization, "profile_store", self.store),
+            patch.object(personalization, "profile_writer", self.writer),
+            patch.object(personalization, "profile_events", self.bus)
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.bus.close()
+        self.writer.close()
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_saves_are_broadcast(self):
+        """Persisting a change publishes the user and the stored version"""
+        profile = UserProfile("user-1")
+        profile.update_data_permissions({"data_collection_consent": True})
+        profile.save()
+        self.assertEqual(json.loads(self.redis.published[-1][1])["version"], profile.store_version)
+        self.assertEqual(self.store.version(profile.secure_id), profile.store_version)
+
+        published = len(self.redis.published)
+        profile.save()
+        self.assertEqual(len(self.redis.published), published)
+
+    def test_changes_reach_other_workers(self):
+        """A worker reloads a profile another worker changed"""
+        other_worker, this_worker = PersonalizationEngine(), PersonalizationEngine()
+        this_worker.get_user_profile("user-1")
+        other_worker.handle_consent_update("user-1", True)
+        this_worker.invalidate_all()
+        self.assertTrue(this_worker.generate_personalization_context("user-1").get("mood_trend"))
+
+        other_worker.update_data_permissions("user-1", {"data_retention_preference": "permanent"})
+        this_worker.invalidate("user-1", json.loads(self.redis.published[-1][1])["version"])
+
+        self.assertEqual(this_worker.get_user_profile("user-1").data_retention_preference, "permanent")
+
+    def test_current_copies_are_kept(self):
+        """An invalidation for a version this copy already has does not drop it"""
+        engine = PersonalizationEngine()
+        engine.handle_consent_update("user-1", True)
+        profile = engine.get_user_profile("user-1")
+
+        engine.invalidate("user-1", profile.store_version)
+        engine.invalidate_all()
+
+        self.assertIs(engine.get_user_profile("user-1"), profile)
+
+    def test_revoking_consent_is_saved_and_broadcast(self):
+        """Revoked consent is persisted, without personal data, and announced"""
+        engine = PersonalizationEngine()
+        engine.handle_consent_update("user-1", True)
+        profile = engine.get_user_profile("user-1")
+        profile.add_mood_data(3)
+        engine.handle_consent_update("user-1", False)
+
+        stored = self.store.read(profile.secure_id)
+        self.assertFalse(stored["meta"]["data_collection_consent"])
+        self.assertEqual(UserProfile.load("user-1").mood_patterns.to_list(), [])
+        self.assertEqual(json.loads(self.redis.published[-1][1])["version"], profile.store_version)
+
+    def test_stale_copy_cannot_restore_consent(self):
+        """An invalidated copy's pending updates are dropped instead of overwriting a revoked consent"""
+        this_worker, other_worker = PersonalizationEngine(), PersonalizationEngine()
+        this_worker.handle_consent_update("user-1", True)
+        other_worker.get_user_profile("user-1")
+        this_worker.handle_consent_update("user-1", False)
+        revoked_version = json.loads(self.redis.published[-1][1])["version"]
+
+        # A chat turn handled by the worker that has not heard of the revocation yet
+        other_worker.update_profile_from_session("user-1", {"session_id": "1", "mood_score": 4})
+        other_worker.invalidate("user-1", revoked_version)
+        self.writer.flush()
+
+        self.assertFalse(self.store.read(UserProfile("user-1").secure_id)["meta"]["data_collection_consent"])
+        self.assertFalse(other_worker.get_user_profile("user-1").data_collection_consent)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+"""
+Tests for the SQLite profile store and UserProfile persistence
+"""
+import json
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ai.profile_store import ProfileConflict, ProfileStore, dump_section, load_section
+from app.ai.personalization import UserProfile
+
+
+class TestProfileStore(unittest.TestCase):
+    """Tests for ProfileStore"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ProfileStore(os.path.join(self.directory.name, "profiles.sqlite3"))
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_sections_round_trip_datetimes(self):
+        """Datetimes survive serialization and stay distinct from strings"""
+        value = {"when": datetime(2024, 5, 1, 9, 30), "text": "2024-05-01"}
+        self.assertEqual(load_section(dump_section(value)), value)
+
+    def test_partial_read(self):
+        """Only the requested sections are returned"""
+        self.store.write("abc", {"preferences": dump_section({"a": 1}), "therapy_goals": dump_section(["sleep"])})
+
+        self.assertEqual(self.store.read("abc", ["therapy_goals"]), {"therapy_goals": ["sleep"]})
+        self.assertEqual(set(self.store.read("abc")), {"preferences", "therapy_goals"})
+
+    def test_write_leaves_other_sections(self):
+        """Writing one section does not touch the others"""
+        self.store.write("abc", {"preferences": dump_section({"a": 1}), "therapy_goals": dump_section(["sleep"])})
+        self.store.write("abc", {"preferences": dump_section({"a": 2})})
+
+        self.assertEqual(self.store.read("abc"), {"preferences": {"a": 2}, "therapy_goals": ["sleep"]})
+
+    def test_versions_guard_writes(self):
+        """Each write bumps the version, and a write based on an older version is refused"""
+        self.assertEqual(self.store.write("abc", {"preferences": dump_section({"a": 1})}, expected_version=0), 1)
+        self.assertEqual(self.store.write("abc", {"preferences": dump_section({"a": 2})}), 2)
+
+        with self.assertRaises(ProfileConflict):
+            self.store.write("abc", {"preferences": dump_section({"a": 3})}, expected_version=1)
+        self.assertEqual(self.store.read_versioned("abc"), (2, {"preferences": dump_section({"a": 2})}))
+
+    def test_delete_keeps_versions_increasing(self):
+        """A copy loaded before a delete cannot write the profile back"""
+        self.store.write("abc", {"preferences": dump_section({})})
+        self.store.delete("abc")
+
+        self.assertEqual(self.store.version("abc"), 2)
+        with self.assertRaises(ProfileConflict):
+            self.store.write("abc", {"preferences": dump_section({})}, expected_version=1)
+
+    def test_delete(self):
+        """Deleting removes every section of the profile only"""
+        self.store.write("abc", {"preferences": dump_section({})})
+        self.store.write("def", {"preferences": dump_section({})})
+
+        self.assertTrue(self.store.delete("abc"))
+        self.assertFalse(self.store.exists("abc"))
+        self.assertTrue(self.store.exists("def"))
+        self.assertFalse(self.store.delete("abc"))
+
+    def test_import_legacy_file(self):
+        """A legacy JSON profile is split into sections and the file set aside"""
+        legacy_path = os.path.join(self.directory.name, "abc.json")
+        with open(legacy_path, "w") as f:
+            json.dump({
+                "user_id": "abc",
+                "created_at": "2024-01-02T03:04:05",
+                "data_collection_consent": True,
+                "therapy_goals": ["sleep better"]
+            }, f)
+
+        self.assertTrue(self.store.import_legacy_file("abc", self.directory.name))
+
+        data = self.store.read("abc")
+        self.assertEqual(data["therapy_goals"], ["sleep better"])
+        self.assertEqual(data["meta"]["created_at"], datetime(2024, 1, 2, 3, 4, 5))
+        self.assertTrue(data["meta"]["data_collection_consent"])
+        self.assertFalse(os.path.exists(legacy_path))
+        self.assertTrue(os.path.exists(legacy_path + ".migrated"))
+
+
+class TestUserProfilePersistence(unittest.TestCase):
+    """Tests for saving and loading UserProfile through the store"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ProfileStore(os.path.join(self.directory.name, "profiles.sqlite3"))
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_save_and_load(self):
+        """A saved profile loads back with its datetimes intact"""
+        profile = UserProfile("user-1")
+        profile.data_collection_consent = True
+        profile.therapy_goals = ["manage stress"]
+        profile.add_coping_strategy("evening walk")
+        profile.save(store=self.store)
+
+        loaded = UserProfile.load("user-1", store=self.store)
+        self.assertEqual(loaded.therapy_goals, ["manage stress"])
+        self.assertEqual(loaded.coping_strategies, profile.coping_strategies)
+        self.assertIsInstance(loaded.coping_strategies[0]["added_at"], datetime)
+        self.assertEqual(loaded.created_at, profile.created_at)
+
+    def test_save_writes_only_changed_sections(self):
+        """Sections that did not change since loading are not rewritten"""
+        profile = UserProfile("user-1")
+        profile.data_collection_consent = True
+        profile.save(store=self.store)
+
+        written = []
+        original_write = self.store.write
+        self.store.write = lambda secure_id, sections, **kwargs: written.append(set(sections)) or original_write(secure_id, sections, **kwargs)
+
+        loaded = UserProfile.load("user-1", store=self.store)
+        loaded.therapy_approaches = {"cbt": 0.9}
+        loaded.save(store=self.store)
+
+        self.assertEqual(written, [{"therapy_approaches"}])
+
+    def test_partial_load_does_not_overwrite_other_sections(self):
+        """A profile loaded with some sections only saves those sections"""
+        profile = UserProfile("user-1")
+        profile.data_collection_consent = True
+        profile.therapy_goals = ["manage stress"]
+        profile.save(store=self.store)
+
+        partial = UserProfile.load("user-1", sections=["meta"], store=self.store)
+        self.assertEqual(partial.therapy_goals, [])
+        partial.data_retention_preference = "session"
+        partial.save(store=self.store, permissions=True)
+
+        loaded = UserProfile.load("user-1", store=self.store)
+        self.assertEqual(loaded.therapy_goals, ["manage stress"])
+        self.assertEqual(loaded.data_retention_preference, "session")
+
+    def test_save_without_consent_writes_nothing(self):
+        """Profiles are not stored without consent"""
+        UserProfile("user-1").save(store=self.store)
+        self.assertFalse(self.store.exists(UserProfile("user-1").secure_id))
+
+
+if __name__ == "__main__":
+    unittest.main()
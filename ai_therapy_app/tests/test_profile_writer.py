@@ -0,0 +1,205 @@
+"""
+Tests for write-behind profile persistence
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ai import personalization
+from app.ai.personalization import PersonalizationEngine, UserProfile
+from app.ai.profile_store import ProfileStore
+from app.ai.profile_writer import ProfileWriter
+
+
+class RecordingProfile:
+    """Profile stand-in that counts saves"""
+
+    def __init__(self, secure_id, fail=False):
+        self.secure_id = secure_id
+        self.fail = fail
+        self.saves = 0
+        self.saved = threading.Event()
+
+    def save(self):
+        if self.fail:
+            raise IOError("disk full")
+        self.saves += 1
+        self.saved.set()
+
+
+class TestProfileWriter(unittest.TestCase):
+    """Tests for ProfileWriter"""
+
+    def test_updates_are_coalesced(self):
+        """Marking a profile dirty many times saves it once"""
+        writer = ProfileWriter(interval=60)
+        profile = RecordingProfile("abc")
+        for _ in range(10):
+            writer.mark_dirty(profile)
+
+        self.assertEqual(profile.saves, 0)
+        self.assertEqual(writer.flush(), 1)
+        self.assertEqual(profile.saves, 1)
+        self.assertEqual(writer.pending(), 0)
+        writer.close()
+
+    def test_size_threshold_wakes_flush(self):
+        """Reaching max_dirty flushes without waiting for the interval"""
+        writer = ProfileWriter(interval=60, max_dirty=2)
+        first, second = RecordingProfile("a"), RecordingProfile("b")
+        writer.mark_dirty(first)
+        writer.mark_dirty(second)
+
+        self.assertTrue(second.saved.wait(5))
+        writer.close()
+
+    def test_flush_one_and_discard(self):
+        """Single profiles can be flushed or dropped without touching the rest"""
+        writer = ProfileWriter(interval=60)
+        kept, dropped, other = RecordingProfile("a"), RecordingProfile("b"), RecordingProfile("c")
+        for profile in (kept, dropped, other):
+            writer.mark_dirty(profile)
+
+        writer.discard("b")
+        self.assertEqual(writer.flush("a"), 1)
+        self.assertEqual(writer.pending(), 1)
+
+        writer.close()
+        self.assertEqual((kept.saves, dropped.saves, other.saves), (1, 0, 1))
+
+    def test_failed_save_is_retried(self):
+        """A profile that fails to save stays pending"""
+        writer = ProfileWriter(interval=60)
+        profile = RecordingProfile("abc", fail=True)
+        writer.mark_dirty(profile)
+
+        self.assertEqual(writer.flush(), 0)
+        self.assertEqual(writer.pending(), 1)
+
+        profile.fail = False
+        writer.close()
+        self.assertEqual(profile.saves, 1)
+
+
+class TestEngineWriteBehind(unittest.TestCase):
+    """Tests for PersonalizationEngine using the write-behind queue"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ProfileStore(os.path.join(self.directory.name, "profiles.sqlite3"))
+        self.writer = ProfileWriter(interval=60)
+        self.patches = [
+            patch.object(personalization, "profile_store", self.store),
+            patch.object(personalization, "profile_writer", self.writer)
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.writer.close()
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_session_updates_are_saved_at_session_end(self):
+        """Per-message updates are deferred, then saved when the session ends"""
+        engine = PersonalizationEngine()
+        profile = engine.get_user_profile("user-1")
+        profile.data_collection_consent = True
+        profile.data_retention_preference = "permanent"
+
+        for i in range(3):
+            engine.update_profile_from_session("user-1", {"session_id": "s1", "mood_score": 5 + i})
+
+        self.assertFalse(self.store.exists(profile.secure_id))
+        engine.handle_session_end("user-1")
+        self.assertEqual(len(UserProfile.load("user-1", store=self.store).mood_patterns), 3)
+
+    def test_session_only_profiles_are_not_saved(self):
+        """Pending updates are dropped when session-only data is deleted"""
+        engine = PersonalizationEngine()
+        profile = engine.get_user_profile("user-1")
+        profile.data_collection_consent = True
+        engine.update_profile_from_session("user-1", {"session_id": "s1", "mood_score": 5})
+
+        engine.handle_session_end("user-1")
+        self.writer.close()
+        self.assertFalse(self.store.exists(profile.secure_id))
+
+    def test_stale_copy_cannot_undo_revoked_consent(self):
+        """Write-behind saves of a copy loaded before a consent change are refused"""
+        this_worker, other_worker = PersonalizationEngine(), PersonalizationEngine()
+        this_worker.handle_consent_update("user-1", True)
+        other_worker.get_user_profile("user-1")
+        this_worker.handle_consent_update("user-1", False)
+
+        other_worker.update_profile_from_session("user-1", {"session_id": "s1", "mood_score": 4})
+        self.writer.flush()
+
+        loaded = UserProfile.load("user-1", store=self.store)
+        self.assertFalse(loaded.data_collection_consent)
+        self.assertEqual(len(loaded.mood_patterns), 0)
+        self.assertFalse(other_worker.get_user_profile("user-1").data_collection_consent)
+
+
+    def test_updates_from_two_workers_are_both_kept(self):
+        """A copy that another worker saved over is rebased and saved, not dropped"""
+        this_worker, other_worker = PersonalizationEngine(), PersonalizationEngine()
+        this_worker.handle_consent_update("user-1", True)
+        other_worker.get_user_profile("user-1")
+
+        this_worker.update_profile_from_session("user-1", {"session_id": "1", "mood_score": 3})
+        this_worker.learn_topics("user-1", {"sleep": {"interest_level": 0.9}})
+        self.writer.flush()
+        other_worker.update_profile_from_session("user-1", {"session_id": "2", "mood_score": 7})
+        other_worker.learn_topics("user-1", {"work": {"interest_level": 0.4}})
+        self.writer.flush()
+
+        loaded = UserProfile.load("user-1", store=self.store)
+        self.assertEqual(sorted(entry["score"] for entry in loaded.mood_patterns), [3, 7])
+        self.assertEqual(len(loaded.session_history), 2)
+        self.assertEqual(loaded.topic_interests, {"sleep": 0.9, "work": 0.4})
+        self.assertTrue(loaded.data_collection_consent)
+
+    def test_concurrent_saves_of_one_copy_do_not_conflict(self):
+        """The writer thread and a request saving the same copy take turns instead of colliding"""
+        profile = UserProfile("user-1")
+        profile.update_data_permissions({"data_collection_consent": True})
+        profile.save(store=self.store)
+        write = self.store.write
+
+        def slow_write(*args, **kwargs):
+            time.sleep(0.05)
+            return write(*args, **kwargs)
+
+        errors = []
+
+        def save(score):
+            try:
+                profile.add_mood_data(score)
+                profile.save(store=self.store)
+            except Exception as e:
+                errors.append(e)
+
+        with patch.object(self.store, "write", side_effect=slow_write):
+            threads = [threading.Thread(target=save, args=(score,)) for score in (3, 4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(5)
+
+        self.assertEqual(errors, [])
+        self.assertFalse(profile.stale)
+        self.assertEqual(len(UserProfile.load("user-1", store=self.store).mood_patterns), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
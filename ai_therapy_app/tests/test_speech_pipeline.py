@@ -0,0 +1,90 @@
+"""
+Tests for sentence-pipelined speech
+"""
+import os
+import sys
+import threading
+import unittest
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.speech_pipeline import speak_as_generated, split_sentences
+
+
+class TestSplitSentences(unittest.TestCase):
+    """Tests for split_sentences"""
+
+    def test_keeps_incomplete_sentence(self):
+        """Text after the last sentence end waits for more fragments"""
+        sentences, remainder = split_sentences("That sounds really hard. How are")
+
+        self.assertEqual(sentences, ["That sounds really hard."])
+        self.assertEqual(remainder, "How are")
+
+    def test_final_flushes_remainder(self):
+        """The remainder becomes a sentence once the text is complete"""
+        sentences, remainder = split_sentences("How are you feeling today", final=True)
+
+        self.assertEqual(sentences, ["How are you feeling today"])
+        self.assertEqual(remainder, "")
+
+    def test_abbreviations_do_not_split(self):
+        """Titles such as Dr. do not end a sentence"""
+        sentences, _ = split_sentences("You mentioned Dr. Smith earlier today. ")
+
+        self.assertEqual(sentences, ["You mentioned Dr. Smith earlier today."])
+
+    def test_short_sentences_are_joined(self):
+        """Very short sentences are voiced together with the next one"""
+        sentences, _ = split_sentences("I see. That must have been difficult. ")
+
+        self.assertEqual(sentences, ["I see. That must have been difficult."])
+
+
+class TestSpeakAsGenerated(unittest.TestCase):
+    """Tests for speak_as_generated"""
+
+    def test_audio_is_yielded_in_order(self):
+        """Sentences finishing out of order are still delivered in order"""
+        first_started = threading.Event()
+        release_first = threading.Event()
+
+        def synthesize(sentence):
+            if sentence.startswith("First"):
+                first_started.set()
+                release_first.wait(5)
+            return sentence.encode()
+
+        def fragments():
+            yield "First, that sounds really hard. "
+            first_started.wait(5)
+            yield "Second, what has helped you before? "
+            release_first.set()
+
+        events = list(speak_as_generated(fragments(), synthesize))
+        audio = [payload for kind, payload in events if kind == "audio"]
+
+        self.assertEqual([a["index"] for a in audio], [0, 1])
+        self.assertEqual(audio[1]["audio"], b"Second, what has helped you before?")
+
+    def test_tokens_pass_through_before_audio(self):
+        """Every fragment is yielded as a token as soon as it arrives"""
+        events = list(speak_as_generated(["Hello there, nice to meet you.", " Welcome back"], lambda s: b""))
+
+        self.assertEqual(events[0], ("token", "Hello there, nice to meet you."))
+        self.assertEqual(events[1], ("token", " Welcome back"))
+        self.assertEqual([p["text"] for k, p in events if k == "audio"], ["Hello there, nice to meet you.", "Welcome back"])
+
+    def test_failed_sentence_has_no_audio(self):
+        """A synthesis error leaves that sentence silent without stopping the reply"""
+        def synthesize(sentence):
+            raise RuntimeError("engine failed")
+
+        events = list(speak_as_generated(["That sounds really hard."], synthesize))
+
+        self.assertIsNone(events[-1][1]["audio"])
+
+
+if __name__ == "__main__":
+    unittest.main()
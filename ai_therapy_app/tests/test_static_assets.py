@@ -0,0 +1,114 @@
+"""
+Tests for fingerprinted, precompressed static assets
+"""
+import gzip
+import os
+import sys
+import tempfile
+import unittest
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.static_assets import ASSET_BUILD_DIR, StaticAssets, build_assets, fingerprint
+
+
+class TestBuildAssets(unittest.TestCase):
+    """Tests for build_assets"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.static_dir = self.directory.name
+        self.css = "body { color: #333; }\n" * 50
+        self.write("css/style.css", self.css.encode())
+        self.write("images/avatar.jpg", b"\xff\xd8" + os.urandom(512))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, filename, data):
+        path = os.path.join(self.static_dir, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def build_path(self, filename):
+        return os.path.join(self.static_dir, ASSET_BUILD_DIR, filename)
+
+    def test_names_change_with_content(self):
+        """Hashed names follow the content and keep the extension"""
+        first = build_assets(self.static_dir)["css/style.css"]
+        self.assertRegex(first, r"^css/style\.[0-9a-f]{12}\.css$")
+
+        self.write("css/style.css", b"body { color: red; }")
+        self.assertNotEqual(build_assets(self.static_dir)["css/style.css"], first)
+
+    def test_text_files_are_precompressed(self):
+        """Text assets get a gzip copy; images do not"""
+        assets = build_assets(self.static_dir)
+
+        with gzip.open(self.build_path(assets["css/style.css"] + ".gz")) as f:
+            self.assertEqual(f.read().decode(), self.css)
+        self.assertFalse(os.path.exists(self.build_path(assets["images/avatar.jpg"] + ".gz")))
+
+    def test_stale_copies_are_removed(self):
+        """Rebuilding after a change removes the old file's copies and skips the build folder"""
+        old = build_assets(self.static_dir)["css/style.css"]
+        self.write("css/style.css", (self.css + "p { margin: 0; }\n").encode())
+        assets = build_assets(self.static_dir)
+
+        self.assertFalse(os.path.exists(self.build_path(old + ".gz")))
+        self.assertTrue(os.path.exists(self.build_path(assets["css/style.css"] + ".gz")))
+        self.assertEqual(set(assets), {"css/style.css", "images/avatar.jpg"})
+
+    def test_registry_rewrites_urls(self):
+        """url_for values are swapped for hashed names and compressed copies are found"""
+        assets = build_assets(self.static_dir)
+        static_assets = StaticAssets()
+        static_assets.load(self.static_dir)
+
+        values = {"filename": "css/style.css"}
+        static_assets._hash_url("static", values)
+        self.assertEqual(values["filename"], assets["css/style.css"])
+
+        values = {"filename": "js/missing.js"}
+        static_assets._hash_url("static", values)
+        self.assertEqual(values["filename"], "js/missing.js")
+
+        encodings = [encoding for encoding, _ in static_assets.encodings[assets["css/style.css"]]]
+        self.assertIn("gzip", encodings)
+        self.assertNotIn(assets["images/avatar.jpg"], static_assets.encodings)
+
+    def test_edited_originals_lose_their_hash(self):
+        """A file edited after the build no longer matches its hashed name"""
+        hashed = build_assets(self.static_dir)["css/style.css"]
+        static_assets = StaticAssets()
+        static_assets.load(self.static_dir)
+        path = os.path.join(self.static_dir, "css/style.css")
+
+        self.assertTrue(static_assets._is_current(hashed, path))
+        self.write("css/style.css", (self.css + "p { margin: 0; }\n").encode())
+        self.assertFalse(static_assets._is_current(hashed, path))
+
+    def test_edited_originals_get_plain_urls(self):
+        """url_for stops pointing at a hashed name once the file no longer matches it"""
+        build_assets(self.static_dir)
+        static_assets = StaticAssets()
+        static_assets.load(self.static_dir)
+        self.write("css/style.css", (self.css + "p { margin: 0; }\n").encode())
+
+        values = {"filename": "css/style.css"}
+        static_assets._hash_url("static", values)
+        self.assertEqual(values["filename"], "css/style.css")
+
+
+class TestFingerprint(unittest.TestCase):
+    """Tests for fingerprint"""
+
+    def test_hash_goes_before_extension(self):
+        """Only the last extension is kept after the hash"""
+        self.assertEqual(fingerprint("js/app.min.js", "abc"), "js/app.min.abc.js")
+
+
+if __name__ == "__main__":
+    unittest.main()
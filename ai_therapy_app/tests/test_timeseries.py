@@ -0,0 +1,118 @@
+"""
+Tests for compact profile time series
+"""
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ai.personalization import UserProfile
+from app.ai.profile_store import ProfileStore, dump_section
+from app.ai.timeseries import MoodSeries, SessionHistoryIndex
+
+
+class TestMoodSeries(unittest.TestCase):
+    """Tests for MoodSeries"""
+
+    def test_binary_round_trip(self):
+        """Scores, times and notes survive encoding"""
+        series = MoodSeries()
+        start = datetime(2024, 2, 1, 8, 0)
+        for i in range(50):
+            series.append(start + timedelta(hours=i), i % 10, "slept badly" if i == 3 else None)
+
+        decoded = MoodSeries.from_bytes(series.to_bytes())
+        self.assertEqual(decoded.to_list(), series.to_list())
+        self.assertEqual(decoded.to_list()[3]["notes"], "slept badly")
+        self.assertEqual(decoded.to_list()[0]["timestamp"], start)
+
+    def test_encoding_is_compact(self):
+        """Each entry without notes takes 16 bytes"""
+        series = MoodSeries()
+        for i in range(100):
+            series.append(1700000000 + i, 5)
+        self.assertLess(len(series.to_bytes()), 100 * 16 + 16)
+
+    def test_from_entries_sorts_and_parses(self):
+        """Entries in the old list form, including ISO strings, are converted"""
+        series = MoodSeries.from_entries([
+            {"timestamp": "2024-01-02T00:00:00", "score": 7, "notes": None},
+            {"timestamp": datetime(2024, 1, 1), "score": 3, "notes": "rough day"}
+        ])
+        self.assertEqual(list(series.scores), [3, 7])
+        self.assertEqual(series.to_list()[0]["notes"], "rough day")
+
+
+class TestSessionHistoryIndex(unittest.TestCase):
+    """Tests for SessionHistoryIndex"""
+
+    def test_cap_keeps_most_recent(self):
+        """Only the newest interactions are kept"""
+        index = SessionHistoryIndex(max_entries=3)
+        for i in range(5):
+            index.append(1700000000 + i, 1, 10 + i, 20 + i)
+
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.message_ids(), [12, 22, 13, 23, 14, 24])
+
+    def test_binary_round_trip_with_missing_ids(self):
+        """Missing and non-numeric ids decode as None"""
+        index = SessionHistoryIndex()
+        index.append(datetime(2024, 1, 1), "unknown-1", None, 42)
+
+        entries = list(SessionHistoryIndex.from_bytes(index.to_bytes()))
+        self.assertEqual(entries, [{
+            "timestamp": datetime(2024, 1, 1),
+            "session_id": None,
+            "user_message_id": None,
+            "ai_message_id": 42
+        }])
+
+
+class TestProfileSeries(unittest.TestCase):
+    """Tests for the series inside UserProfile"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ProfileStore(os.path.join(self.directory.name, "profiles.sqlite3"))
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_series_are_stored_in_binary(self):
+        """Mood and session history are saved as binary records and load back"""
+        profile = UserProfile("user-1")
+        profile.data_collection_consent = True
+        profile.add_mood_data(6, "okay")
+        profile.record_session_interaction("5", {"message_ids": {"user": 1, "ai": 2}})
+        profile.save(store=self.store)
+
+        stored = self.store.read(profile.secure_id, ["mood_patterns", "session_history"])
+        self.assertIsInstance(stored["mood_patterns"], bytes)
+
+        loaded = UserProfile.load("user-1", store=self.store)
+        self.assertEqual(loaded.mood_patterns.to_list(), profile.mood_patterns.to_list())
+        self.assertEqual(loaded.session_history.message_ids(5), [1, 2])
+
+    def test_json_series_are_rewritten_in_binary(self):
+        """Series migrated from JSON profile files are converted on the next save"""
+        profile = UserProfile("user-1")
+        self.store.write(profile.secure_id, {
+            "meta": dump_section({"data_collection_consent": True}),
+            "mood_patterns": dump_section([{"timestamp": "2024-01-01T09:00:00", "score": 4, "notes": None}])
+        })
+
+        loaded = UserProfile.load("user-1", store=self.store)
+        self.assertEqual(list(loaded.mood_patterns.scores), [4])
+        loaded.save(store=self.store)
+
+        self.assertIsInstance(self.store.read(profile.secure_id, ["mood_patterns"])["mood_patterns"], bytes)
+
+
+if __name__ == "__main__":
+    unittest.main()
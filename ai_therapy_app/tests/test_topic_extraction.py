@@ -0,0 +1,148 @@
+"""
+Tests for background topic extraction and how extracted topics are learned
+"""
+import os
+import sys
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ai.personalization import PersonalizationEngine, UserProfile
+from app.ai.topic_extraction import ExtractionUnavailable, TopicExtractor, score_topics
+
+
+class TestScoreTopics(unittest.TestCase):
+    """Tests for score_topics"""
+
+    def test_interest_grows_with_mentions(self):
+        """Each further mention of a topic raises its interest"""
+        topics = score_topics([(["work", "sleep"], 0.2), (["work"], 0.0)])
+        self.assertAlmostEqual(topics["work"]["interest_level"], 0.6)
+        self.assertAlmostEqual(topics["sleep"]["interest_level"], 0.5)
+
+    def test_negative_sentences_mark_triggers(self):
+        """Intensity comes from the most negative sentence a topic appeared in"""
+        topics = score_topics([(["family"], 0.4), (["family"], -0.85)])
+        self.assertTrue(topics["family"]["negative_response"])
+        self.assertEqual(topics["family"]["emotional_intensity"], 8)
+
+    def test_positive_topics_have_no_intensity(self):
+        """Positive mentions are not negative responses"""
+        topics = score_topics([(["music"], 0.9)])
+        self.assertFalse(topics["music"]["negative_response"])
+        self.assertEqual(topics["music"]["emotional_intensity"], 0)
+
+
+class TestTopicExtractor(unittest.TestCase):
+    """Tests for TopicExtractor batching, with a thread pool standing in for the process pool"""
+
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.batches = []
+        self.learned = []
+        self.done = threading.Event()
+
+    def tearDown(self):
+        self.extractor.close()
+        self.executor.shutdown()
+
+    def make_extractor(self, extract=None, **kwargs):
+        def default_extract(texts):
+            self.batches.append(list(texts))
+            return [{text: {"interest_level": 0.5}} for text in texts]
+
+        self.extractor = TopicExtractor(executor=self.executor, extract=extract or default_extract, **kwargs)
+        self.extractor.configure(on_result=self.on_result)
+        return self.extractor
+
+    def on_result(self, user_id, topics):
+        self.learned.append((user_id, topics))
+        if len(self.learned) == 3:
+            self.done.set()
+
+    def test_messages_are_batched(self):
+        """Queued messages are extracted together and results go to their users"""
+        extractor = self.make_extractor(batch_size=3, batch_wait=5)
+        for user_id, text in [("a", "work"), ("b", "sleep"), ("a", "family")]:
+            self.assertTrue(extractor.submit(user_id, text))
+
+        self.assertTrue(self.done.wait(5))
+        self.assertEqual(self.batches, [["work", "sleep", "family"]])
+        self.assertEqual([user_id for user_id, _ in self.learned], ["a", "b", "a"])
+
+    def test_empty_messages_are_not_queued(self):
+        """Blank messages never reach the workers"""
+        self.assertFalse(self.make_extractor().submit("a", "   "))
+
+    def test_full_queue_drops_messages(self):
+        """Submitting never blocks when the queue is full"""
+        extractor = self.make_extractor(max_queue=1)
+        with patch.object(extractor, "start"):
+            self.assertTrue(extractor.submit("a", "work"))
+            self.assertFalse(extractor.submit("a", "sleep"))
+
+    def test_missing_model_disables_extraction(self):
+        """A worker without a spaCy model turns extraction off"""
+        def unavailable(texts):
+            raise ExtractionUnavailable("no model")
+
+        extractor = self.make_extractor(extract=unavailable, batch_size=1)
+        extractor.submit("a", "work")
+        for _ in range(50):
+            if not extractor.available:
+                break
+            threading.Event().wait(0.1)
+
+        self.assertFalse(extractor.available)
+        self.assertFalse(extractor.submit("a", "sleep"))
+
+
+class TestLearnTopics(unittest.TestCase):
+    """Tests for PersonalizationEngine.learn_topics"""
+
+    def setUp(self):
+        self.engine = PersonalizationEngine()
+        self.profile = UserProfile("user-1")
+        self.profile.update_data_permissions({"data_collection_consent": True})
+        self.engine.profiles.put("user-1", self.profile)
+
+    @patch("app.ai.personalization.profile_writer")
+    def test_topics_and_triggers_are_learned(self, writer):
+        """Interests are recorded, triggers added once, and the profile queued for saving"""
+        topics = {
+            "work": {"interest_level": 0.7, "negative_response": True, "emotional_intensity": 9},
+            "music": {"interest_level": 0.5, "negative_response": False, "emotional_intensity": 0}
+        }
+        self.engine.learn_topics("user-1", topics)
+        self.engine.learn_topics("user-1", topics)
+
+        self.assertEqual(self.profile.topic_interests, {"work": 0.7, "music": 0.5})
+        self.assertEqual([t["topic"] for t in self.profile.trigger_topics], ["work"])
+        writer.mark_dirty.assert_called_with(self.profile)
+
+    @patch("app.ai.personalization.profile_writer")
+    def test_no_learning_without_consent(self, writer):
+        """Extracted topics are ignored for users who have not consented"""
+        self.profile.update_data_permissions({"data_collection_consent": False})
+        self.engine.learn_topics("user-1", {"work": {"interest_level": 0.7}})
+
+        self.assertEqual(self.profile.topic_interests, {})
+        writer.mark_dirty.assert_not_called()
+
+    @patch("app.ai.personalization.profile_writer")
+    @patch("app.ai.personalization.topic_extractor")
+    def test_chat_turns_are_queued_for_extraction(self, extractor, writer):
+        """Sessions without topics_discussed send the user's message to the extractor"""
+        self.engine.update_profile_from_session("user-1", {
+            "session_id": 1,
+            "message_pair": {"user": "Work has been stressful", "ai": "Tell me more"}
+        })
+        extractor.submit.assert_called_once_with("user-1", "Work has been stressful")
+
+
+if __name__ == "__main__":
+    unittest.main()
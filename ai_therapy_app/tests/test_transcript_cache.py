@@ -0,0 +1,117 @@
+"""
+Tests for the session transcript cache
+"""
+import os
+import sys
+import threading
+import time
+import unittest
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.transcript_cache import TranscriptCache, make_turn
+
+
+class TestTranscriptCache(unittest.TestCase):
+    """Tests for the in-process tier of TranscriptCache"""
+
+    def setUp(self):
+        """Count loader calls so cache hits can be checked"""
+        self.loads = []
+        self.stored = {"1": [make_turn("user", "Hello"), make_turn("assistant", "Hi there")]}
+
+        def loader(session_id):
+            self.loads.append(session_id)
+            return [dict(turn) for turn in self.stored.get(session_id, [])]
+
+        self.cache = TranscriptCache(max_sessions=2, local_ttl=60)
+        self.cache.configure(loader=loader)
+
+    def test_miss_rebuilds_from_loader(self):
+        """A miss loads the stored messages and numbers them"""
+        turns = self.cache.get("1")
+
+        self.assertEqual([t["content"] for t in turns], ["Hello", "Hi there"])
+        self.assertEqual([t["seq"] for t in turns], [1, 2])
+        self.assertEqual(self.loads, ["1"])
+
+    def test_hit_skips_loader(self):
+        """Repeated reads are served from the local tier"""
+        self.cache.get("1")
+        self.cache.get("1")
+
+        self.assertEqual(self.loads, ["1"])
+
+    def test_append_continues_sequence(self):
+        """Appended turns follow the loaded ones"""
+        turns = self.cache.append("1", make_turn("user", "How are you?"))
+
+        self.assertEqual(turns[-1]["seq"], 3)
+        self.assertEqual(self.cache.get("1")[-1]["content"], "How are you?")
+
+    def test_lru_eviction(self):
+        """The least recently used session is evicted past max_sessions"""
+        self.cache.get("1")
+        self.cache.get("2")
+        self.cache.get("3")
+        self.cache.get("1")
+
+        self.assertEqual(self.loads, ["1", "2", "3", "1"])
+
+    def test_ttl_expiry(self):
+        """Expired entries are reloaded"""
+        self.cache.local_ttl = 0
+        self.cache.get("1")
+        time.sleep(0.01)
+        self.cache.get("1")
+
+        self.assertEqual(self.loads, ["1", "1"])
+
+    def test_summary_only_moves_forward(self):
+        """An older summary never replaces a newer one"""
+        self.cache.get("1")
+        self.cache.set_summary("1", {"text": "newer", "covered": 4})
+        self.cache.set_summary("1", {"text": "older", "covered": 2})
+
+        self.assertEqual(self.cache.get_summary("1")["text"], "newer")
+
+    def test_slow_load_does_not_block_other_sessions(self):
+        """A session waiting on the loader does not hold up reads of another"""
+        release = threading.Event()
+        loader = self.cache.loader
+
+        def slow_loader(session_id):
+            if session_id == "slow":
+                release.wait(5)
+            return loader(session_id)
+
+        self.cache.configure(loader=slow_loader)
+        waiting = threading.Thread(target=self.cache.get, args=("slow",))
+        waiting.start()
+        try:
+            reader = threading.Thread(target=self.cache.get, args=("1",))
+            reader.start()
+            reader.join(1)
+            self.assertFalse(reader.is_alive())
+        finally:
+            release.set()
+            waiting.join()
+
+    def test_concurrent_appends_keep_every_turn(self):
+        """Appends from several threads are all kept in order"""
+        self.cache.get("1")
+        threads = [
+            threading.Thread(target=self.cache.append, args=("1", make_turn("user", str(i))))
+            for i in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([t["seq"] for t in self.cache.get("1")], list(range(1, 11)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+"""
+Tests for the TTS worker pool service
+"""
+import multiprocessing
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.tts import TTSService
+from app.services.tts_cache import TTSCache
+
+
+class FakeRedis:
+    """Just enough of a Redis client to share audio ids"""
+
+    def __init__(self):
+        self.values = {}
+
+    def setex(self, key, ttl, value):
+        self.values[key] = value
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+
+class TestTTSService(unittest.TestCase):
+    """Tests for TTSService job handling"""
+
+    def setUp(self):
+        """Create a service with one worker and no queue"""
+        self.service = TTSService(workers=1, max_queue=0, queue_timeout=0, timeout=1, cache=TTSCache(directory=None))
+        self.service.available = True
+        self.pool = mock.MagicMock()
+        self.service._pool = self.pool
+
+    def test_returns_audio_bytes(self):
+        """Audio rendered by a worker is returned as bytes"""
+        self.pool.apply_async.return_value.get.return_value = b"RIFF"
+
+        self.assertEqual(self.service.synthesize("Hello"), b"RIFF")
+
+    def test_cache_hit_skips_pool(self):
+        """Audio rendered once is served from the cache afterwards"""
+        self.pool.apply_async.return_value.get.return_value = b"RIFF"
+
+        self.service.synthesize("Hello")
+        self.assertEqual(self.service.synthesize("Hello"), b"RIFF")
+        self.assertEqual(self.pool.apply_async.call_count, 1)
+        self.assertEqual(self.service.cache.stats()["memory_hits"], 1)
+
+    def test_empty_text_skips_pool(self):
+        """Empty text never reaches the workers"""
+        self.assertIsNone(self.service.synthesize(""))
+        self.pool.apply_async.assert_not_called()
+
+    def test_unavailable_engine(self):
+        """Without pyttsx3 no audio is produced"""
+        self.service.available = False
+
+        self.assertIsNone(self.service.synthesize("Hello"))
+
+    def test_full_queue_rejects_job(self):
+        """Jobs beyond the queue bound are turned away"""
+        self.service._slots.acquire()
+        try:
+            self.assertIsNone(self.service.synthesize("Hello"))
+        finally:
+            self.service._slots.release()
+        self.pool.apply_async.assert_not_called()
+
+    def test_timeout_restarts_pool(self):
+        """A job that overruns its timeout terminates the stuck workers"""
+        self.pool.apply_async.return_value.get.side_effect = multiprocessing.TimeoutError()
+
+        self.assertIsNone(self.service.synthesize("Hello"))
+        self.pool.terminate.assert_called_once()
+        self.assertIsNone(self.service._pool)
+
+    def test_slot_released_after_job(self):
+        """Each job gives its queue slot back"""
+        self.pool.apply_async.return_value.get.side_effect = RuntimeError("engine failed")
+
+        self.assertIsNone(self.service.synthesize("Hello"))
+        self.assertTrue(self.service._slots.acquire(timeout=0))
+        self.service._slots.release()
+
+
+class TestBackgroundAudio(unittest.TestCase):
+    """Tests for submitting audio jobs and fetching them by id"""
+
+    def setUp(self):
+        """Create a service whose pool renders a fixed clip"""
+        self.service = TTSService(workers=1, max_queue=1, queue_timeout=1, timeout=1, cache=TTSCache(directory=None))
+        self.service.available = True
+        self.service._pool = mock.MagicMock()
+        self.service._pool.apply_async.return_value.get.return_value = b"RIFF"
+
+    def test_submit_then_fetch(self):
+        """A submitted job can be fetched by its id once rendered"""
+        audio_id = self.service.submit("Hello", owner="1")
+
+        self.assertNotEqual(audio_id, self.service.cache_key("Hello"))
+        self.assertEqual(self.service.fetch(audio_id, owner="1"), b"RIFF")
+
+    def test_cached_audio_needs_no_job(self):
+        """Audio already in the cache is not rendered again"""
+        self.service.cache.put(self.service.cache_key("Hello"), b"CACHED")
+
+        audio_id = self.service.submit("Hello", owner="1")
+
+        self.assertEqual(self.service.fetch(audio_id, owner="1"), b"CACHED")
+        self.service._pool.apply_async.assert_not_called()
+
+    def test_no_audio_without_engine(self):
+        """Without an engine and without cached audio there is no audio id"""
+        self.service.available = False
+
+        self.assertIsNone(self.service.submit("Hello"))
+
+    def test_ids_belong_to_their_owner(self):
+        """The same reply gets a different id per user, and one user cannot fetch another's"""
+        audio_id = self.service.submit("Hello", owner="1")
+
+        self.assertNotEqual(audio_id, self.service.submit("Hello", owner="2"))
+        self.assertIsNone(self.service.fetch(audio_id, owner="2", timeout=1))
+
+    def test_unknown_id_fails_at_once(self):
+        """Ids no worker issued are rejected without waiting or counting cache misses"""
+        started = time.monotonic()
+
+        self.assertIsNone(self.service.fetch("0" * 64, owner="1", timeout=5))
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(self.service.cache.stats()["misses"], 0)
+
+    def test_ids_are_shared_through_redis(self):
+        """An id issued by one worker resolves in another with the same secret"""
+        redis = FakeRedis()
+        other = TTSService(workers=1, max_queue=0, queue_timeout=0, timeout=1, cache=self.service.cache)
+        self.service.configure(redis_client=redis, secret="secret")
+        other.configure(redis_client=redis, secret="secret")
+
+        audio_id = self.service.submit("Hello", owner="1")
+        self.service.fetch(audio_id, owner="1")
+
+        self.assertEqual(other.fetch(audio_id, owner="1"), b"RIFF")
+        other.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
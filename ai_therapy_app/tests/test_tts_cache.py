@@ -0,0 +1,100 @@
+"""
+Tests for the TTS audio cache
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.tts_cache import TTSCache, audio_cache_key
+
+
+class TestTTSCache(unittest.TestCase):
+    """Tests for the memory and disk tiers of TTSCache"""
+
+    def setUp(self):
+        """Give every test its own cache directory"""
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_key_depends_on_rendering_settings(self):
+        """Voice, rate and codec all change the key"""
+        base = audio_cache_key("Hello", "default", 150, "wav")
+
+        self.assertEqual(base, audio_cache_key("Hello", "default", 150, "wav"))
+        self.assertNotEqual(base, audio_cache_key("Hello", "other", 150, "wav"))
+        self.assertNotEqual(base, audio_cache_key("Hello", "default", 180, "wav"))
+        self.assertNotEqual(base, audio_cache_key("Hello", "default", 150, "mp3"))
+
+    def test_memory_lru_is_byte_bounded(self):
+        """The least recently used audio is evicted once memory is full"""
+        cache = TTSCache(memory_bytes=10, directory=None)
+        cache.put("a", b"12345")
+        cache.put("b", b"12345")
+        cache.get("a")
+        cache.put("c", b"12345")
+
+        self.assertEqual(cache.get("a"), b"12345")
+        self.assertIsNone(cache.get("b"))
+        self.assertLessEqual(cache.stats()["memory_bytes"], 10)
+
+    def test_disk_tier_is_shared(self):
+        """A second cache on the same directory sees stored audio"""
+        TTSCache(directory=self.directory).put("key", b"audio")
+        other = TTSCache(directory=self.directory)
+
+        self.assertEqual(other.get("key"), b"audio")
+        self.assertEqual(other.stats()["disk_hits"], 1)
+
+    def test_disk_tier_is_size_bounded(self):
+        """Old files are removed when the disk tier grows past its bound"""
+        cache = TTSCache(memory_bytes=0, disk_bytes=20, directory=self.directory)
+        for i in range(5):
+            cache.put(f"key{i}", b"0123456789")
+
+        self.assertLessEqual(cache._scan_disk()[1], 20)
+        self.assertEqual(cache.get("key4"), b"0123456789")
+
+    def test_lookups_do_not_wait_for_disk_scans(self):
+        """Memory hits are served while another thread walks the disk tier"""
+        cache = TTSCache(directory=self.directory)
+        cache.put("key", b"audio")
+        scanning, release = threading.Event(), threading.Event()
+        scan = cache._scan_disk
+
+        def slow_scan():
+            scanning.set()
+            release.wait(5)
+            return scan()
+
+        with mock.patch.object(cache, "_scan_disk", side_effect=slow_scan):
+            cache._disk_used = None
+            writer = threading.Thread(target=cache.put, args=("other", b"audio"))
+            writer.start()
+            self.assertTrue(scanning.wait(5))
+            self.assertEqual(cache.get("key"), b"audio")
+            release.set()
+            writer.join(5)
+
+        self.assertEqual(cache._disk_used, 10)
+
+    def test_hit_rate(self):
+        """Hit rate counts hits over all lookups"""
+        cache = TTSCache(directory=None)
+        cache.put("key", b"audio")
+        cache.get("key")
+        cache.get("missing")
+
+        self.assertEqual(cache.stats()["hit_rate"], 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+"""
+Train the local message classifier from labelled messages
+Reads a CSV with text, is_from_ai, emotion, intent and therapy_technique columns and saves the model
+"""
+import argparse
+import logging
+import random
+
+from app.ai.message_classifier import MESSAGE_CLASSIFIER_PATH, MessageClassifier, benchmark, read_examples
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("examples", help="CSV file of labelled messages")
+    parser.add_argument("--output", default=MESSAGE_CLASSIFIER_PATH, help="Where to save the model")
+    parser.add_argument("--benchmark", action="store_true", help="Report throughput by batch size after training")
+    args = parser.parse_args()
+
+    examples = read_examples(args.examples)
+    classifier = MessageClassifier.train(examples)
+    classifier.save(args.output)
+    logger.info(f"Saved message classifier to {args.output}")
+
+    if args.benchmark:
+        # Repeat the examples in random order so small files still give stable timings
+        sample = [random.choice(examples) for _ in range(max(2000, len(examples)))]
+        texts = [e["text"] for e in sample]
+        is_from_ai = [e["is_from_ai"] for e in sample]
+        for result in benchmark(classifier.predict, texts, is_from_ai):
+            print(f"batch size {result['batch_size']:>4}: "
+                  f"{result['messages_per_second']:>9.0f} messages/s, {result['ms_per_batch']:.2f} ms per batch")
+
+
+if __name__ == "__main__":
+    main()
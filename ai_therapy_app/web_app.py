@@ -3,21 +3,36 @@ Web Application for Mental Health AI Therapy
 This is a Flask web application that provides both API endpoints and web UI
 """
 import os
+import io
 import json
+import hashlib
 import logging
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import Flask, request, jsonify, g, render_template, redirect, url_for, flash, session, abort
+from flask import Flask, request, jsonify, g, render_template, get_template_attribute, redirect, url_for, flash, session, abort, Response, stream_with_context, send_file
 from flask_cors import CORS
 from dotenv import load_dotenv
 import redis
-from sqlalchemy import create_engine, Column, String, Integer, DateTime, Boolean, JSON, Text, ForeignKey
+from sqlalchemy import create_engine, Column, String, Integer, DateTime, Boolean, JSON, Text, ForeignKey, Index, or_
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from werkzeug.security import generate_password_hash, check_password_hash
 from app.ai.personalization import personalization_engine
-from base64 import b64encode
-from ai_therapy_app.llm_service import get_llm_response, clear_session_history
+from app.ai.profile_events import profile_events
+from app.ai.profile_store import ProfileConflict
+from app.ai.topic_extraction import topic_extractor
+from ai_therapy_app.llm_service import get_llm_response, stream_llm_response, clear_session_history, conversation_history, warm_tts_cache
+from app.core.lazy import LazyResource, warm_up
+from app.core.static_assets import StaticAssets
+from app.core.identity_cache import UserIdentity, cookie_key, identity_cache
+from app.utils.pagination import keyset_page
+from app.services.llm_client import llm_client
+from app.services.transcript_cache import transcript_cache, make_turn
+from app.services.tts import tts_service
+from app.services.avatars import avatar_registry
+from app.services.message_classification import message_classification
+from app.services.speech_pipeline import speak_as_generated
+from app.services.audio_codec import AUDIO_CODECS, negotiate_codec, audio_payload, audio_reference
 # Remove the direct import from here to avoid circular imports
 
 # Configure logging
@@ -51,6 +66,20 @@ app.config['REDIS_PASSWORD'] = os.getenv('REDIS_PASSWORD', '')
 app.config['REDIS_SSL'] = os.getenv('REDIS_SSL', 'False').lower() == 'true'
 app.config['DATABASE_URL'] = os.getenv('DATABASE_URL', "sqlite:///app.db")
 app.config['SESSION_TYPE'] = 'filesystem'
+# Let the front-end server stream static files instead of this process
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', 'False').lower() == 'true'
+
+# Serve fingerprinted, precompressed static files once `python -m app.core.static_assets` has built them
+static_assets = StaticAssets(app)
+
+# Reply audio delivery: how long /audio waits for rendering, and how long clients may cache it
+AUDIO_FETCH_TIMEOUT = float(os.getenv('AUDIO_FETCH_TIMEOUT', 10))
+AUDIO_MAX_AGE = int(os.getenv('AUDIO_MAX_AGE', 60 * 60 * 24 * 7))
+
+# Rows per page of the session list and message history; later pages load on demand
+SESSION_PAGE_SIZE = int(os.getenv('SESSION_PAGE_SIZE', 20))
+MESSAGE_PAGE_SIZE = int(os.getenv('MESSAGE_PAGE_SIZE', 50))
+SESSION_TABS = ('upcoming', 'past', 'all')
 
 logger.info(f"Starting application with Redis host: {app.config['REDIS_HOST']}")
 
@@ -65,51 +94,64 @@ except Exception as e:
     logger.error(f"Failed to initialize database engine: {str(e)}")
     raise
 
-try:
-    # Initialize Redis
-    redis_client = redis.Redis(
-        host=app.config['REDIS_HOST'],
-        port=app.config['REDIS_PORT'],
-        password=app.config['REDIS_PASSWORD'],
-        ssl=app.config['REDIS_SSL'],
-        socket_timeout=5,
-        socket_connect_timeout=5,
-        retry_on_timeout=True
-    )
-    # Test Redis connection
-    redis_client.ping()
-    logger.info("Redis connection established successfully")
-except Exception as e:
-    logger.error(f"Failed to connect to Redis: {str(e)}")
-    # Create a dummy Redis client for development if Redis is not available
-    class DummyRedis:
-        def __init__(self):
-            self.data = {}
-        def ping(self):
-            return True
-        def set(self, key, value):
-            self.data[key] = value
-            return True
-        def get(self, key):
-            return self.data.get(key, b'')
-        def delete(self, key):
-            if key in self.data:
-                del self.data[key]
-            return True
-        def rpush(self, key, value):
-            if key not in self.data:
-                self.data[key] = []
-            self.data[key].append(value)
-            return len(self.data[key])
-        def lrange(self, key, start, end):
-            if key not in self.data:
-                return []
-            return self.data[key][start:end if end != -1 else None]
-        def expire(self, key, seconds):
-            return True
-    
-    redis_client = DummyRedis()
-    logger.warning("Using dummy Redis client for development")
+# Create a dummy Redis client for development if Redis is not available
+class DummyRedis:
+    def __init__(self):
+        self.data = {}
+    def ping(self):
+        return True
+    def set(self, key, value):
+        self.data[key] = value
+        return True
+    def get(self, key):
+        return self.data.get(key, b'')
+    def delete(self, key):
+        if key in self.data:
+            del self.data[key]
+        return True
+    def rpush(self, key, value):
+        if key not in self.data:
+            self.data[key] = []
+        self.data[key].append(value)
+        return len(self.data[key])
+    def lrange(self, key, start, end):
+        if key not in self.data:
+            return []
+        return self.data[key][start:end if end != -1 else None]
+    def expire(self, key, seconds):
+        return True
+
+def connect_redis():
+    """Connect to Redis, returning None if it is not reachable"""
+    try:
+        client = redis.Redis(
+            host=app.config['REDIS_HOST'],
+            port=app.config['REDIS_PORT'],
+            password=app.config['REDIS_PASSWORD'],
+            ssl=app.config['REDIS_SSL'],
+            socket_timeout=5,
+            socket_connect_timeout=5,
+            retry_on_timeout=True
+        )
+        # Test Redis connection
+        client.ping()
+        logger.info("Redis connection established successfully")
+        return client
+    except Exception as e:
+        logger.error(f"Failed to connect to Redis: {str(e)}")
+        return None
+
+def redis_or_dummy():
+    """The Redis client, or an in-memory stand-in for development"""
+    client = redis_connection.get()
+    if client is None:
+        logger.warning("Using dummy Redis client for development")
+        return DummyRedis()
+    return client
+
+# Connecting can block for seconds, so it happens on first use or during warm-up
+redis_connection = LazyResource(connect_redis, "Redis connection")
+redis_client = LazyResource(redis_or_dummy, "Redis client")
 
 # Database Models
 class User(Base):
@@ -136,6 +178,8 @@ class User(Base):
 
 class TherapySession(Base):
     __tablename__ = "therapy_sessions"
+    # Serves the keyset-paginated session lists
+    __table_args__ = (Index("ix_therapy_sessions_user_start", "user_id", "scheduled_start", "id"),)
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -161,6 +205,8 @@ class TherapySession(Base):
 
 class TherapyMessage(Base):
     __tablename__ = "therapy_messages"
+    # Serves transcripts and the keyset-paginated message history
+    __table_args__ = (Index("ix_therapy_messages_session_time", "session_id", "timestamp", "id"),)
     
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey("therapy_sessions.id"), nullable=False)
@@ -176,18 +222,73 @@ class TherapyMessage(Base):
     session = relationship("TherapySession", back_populates="messages")
 
 
-try:
-    # Create tables
-    Base.metadata.create_all(bind=engine)
-    logger.info("Database tables created successfully")
-except Exception as e:
-    logger.error(f"Failed to create database tables: {str(e)}")
-    raise
+def create_tables():
+    """Create database tables if they don't exist"""
+    try:
+        Base.metadata.create_all(bind=engine)
+        # create_all skips tables that already exist, so add indexes introduced since
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
+        logger.info("Database tables created successfully")
+    except Exception as e:
+        logger.error(f"Failed to create database tables: {str(e)}")
+        raise
+
+# Tables are created before the first session is opened rather than at import
+database_schema = LazyResource(create_tables, "database schema")
+
+def open_db_session():
+    """Open a database session once the schema exists"""
+    database_schema.get()
+    return SessionLocal()
+
+def load_session_transcript(session_id):
+    """Rebuild a session transcript from its stored messages"""
+    if not str(session_id).isdigit():
+        return []  # Sessions without stored messages, e.g. API voice chats
+    db_session = open_db_session()
+    try:
+        # Only the turns the cache keeps, newest first from the index, then back in order
+        messages, _ = keyset_page(
+            db_session.query(TherapyMessage).filter(TherapyMessage.session_id == int(session_id)),
+            (TherapyMessage.timestamp, TherapyMessage.id),
+            limit=transcript_cache.max_turns,
+            descending=True
+        )
+        return [
+            make_turn('assistant' if m.is_from_ai else 'user', m.content, m.timestamp, m.id)
+            for m in reversed(messages)
+        ]
+    finally:
+        db_session.close()
+
+# Share transcripts across workers through Redis when it is reachable
+transcript_cache.configure(
+    redis_client=redis_connection,
+    loader=load_session_transcript
+)
+
+# Let every worker serve the audio ids the others hand out
+tts_service.configure(redis_client=redis_connection, secret=app.config['SECRET_KEY'])
+
+# Drop profiles other workers change from this worker's profile cache
+profile_events.configure(
+    redis_client=redis_connection,
+    on_invalidate=personalization_engine.invalidate,
+    on_resubscribe=personalization_engine.invalidate_all
+)
+
+# Learn topics and triggers from chat messages in the background
+topic_extractor.configure(on_result=personalization_engine.learn_topics)
+
+# Label saved messages with their emotion, intent and technique in the background
+message_classification.watch(SessionLocal, TherapyMessage)
 
 # Helper function to get database session
 def get_db():
     if 'db' not in g:
-        g.db = SessionLocal()
+        g.db = open_db_session()
     return g.db
 
 @app.teardown_appcontext
@@ -207,10 +308,37 @@ def login_required(f):
     return decorated_function
 
 def get_current_user():
-    if 'user_id' in session:
-        db = get_db()
-        return db.query(User).filter(User.id == session['user_id']).first()
-    return None
+    """The logged-in user, loaded at most once per request"""
+    user_id = session.get('user_id')
+    if user_id is None:
+        return None
+    db = get_db()
+    user = g.get('current_user')
+    # Reload after a login, or if a route closed the session the user was loaded in
+    if user is None or g.current_user_id != user_id or user not in db:
+        user = db.get(User, user_id)
+        g.current_user, g.current_user_id = user, user_id
+        if user is not None:
+            identity_cache.put(session_cookie_key(), UserIdentity(user.id, user.email))
+    return user
+
+def get_current_identity():
+    """Id and email of the logged-in user, cached briefly across requests for routes that need nothing else"""
+    user_id = session.get('user_id')
+    if user_id is None:
+        return None
+    identity = g.get('current_identity')
+    if identity is None or identity.id != user_id:
+        identity = identity_cache.get(session_cookie_key())
+        if identity is None or identity.id != user_id:
+            user = get_current_user()
+            identity = UserIdentity(user.id, user.email) if user is not None else None
+        g.current_identity = identity
+    return identity
+
+def session_cookie_key():
+    """Identity cache key for this request's session cookie"""
+    return cookie_key(request.cookies.get(app.config['SESSION_COOKIE_NAME']))
 
 # API authentication decorator
 def api_auth_required(f):
@@ -226,6 +354,128 @@ def api_auth_required(f):
         return f(*args, **kwargs)
     return decorated
 
+def api_principal():
+    """
+    Who an API request is from, for owning reply audio.
+    API tokens are not tied to users yet, so the principal is a hash of the Authorization header itself.
+    """
+    return 'api:' + hashlib.sha256(request.headers['Authorization'].encode('utf-8')).hexdigest()
+
+# Server-Sent Events helpers for streamed AI replies
+def sse_event(event, data):
+    """Format a single Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events):
+    """Wrap an event generator in a streaming response that proxies will not buffer"""
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def stream_ai_reply(session_id, user_id, user_message, user_message_id=None, speak=False, audio_codec='wav'):
+    """
+    Stream the AI reply to a user message as SSE 'token' events.
+    With speak=True each sentence is also voiced as it completes and sent, in order, as an 'audio' event.
+    The AI message is persisted once the stream completes and announced in a final 'done' event,
+    which otherwise points at audio for the whole reply rendered in the background.
+    """
+    personalization_context = personalization_engine.generate_personalization_context(user_id)
+    
+    chunks = []
+    try:
+        tokens = stream_llm_response(user_message, str(session_id), str(user_id), personalization_context)
+        synthesize = lambda sentence: tts_service.synthesize(sentence, codec=audio_codec)
+        events = speak_as_generated(tokens, synthesize) if speak else (('token', t) for t in tokens)
+        for kind, payload in events:
+            if kind == 'audio':
+                yield sse_event('audio', {
+                    'index': payload['index'],
+                    'text': payload['text'],
+                    **audio_payload(payload['audio'], audio_codec)
+                })
+                continue
+            chunks.append(payload)
+            yield sse_event('token', {'token': payload})
+        
+        ai_text_response = ''.join(chunks).strip()
+        if not ai_text_response:
+            logger.error(f"LLM failed to generate text response for session {session_id}")
+            yield sse_event('error', {'success': False, 'message': 'AI failed to generate a response.'})
+            return
+        
+        db_session = get_db()
+        ai_message = TherapyMessage(
+            session_id=session_id,
+            content=ai_text_response,
+            is_from_ai=True,
+            timestamp=datetime.now()
+        )
+        db_session.add(ai_message)
+        # Assigns the message id the profile's session history refers to
+        db_session.flush()
+        
+        # Update the personalization engine with this interaction
+        personalization_engine.update_profile_from_session(user_id, {
+            'session_id': session_id,
+            'message_pair': {
+                'user': user_message,
+                'ai': ai_text_response
+            },
+            'message_ids': {'user': user_message_id, 'ai': ai_message.id}
+        })
+        
+        db_session.commit()
+        
+        # Spoken replies were already voiced sentence by sentence; others get audio for the whole reply
+        audio_id = None if speak else tts_service.submit(ai_text_response, codec=audio_codec, owner=str(user_id))
+        yield sse_event('done', {
+            'success': True,
+            'response': ai_text_response,
+            'message_id': ai_message.id,
+            'session_id': session_id,
+            **reply_audio(audio_id, audio_codec)
+        })
+    except Exception as e:
+        logger.error(f"Error streaming AI reply for session {session_id}: {str(e)}")
+        get_db().rollback()
+        yield sse_event('error', {'success': False, 'message': f'Server error: {str(e)}'})
+
+def reply_audio(audio_id, audio_codec, endpoint='serve_audio'):
+    """JSON fields pointing the client at a reply's audio, which is rendered in the background"""
+    audio_url = url_for(endpoint, audio_id=audio_id, codec=audio_codec) if audio_id else None
+    return audio_reference(audio_id, audio_codec, audio_url)
+
+def get_posted_message():
+    """Read the user's message from either a JSON or a form-encoded request body"""
+    if request.is_json:
+        return (request.json or {}).get('message', '')
+    return request.form.get('message', '')
+
+def session_page(db_session, user_id, tab, cursor=None):
+    """One page of a sessions tab: upcoming runs soonest first, past and all newest first"""
+    now = datetime.now()
+    query = db_session.query(TherapySession).filter(TherapySession.user_id == user_id)
+    descending = True
+    if tab == 'upcoming':
+        query = query.filter(TherapySession.scheduled_start > now, TherapySession.status != 'CANCELLED')
+        descending = False
+    elif tab == 'past':
+        query = query.filter(or_(TherapySession.scheduled_start <= now, TherapySession.status == 'COMPLETED'))
+    return keyset_page(query, (TherapySession.scheduled_start, TherapySession.id), cursor, SESSION_PAGE_SIZE, descending)
+
+def message_page(db_session, session_id, cursor=None):
+    """The latest page of a session's messages, or the page before the cursor, oldest first"""
+    messages, older_cursor = keyset_page(
+        db_session.query(TherapyMessage).filter(TherapyMessage.session_id == session_id),
+        (TherapyMessage.timestamp, TherapyMessage.id),
+        cursor,
+        MESSAGE_PAGE_SIZE,
+        descending=True
+    )
+    return messages[::-1], older_cursor
+
 # Web Routes
 @app.route('/')
 def index():
@@ -281,6 +531,7 @@ def register():
 
 @app.route('/logout')
 def logout():
+    identity_cache.pop(session_cookie_key())
     session.pop('user_id', None)
     flash('You have been logged out', 'info')
     return redirect(url_for('index'))
@@ -316,16 +567,27 @@ def sessions():
     db_session = get_db()
     try:
         user = get_current_user()
-        # Get user's therapy sessions
-        sessions = db_session.query(TherapySession).filter_by(user_id=user.id).order_by(TherapySession.scheduled_start).all()
-        
-        # Add the current datetime to the template context
-        now = datetime.now()
+        # First page of each tab; the rest load as the user scrolls
+        pages = {tab: session_page(db_session, user.id, tab) for tab in SESSION_TABS}
         
-        return render_template('sessions.html', user=user, sessions=sessions, now=now)
+        return render_template('sessions.html', user=user, pages=pages)
     finally:
         db_session.close()
 
+@app.route('/sessions/more')
+@login_required
+def more_sessions():
+    """Rows for the next page of a sessions tab"""
+    tab = request.args.get('tab')
+    if tab not in SESSION_TABS:
+        abort(400)
+    try:
+        sessions, next_cursor = session_page(get_db(), get_current_identity().id, tab, request.args.get('cursor'))
+    except ValueError:
+        abort(400)
+    session_rows = get_template_attribute('macros/sessions.html', 'session_rows')
+    return jsonify({'html': session_rows(sessions, tab), 'next_cursor': next_cursor})
+
 @app.route('/sessions/new', methods=['GET', 'POST'])
 @login_required
 def new_session():
@@ -386,13 +648,14 @@ def view_session(session_id):
         if session is None:
             abort(404)  # Return 404 if session not found
         
-        # Get session messages
-        messages = db_session.query(TherapyMessage).filter_by(session_id=session_id).order_by(TherapyMessage.timestamp).all()
+        # Latest messages; older pages load on request
+        messages, older_cursor = message_page(db_session, session_id)
         
         # Get current datetime for template
         now = datetime.now()
         
-        return render_template('view_session.html', user=user, session=session, messages=messages, now=now)
+        return render_template('view_session.html', user=user, session=session, messages=messages,
+                               older_cursor=older_cursor, now=now)
     finally:
         db_session.close()
 
@@ -425,11 +688,13 @@ def session_chat(session_id):
                 personalization_context = personalization_engine.generate_personalization_context(user.id)
                 
                 # Generate AI response using LLM service
-                ai_text_response, ai_audio_data = get_llm_response(
+                audio_codec = negotiate_codec(request.headers.get('Accept'))
+                ai_text_response, audio_id = get_llm_response(
                     message_content, 
                     str(session_id), 
                     str(user.id), 
-                    personalization_context
+                    personalization_context,
+                    audio_codec
                 )
                 
                 # Save AI response (using text part)
@@ -441,6 +706,8 @@ def session_chat(session_id):
                         timestamp=datetime.now()
                     )
                     db_session.add(ai_message)
+                    # Assigns the message ids the profile's session history refers to
+                    db_session.flush()
                 
                     # Log the topics discussed in this interaction
                     session_data = {
@@ -448,7 +715,8 @@ def session_chat(session_id):
                         'message_pair': {
                             'user': message_content,
                             'ai': ai_text_response
-                        }
+                        },
+                        'message_ids': {'user': user_message.id, 'ai': ai_message.id}
                     }
                     
                     # Update the personalization engine with this interaction
@@ -456,16 +724,10 @@ def session_chat(session_id):
                     
                     db_session.commit()
                 
-                    # --- Updated to include audio data (base64 encoded) --- 
-                    audio_base64 = None
-                    if ai_audio_data:
-                        audio_base64 = b64encode(ai_audio_data).decode('utf-8')
-
                     return jsonify({
                         'success': True,
                         'response': ai_text_response,
-                        'audio': audio_base64,
-                        'audio_format': 'wav',
+                        **reply_audio(audio_id, audio_codec),
                         'session_id': session_id
                     })
                     # ------------------------------------------------------
@@ -479,16 +741,66 @@ def session_chat(session_id):
                         'session_id': session_id
                     }), 500
             
-            # Get session messages
-            messages = db_session.query(TherapyMessage).filter_by(session_id=session_id).order_by(TherapyMessage.timestamp).all()
+            # Latest messages; older pages load as the user scrolls up
+            messages, older_cursor = message_page(db_session, session_id)
             
             # Get current datetime for template
             now = datetime.now()
             
-            return render_template('session_chat.html', user=user, session=session, messages=messages, now=now)
+            return render_template('session_chat.html', user=user, session=session, messages=messages,
+                                   older_cursor=older_cursor, now=now)
     finally:
         db_session.close()
 
+@app.route('/sessions/<int:session_id>/chat/stream', methods=['POST'])
+@login_required
+def session_chat_stream(session_id):
+    """Stream the AI reply to a chat message as Server-Sent Events"""
+    db_session = get_db()
+    user = get_current_user()
+    
+    # Get the therapy session
+    therapy_session = db_session.query(TherapySession).filter_by(id=session_id, user_id=user.id).first()
+    if therapy_session is None:
+        abort(404)  # Return 404 if session not found
+    
+    message_content = get_posted_message()
+    if not message_content:
+        return jsonify({
+            'success': False,
+            'message': 'No message provided'
+        }), 400
+    
+    # Save user message before streaming so it survives a dropped connection
+    user_message = TherapyMessage(
+        session_id=session_id,
+        content=message_content,
+        is_from_ai=False,
+        timestamp=datetime.now()
+    )
+    db_session.add(user_message)
+    db_session.commit()
+    
+    audio_codec = negotiate_codec(request.headers.get('Accept'))
+    return sse_response(stream_ai_reply(
+        session_id, user.id, message_content, user_message.id, audio_codec=audio_codec
+    ))
+
+@app.route('/sessions/<int:session_id>/messages')
+@login_required
+def session_messages(session_id):
+    """The page of messages before a cursor, rendered for the chat or history view"""
+    db_session = get_db()
+    if db_session.query(TherapySession.id).filter_by(id=session_id, user_id=get_current_identity().id).first() is None:
+        abort(404)  # Return 404 if session not found
+    try:
+        messages, older_cursor = message_page(db_session, session_id, request.args.get('cursor'))
+    except ValueError:
+        abort(400)
+    macro = 'chat_messages' if request.args.get('view') == 'chat' else 'history_messages'
+    render_messages = get_template_attribute('macros/messages.html', macro)
+    return jsonify({'html': render_messages(messages), 'next_cursor': older_cursor})
+
 @app.route('/profile')
 @login_required
 def profile():
@@ -530,11 +842,7 @@ def therapist_preferences():
             user.preferences = {}
         
         if 'therapist' not in user.preferences:
-            user.preferences['therapist'] = {
-                'gender': 'female',  # Default to female
-                'ethnicity': 'caucasian',  # Default
-                'avatar_id': '1'  # Default avatar ID
-            }
+            user.preferences['therapist'] = avatar_registry.default_preferences()
         
         if request.method == 'POST':
             # Update preferences based on form data
@@ -555,67 +863,11 @@ def therapist_preferences():
                 flash('Therapist preferences updated successfully!', 'success')
                 return redirect(url_for('profile'))
         
-        # Get available avatars
-        available_avatars = {
-            'male': {
-                'caucasian': [
-                    {'id': '1', 'name': 'Michael', 'image': 'male/male_caucasian_1.jpg'},
-                    {'id': '2', 'name': 'James', 'image': 'male/male_caucasian_2.jpg'},
-                ],
-                'african_american': [
-                    {'id': '3', 'name': 'David', 'image': 'male/male_african_american_1.jpg'},
-                    {'id': '4', 'name': 'William', 'image': 'male/male_african_american_2.jpg'},
-                ],
-                'asian': [
-                    {'id': '5', 'name': 'Robert', 'image': 'male/male_asian_1.jpg'},
-                    {'id': '6', 'name': 'John', 'image': 'male/male_asian_2.jpg'},
-                ],
-                'hispanic': [
-                    {'id': '7', 'name': 'Carlos', 'image': 'male/male_hispanic_1.jpg'},
-                    {'id': '8', 'name': 'Miguel', 'image': 'male/male_hispanic_2.jpg'},
-                ],
-                'middle_eastern': [
-                    {'id': '9', 'name': 'Ahmed', 'image': 'male/male_middle_eastern_1.jpg'},
-                    {'id': '10', 'name': 'Ali', 'image': 'male/male_middle_eastern_2.jpg'},
-                ],
-                'south_asian': [
-                    {'id': '11', 'name': 'Raj', 'image': 'male/male_south_asian_1.jpg'},
-                    {'id': '12', 'name': 'Vikram', 'image': 'male/male_south_asian_2.jpg'},
-                ]
-            },
-            'female': {
-                'caucasian': [
-                    {'id': '13', 'name': 'Emily', 'image': 'female/female_caucasian_1.jpg'},
-                    {'id': '14', 'name': 'Sarah', 'image': 'female/female_caucasian_2.jpg'},
-                ],
-                'african_american': [
-                    {'id': '15', 'name': 'Zoe', 'image': 'female/female_african_american_1.jpg'},
-                    {'id': '16', 'name': 'Maya', 'image': 'female/female_african_american_2.jpg'},
-                ],
-                'asian': [
-                    {'id': '17', 'name': 'Lucy', 'image': 'female/female_asian_1.jpg'},
-                    {'id': '18', 'name': 'Michelle', 'image': 'female/female_asian_2.jpg'},
-                ],
-                'hispanic': [
-                    {'id': '19', 'name': 'Sofia', 'image': 'female/female_hispanic_1.jpg'},
-                    {'id': '20', 'name': 'Isabella', 'image': 'female/female_hispanic_2.jpg'},
-                ],
-                'middle_eastern': [
-                    {'id': '21', 'name': 'Yasmin', 'image': 'female/female_middle_eastern_1.jpg'},
-                    {'id': '22', 'name': 'Fatima', 'image': 'female/female_middle_eastern_2.jpg'},
-                ],
-                'south_asian': [
-                    {'id': '23', 'name': 'Priya', 'image': 'female/female_south_asian_1.jpg'},
-                    {'id': '24', 'name': 'Deepa', 'image': 'female/female_south_asian_2.jpg'},
-                ]
-            }
-        }
-        
         return render_template(
             'therapist_preferences.html', 
             user=user, 
             therapist_prefs=user.preferences.get('therapist', {}),
-            available_avatars=available_avatars
+            available_avatars=avatar_registry.catalog
         )
     finally:
         db_session.close()
@@ -644,9 +896,6 @@ def video_session(session_id):
             return redirect(url_for('view_session', session_id=session_id))
         
         try:
-            # Get session messages
-            messages = db_session.query(TherapyMessage).filter_by(session_id=session_id).order_by(TherapyMessage.timestamp).all()
-            
             # Get current datetime for template
             now = datetime.now()
             
@@ -656,98 +905,19 @@ def video_session(session_id):
             
             if not therapist_prefs:
                 # Default preferences if not set
-                therapist_prefs = {
-                    'gender': 'female',
-                    'ethnicity': 'caucasian',
-                    'avatar_id': '13'  # Default to first female avatar
-                }
-            
-            # Find the selected avatar
-            selected_avatar = None
-            selected_gender = therapist_prefs.get('gender', 'female')
-            selected_ethnicity = therapist_prefs.get('ethnicity', 'caucasian')
-            selected_id = therapist_prefs.get('avatar_id', '13')
-            
-            app.logger.debug(f"Selected avatar details - Gender: {selected_gender}, Ethnicity: {selected_ethnicity}, ID: {selected_id}")
+                therapist_prefs = avatar_registry.default_preferences()
             
-            # Get available avatars (reuse the same dictionary from earlier)
-            available_avatars = {
-                'male': {
-                    'caucasian': [
-                        {'id': '1', 'name': 'Michael', 'image': 'male/male_caucasian_1.jpg'},
-                        {'id': '2', 'name': 'James', 'image': 'male/male_caucasian_2.jpg'},
-                    ],
-                    'african_american': [
-                        {'id': '3', 'name': 'David', 'image': 'male/male_african_american_1.jpg'},
-                        {'id': '4', 'name': 'William', 'image': 'male/male_african_american_2.jpg'},
-                    ],
-                    'asian': [
-                        {'id': '5', 'name': 'Robert', 'image': 'male/male_asian_1.jpg'},
-                        {'id': '6', 'name': 'John', 'image': 'male/male_asian_2.jpg'},
-                    ],
-                    'hispanic': [
-                        {'id': '7', 'name': 'Carlos', 'image': 'male/male_hispanic_1.jpg'},
-                        {'id': '8', 'name': 'Miguel', 'image': 'male/male_hispanic_2.jpg'},
-                    ],
-                    'middle_eastern': [
-                        {'id': '9', 'name': 'Ahmed', 'image': 'male/male_middle_eastern_1.jpg'},
-                        {'id': '10', 'name': 'Ali', 'image': 'male/male_middle_eastern_2.jpg'},
-                    ],
-                    'south_asian': [
-                        {'id': '11', 'name': 'Raj', 'image': 'male/male_south_asian_1.jpg'},
-                        {'id': '12', 'name': 'Vikram', 'image': 'male/male_south_asian_2.jpg'},
-                    ]
-                },
-                'female': {
-                    'caucasian': [
-                        {'id': '13', 'name': 'Emily', 'image': 'female/female_caucasian_1.jpg'},
-                        {'id': '14', 'name': 'Sarah', 'image': 'female/female_caucasian_2.jpg'},
-                    ],
-                    'african_american': [
-                        {'id': '15', 'name': 'Zoe', 'image': 'female/female_african_american_1.jpg'},
-                        {'id': '16', 'name': 'Maya', 'image': 'female/female_african_american_2.jpg'},
-                    ],
-                    'asian': [
-                        {'id': '17', 'name': 'Lucy', 'image': 'female/female_asian_1.jpg'},
-                        {'id': '18', 'name': 'Michelle', 'image': 'female/female_asian_2.jpg'},
-                    ],
-                    'hispanic': [
-                        {'id': '19', 'name': 'Sofia', 'image': 'female/female_hispanic_1.jpg'},
-                        {'id': '20', 'name': 'Isabella', 'image': 'female/female_hispanic_2.jpg'},
-                    ],
-                    'middle_eastern': [
-                        {'id': '21', 'name': 'Yasmin', 'image': 'female/female_middle_eastern_1.jpg'},
-                        {'id': '22', 'name': 'Fatima', 'image': 'female/female_middle_eastern_2.jpg'},
-                    ],
-                    'south_asian': [
-                        {'id': '23', 'name': 'Priya', 'image': 'female/female_south_asian_1.jpg'},
-                        {'id': '24', 'name': 'Deepa', 'image': 'female/female_south_asian_2.jpg'},
-                    ]
-                }
-            }
-            
-            if selected_gender in available_avatars and selected_ethnicity in available_avatars[selected_gender]:
-                avatars_list = available_avatars[selected_gender][selected_ethnicity]
-                for avatar in avatars_list:
-                    if avatar['id'] == selected_id:
-                        selected_avatar = avatar
-                        break
-                
-                # If not found, use the first avatar of selected gender and ethnicity
-                if not selected_avatar and avatars_list:
-                    selected_avatar = avatars_list[0]
-            
-            # Fallback to default if still not found
-            if not selected_avatar:
-                app.logger.warning(f"Could not find selected avatar, using default")
-                selected_avatar = available_avatars['female']['caucasian'][0]
+            selected_avatar = avatar_registry.select(
+                therapist_prefs.get('gender'),
+                therapist_prefs.get('ethnicity'),
+                therapist_prefs.get('avatar_id')
+            )
             
             app.logger.debug(f"Selected avatar: {selected_avatar}")
             
             return render_template('video_session.html', 
                                 user=user,
                                 session=therapy_session,
-                                messages=messages,
                                 now=now,
                                 therapist_prefs=therapist_prefs,
                                 selected_avatar=selected_avatar)
@@ -826,11 +996,13 @@ def video_call_api(session_id):
             
             # Generate AI response using LLM service
             # --- Updated to handle (text, audio) tuple --- 
-            ai_text_response, ai_audio_data = get_llm_response(
+            audio_codec = negotiate_codec(request.headers.get('Accept'))
+            ai_text_response, audio_id = get_llm_response(
                 user_message, 
                 str(session_id), # Ensure session_id is string
                 str(user.id), 
-                personalization_context
+                personalization_context,
+                audio_codec
             )
             # --------------------------------------------
             
@@ -843,6 +1015,8 @@ def video_call_api(session_id):
                     timestamp=datetime.now()
                 )
                 db_session.add(ai_message)
+                # Assigns the message id the profile's session history refers to
+                db_session.flush()
             
                 # Log the topics discussed in this interaction
                 session_data = {
@@ -850,7 +1024,8 @@ def video_call_api(session_id):
                     'message_pair': {
                         'user': user_message,
                         'ai': ai_text_response # Use text response here too
-                    }
+                    },
+                    'message_ids': {'user': new_message.id, 'ai': ai_message.id}
                 }
                 
                 # Update the personalization engine with this interaction
@@ -860,15 +1035,10 @@ def video_call_api(session_id):
                 db_session.commit()
             
                 # --- Prepare JSON response including audio --- 
-                audio_base64 = None
-                if ai_audio_data:
-                    audio_base64 = b64encode(ai_audio_data).decode('utf-8')
-
                 return jsonify({
                     'success': True,
                     'response': ai_text_response,
-                    'audio': audio_base64,
-                    'audio_format': 'wav',
+                    **reply_audio(audio_id, audio_codec),
                     'session_id': session_id
                 })
                 # ---------------------------------------------
@@ -899,13 +1069,84 @@ def video_call_api(session_id):
     finally:
         db_session.close()
 
+@app.route('/sessions/<session_id>/videocall/stream', methods=['POST'])
+@login_required
+def video_call_stream(session_id):
+    """Stream the AI reply to a video call message as Server-Sent Events"""
+    db_session = get_db()
+    user = get_current_user()
+    
+    therapy_session = db_session.query(TherapySession).filter_by(id=session_id, user_id=user.id).first()
+    if therapy_session is None:
+        abort(404)  # Return 404 if session not found
+    
+    user_message = get_posted_message()
+    if not user_message:
+        return jsonify({
+            'success': False,
+            'message': 'No message provided'
+        }), 400
+    
+    # Save user message first so it appears even if AI fails
+    new_message = TherapyMessage(
+        session_id=session_id,
+        content=user_message,
+        is_from_ai=False,
+        timestamp=datetime.now()
+    )
+    db_session.add(new_message)
+    db_session.commit()
+    
+    # Voice the reply sentence by sentence so the avatar starts speaking early
+    audio_codec = negotiate_codec(request.headers.get('Accept'))
+    return sse_response(stream_ai_reply(
+        session_id, user.id, user_message, new_message.id, speak=True, audio_codec=audio_codec
+    ))
+
+@app.route('/audio/<string(length=64):audio_id>.<codec>')
+@login_required
+def serve_audio(audio_id, codec):
+    """Serve reply audio to the logged-in user it was rendered for"""
+    return send_reply_audio(audio_id, codec, owner=str(session['user_id']))
+
+@app.route('/api/v1/audio/<string(length=64):audio_id>.<codec>')
+@api_auth_required
+def api_serve_audio(audio_id, codec):
+    """Serve reply audio to the API client it was rendered for"""
+    return send_reply_audio(audio_id, codec, owner=api_principal())
+
+def send_reply_audio(audio_id, codec, owner):
+    """
+    Send reply audio by id, waiting briefly if it is still being rendered.
+    Ids are keyed hashes of the content and its owner, so responses never change and support
+    Range requests and revalidation; ids issued to anyone else are not found.
+    """
+    if codec not in AUDIO_CODECS:
+        abort(404)
+    audio = tts_service.fetch(audio_id, owner=owner, timeout=AUDIO_FETCH_TIMEOUT)
+    if audio is None:
+        abort(404)
+    
+    response = send_file(
+        io.BytesIO(audio),
+        mimetype=AUDIO_CODECS[codec]['mime'],
+        conditional=True,
+        etag=audio_id,
+        max_age=AUDIO_MAX_AGE
+    )
+    # Replies are personal, so only the client may cache them
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
 @app.route('/sessions/<session_id>/transcript', methods=['POST'])
 @login_required
 def save_transcript(session_id):
     """Save transcript from a therapy session"""
     db_session = get_db()
     try:
-        therapy_session = db_session.query(TherapySession).filter_by(id=session_id, user_id=get_current_user().id).first_or_404()
+        therapy_session = db_session.query(TherapySession).filter_by(id=session_id, user_id=get_current_identity().id).first_or_404()
         
         data = request.json
         transcript = data.get('transcript', [])
@@ -930,7 +1171,7 @@ def save_transcript(session_id):
 def ai_preferences():
     """Page for managing AI learning preferences"""
     # Get user profile from personalization engine
-    user_profile = personalization_engine.get_user_profile(get_current_user().id)
+    user_profile = personalization_engine.get_user_profile(get_current_identity().id)
     
     return render_template('ai_preferences.html', user_profile=user_profile)
 
@@ -948,22 +1189,13 @@ def update_ai_preferences():
         'therapist_oversight': 'share_therapist_oversight' in request.form
     }
     
-    # Get user profile
-    user_profile = personalization_engine.get_user_profile(get_current_user().id)
-    
-    # Update permissions
-    user_profile.update_data_permissions({
+    # Update and save permissions against the current stored profile
+    personalization_engine.update_data_permissions(get_current_identity().id, {
         'data_collection_consent': data_collection_consent,
         'data_retention_preference': data_retention_preference,
         'data_sharing_permissions': sharing_permissions
     })
     
-    # Save changes
-    user_profile.save()
-    
-    # Update consent in personalization engine
-    personalization_engine.handle_consent_update(get_current_user().id, data_collection_consent)
-    
     flash('AI learning preferences updated successfully.', 'success')
     return redirect(url_for('ai_preferences'))
 
@@ -972,7 +1204,7 @@ def update_ai_preferences():
 def update_ai_personalization():
     """Update AI personalization settings"""
     # Get user profile
-    user_profile = personalization_engine.get_user_profile(get_current_user().id)
+    user_profile = personalization_engine.get_user_profile(get_current_identity().id)
     
     # Only proceed if user has consented to data collection
     if not user_profile.data_collection_consent:
@@ -1000,12 +1232,12 @@ def update_ai_personalization():
             except ValueError:
                 pass
     
-    user_profile.therapy_approaches = therapy_approaches
+    user_profile.update_therapy_approaches(therapy_approaches)
     
     # Update topics of interest
     interests = request.form.get('interests', '')
     if interests:
-        user_profile.topic_interests = {}
+        user_profile.clear_topic_interests()
         for topic in [t.strip() for t in interests.split(',')]:
             if topic:
                 user_profile.update_topic_interest(topic, 0.8)
@@ -1013,13 +1245,17 @@ def update_ai_personalization():
     # Update trigger topics
     triggers = request.form.get('triggers', '')
     if triggers:
-        user_profile.trigger_topics = []
+        user_profile.clear_trigger_topics()
         for topic in [t.strip() for t in triggers.split(',')]:
             if topic:
                 user_profile.add_trigger_topic(topic, 8)
     
-    # Save changes
-    user_profile.save()
+    # Save changes, unless another request changed the profile meanwhile
+    try:
+        user_profile.save()
+    except ProfileConflict:
+        flash('Your AI settings were changed elsewhere. Please review them and try again.', 'warning')
+        return redirect(url_for('ai_preferences'))
     
     flash('Personalization settings updated successfully.', 'success')
     return redirect(url_for('ai_preferences'))
@@ -1028,20 +1264,8 @@ def update_ai_personalization():
 @login_required
 def delete_ai_data():
     """Delete all AI learning data for the current user"""
-    # Handle session end which will delete data if consent is not given
-    personalization_engine.handle_session_end(get_current_user().id)
-    
-    # Additionally, force delete any profile data
-    secure_id = personalization_engine.get_user_profile(get_current_user().id).secure_id
-    
-    # Remove from memory
-    if get_current_user().id in personalization_engine.profiles:
-        del personalization_engine.profiles[get_current_user().id]
-    
-    # Delete file if it exists
-    file_path = f"user_profiles/{secure_id}.json"
-    if os.path.exists(file_path):
-        os.remove(file_path)
+    # Remove the profile from memory, the profile store and any legacy file
+    personalization_engine.delete_profile(get_current_identity().id)
     
     flash('All AI learning data has been deleted successfully.', 'success')
     return redirect(url_for('ai_preferences'))
@@ -1059,11 +1283,7 @@ def welcome_setup():
             user.preferences = {}
         
         if 'therapist' not in user.preferences:
-            user.preferences['therapist'] = {
-                'gender': 'female',  # Default to female
-                'ethnicity': 'caucasian',  # Default
-                'avatar_id': '13'  # Default avatar ID
-            }
+            user.preferences['therapist'] = avatar_registry.default_preferences()
         
         # Get therapist preferences
         therapist_prefs = user.preferences.get('therapist', {})
@@ -1087,67 +1307,11 @@ def welcome_setup():
                 flash('Therapist preferences saved successfully!', 'success')
                 return redirect(url_for('dashboard'))
         
-        # Get available avatars
-        available_avatars = {
-            'male': {
-                'caucasian': [
-                    {'id': '1', 'name': 'Michael', 'image': 'male/male_caucasian_1.jpg'},
-                    {'id': '2', 'name': 'James', 'image': 'male/male_caucasian_2.jpg'},
-                ],
-                'african_american': [
-                    {'id': '3', 'name': 'David', 'image': 'male/male_african_american_1.jpg'},
-                    {'id': '4', 'name': 'William', 'image': 'male/male_african_american_2.jpg'},
-                ],
-                'asian': [
-                    {'id': '5', 'name': 'Robert', 'image': 'male/male_asian_1.jpg'},
-                    {'id': '6', 'name': 'John', 'image': 'male/male_asian_2.jpg'},
-                ],
-                'hispanic': [
-                    {'id': '7', 'name': 'Carlos', 'image': 'male/male_hispanic_1.jpg'},
-                    {'id': '8', 'name': 'Miguel', 'image': 'male/male_hispanic_2.jpg'},
-                ],
-                'middle_eastern': [
-                    {'id': '9', 'name': 'Ahmed', 'image': 'male/male_middle_eastern_1.jpg'},
-                    {'id': '10', 'name': 'Ali', 'image': 'male/male_middle_eastern_2.jpg'},
-                ],
-                'south_asian': [
-                    {'id': '11', 'name': 'Raj', 'image': 'male/male_south_asian_1.jpg'},
-                    {'id': '12', 'name': 'Vikram', 'image': 'male/male_south_asian_2.jpg'},
-                ]
-            },
-            'female': {
-                'caucasian': [
-                    {'id': '13', 'name': 'Emily', 'image': 'female/female_caucasian_1.jpg'},
-                    {'id': '14', 'name': 'Sarah', 'image': 'female/female_caucasian_2.jpg'},
-                ],
-                'african_american': [
-                    {'id': '15', 'name': 'Zoe', 'image': 'female/female_african_american_1.jpg'},
-                    {'id': '16', 'name': 'Maya', 'image': 'female/female_african_american_2.jpg'},
-                ],
-                'asian': [
-                    {'id': '17', 'name': 'Lucy', 'image': 'female/female_asian_1.jpg'},
-                    {'id': '18', 'name': 'Michelle', 'image': 'female/female_asian_2.jpg'},
-                ],
-                'hispanic': [
-                    {'id': '19', 'name': 'Sofia', 'image': 'female/female_hispanic_1.jpg'},
-                    {'id': '20', 'name': 'Isabella', 'image': 'female/female_hispanic_2.jpg'},
-                ],
-                'middle_eastern': [
-                    {'id': '21', 'name': 'Yasmin', 'image': 'female/female_middle_eastern_1.jpg'},
-                    {'id': '22', 'name': 'Fatima', 'image': 'female/female_middle_eastern_2.jpg'},
-                ],
-                'south_asian': [
-                    {'id': '23', 'name': 'Priya', 'image': 'female/female_south_asian_1.jpg'},
-                    {'id': '24', 'name': 'Deepa', 'image': 'female/female_south_asian_2.jpg'},
-                ]
-            }
-        }
-        
         return render_template(
             'welcome_setup.html', 
             user=user, 
             therapist_prefs=therapist_prefs,
-            available_avatars=available_avatars
+            available_avatars=avatar_registry.catalog
         )
     finally:
         db_session.close()
@@ -1177,6 +1341,9 @@ def health_check():
         "version": "1.0.0",
         "database": db_status,
         "redis": redis_status,
+        "tts_cache": tts_service.cache.stats(),
+        "profile_cache": personalization_engine.profiles.stats(),
+        "message_classification": message_classification.stats(),
         "timestamp": datetime.now().isoformat()
     })
 
@@ -1307,11 +1474,14 @@ def api_voice_chat():
     
     # Generate AI response using LLM service
     # --- Updated to handle (text, audio) tuple --- 
-    ai_text_response, ai_audio_data = get_llm_response(
+    audio_codec = negotiate_codec(request.headers.get('Accept'))
+    ai_text_response, audio_id = get_llm_response(
         user_message, 
         session_id or 'api-session', # Use provided session_id or a default
         user_id, 
-        personalization_context
+        personalization_context,
+        audio_codec,
+        audio_owner=api_principal()
     )
     # --------------------------------------------
     
@@ -1321,16 +1491,10 @@ def api_voice_chat():
     
     # --- Prepare JSON response including audio --- 
     if ai_text_response:
-        audio_base64 = None
-        if ai_audio_data:
-            # Ensure base64 is imported (should be at top of file)
-            audio_base64 = b64encode(ai_audio_data).decode('utf-8')
-
         return jsonify({
             'success': True,
             'response': ai_text_response,
-            'audio': audio_base64,
-            'audio_format': 'wav' # Assuming WAV format from llm_service
+            **reply_audio(audio_id, audio_codec, endpoint='api_serve_audio')
         })
     else:
         # Handle case where LLM failed to generate text
@@ -1352,11 +1516,15 @@ def server_error(e):
     return render_template('500.html'), 500
 
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    database_schema.get()
+
+def warm_up_app():
+    """Create tables, connect to Redis and the LLM API, load the tokenizer, and fill the TTS cache in the background"""
+    return warm_up(database_schema.get, redis_connection.get, profile_events.start, topic_extractor.start, message_classification.start, llm_client.start, conversation_history.counter.start, warm_tts_cache)
 
 if __name__ == "__main__":
-    # Create database tables if they don't exist
-    init_db()
+    # Get connections and caches ready while the server starts
+    warm_up_app()
     
     # Create .env file for OpenAI API key if it doesn't exist
     env_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")